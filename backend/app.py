@@ -1,11 +1,14 @@
 import os
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import json
+import math
+import asyncio
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
-import json
 from pathlib import Path
-from backend.core.file_ipc import FileIPC
+from backend.core.ipc import open_ipc
+from backend.core.progress_hub import ProgressHub
 
 app = FastAPI()
 
@@ -21,7 +24,8 @@ app.add_middleware(
 # Initialize IPC
 BASE_DIR = Path(__file__).resolve().parent.parent
 STORAGE_DIR = BASE_DIR / "storage"
-ipc = FileIPC(str(STORAGE_DIR))
+ipc = open_ipc(str(STORAGE_DIR))
+hub = ProgressHub(ipc)
 
 # Mount Storage
 app.mount("/storage", StaticFiles(directory=str(STORAGE_DIR)), name="storage")
@@ -36,65 +40,188 @@ async def list_csvs():
         return []
     return [f.name for f in csv_dir.glob("*.csv")]
 
+def _queue_task(task_type: str, payload: dict) -> str:
+    """Creates a task. Optional priority, estimated_cost (seconds of audio) and owner fields drive scheduling."""
+    priority = payload.get("priority")
+    if priority is None:
+        priority = 0
+    else:
+        try:
+            # 2.7 is rejected rather than truncated; 3.0 is accepted as 3
+            if isinstance(priority, bool) or (isinstance(priority, float) and not priority.is_integer()):
+                raise ValueError(priority)
+            priority = int(priority)
+        except (TypeError, ValueError, OverflowError):
+            raise HTTPException(status_code=400, detail=f"priority must be an integer, got {payload.get('priority')!r}")
+    estimated_cost = payload.get("estimated_cost")
+    if estimated_cost is not None:
+        try:
+            estimated_cost = float(estimated_cost)
+        except (TypeError, ValueError):
+            estimated_cost = None
+        if estimated_cost is None or not math.isfinite(estimated_cost) or estimated_cost < 0:
+            raise HTTPException(
+                status_code=400,
+                detail=f"estimated_cost must be a non-negative number, got {payload.get('estimated_cost')!r}"
+            )
+    return ipc.create_task(
+        task_type,
+        payload,
+        priority=priority,
+        estimated_cost=estimated_cost,
+        owner=payload.get("owner") or payload.get("voice_name")
+    )
+
+@app.get("/tasks")
+async def list_tasks(status: str = None, offset: int = 0, limit: int = 50):
+    """List tasks newest first, optionally filtered by status (pending, processing, completed)"""
+    limit = max(1, min(limit, 500))
+    return ipc.list_tasks(status=status, offset=max(0, offset), limit=limit)
+
+@app.get("/tasks/{task_id}/queue")
+async def get_queue_position(task_id: str):
+    """Queue position and estimated start time of a pending task"""
+    status = ipc.queue_status(task_id)
+    if status is None:
+        return {"task_id": task_id, "status": ipc.get_task_status(task_id)}
+    return {"status": "pending", **status}
+
 @app.post("/tasks/scrape")
 async def start_scrape(payload: dict):
     """Start a scraping task"""
     # payload: { "channel_url": str, "voice_name": str }
-    task_id = ipc.create_task("scrape_youtube", payload)
+    task_id = _queue_task("scrape_youtube", payload)
     return {"task_id": task_id}
 
 @app.post("/tasks/split")
 async def start_split(payload: dict):
     """Start a splitting task"""
     # payload: { "csv_filename": str }
-    task_id = ipc.create_task("split_audio", payload)
+    task_id = _queue_task("split_audio", payload)
+    return {"task_id": task_id}
+
+@app.post("/tasks/split/sweep")
+async def start_split_sweep(payload: dict):
+    """Start a sweep of splitter settings over the VAD output of a dataset (no audio is written)"""
+    # payload: { "csv_filename" | "audio_folder": str, "param_grid": { "min_audio_len": [...], "max_audio_len": [...], "merge_gap_ms": [...] } }
+    task_id = _queue_task("split_sweep", payload)
+    return {"task_id": task_id}
+
+@app.post("/tasks/materialize")
+async def start_materialize(payload: dict):
+    """Start writing the virtual chunks of a split as WAV files (for packaging the dataset)"""
+    # payload: { "audio_folder": str, "output_folder": str }
+    task_id = _queue_task("materialize_chunks", payload)
+    return {"task_id": task_id}
+
+@app.post("/tasks/package")
+async def start_package(payload: dict):
+    """Start packing split (and transcribed) chunks into tar or Parquet shards"""
+    # payload: { "name": str, "format": "tar" | "parquet", "shard_size_mb": float, "split_csv_name": str, "transcript_csv_name": str }
+    task_id = _queue_task("package_dataset", payload)
     return {"task_id": task_id}
 
 @app.post("/tasks/transcribe")
 async def start_transcribe(payload: dict):
     """Start a transcription task"""
     # payload: { "output_csv_name": str }
-    task_id = ipc.create_task("transcribe_audio", payload)
+    task_id = _queue_task("transcribe_audio", payload)
+    return {"task_id": task_id}
+
+@app.post("/tasks/pipeline")
+async def start_pipeline(payload: dict):
+    """Start a streaming scrape -> split -> transcribe task"""
+    # payload: { "playlist_url": str, "voice_name": str, "method": "local" | "elevenlabs" }
+    task_id = _queue_task("pipeline", payload)
     return {"task_id": task_id}
 
+async def _send_updates(websocket: WebSocket, queue: asyncio.Queue, close_when_done: bool = False):
+    """Forwards hub messages to the client. Optionally returns once the task has finished."""
+    while True:
+        message = await queue.get()
+        await websocket.send_json(message)
+        if close_when_done and message["status"] == "completed":
+            return
+
+async def _until_disconnect(websocket: WebSocket):
+    """Reads and ignores client messages (keepalives and the like); returns once the client disconnects"""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
 @app.websocket("/ws/{task_id}")
 async def websocket_endpoint(websocket: WebSocket, task_id: str):
     await websocket.accept()
+    queue = asyncio.Queue()
+    hub.subscribe(task_id, queue)
+    sender = asyncio.create_task(_send_updates(websocket, queue, close_when_done=True))
+    # Nothing clients send on this socket is acted on; receiving only detects a disconnect early
+    receiver = asyncio.create_task(_until_disconnect(websocket))
+    try:
+        done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        if sender in done and sender.exception():
+            raise sender.exception()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        try:
+            await websocket.send_json({"status": "error", "message": str(e)})
+        except Exception:
+            pass
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        hub.unsubscribe(task_id, queue)
+
+def _task_id_list(request, key: str):
+    """The task ids of a /ws message field, or None if the message or field is malformed"""
+    if not isinstance(request, dict):
+        return None
+    task_ids = request.get(key, [])
+    if not isinstance(task_ids, list) or not all(isinstance(task_id, str) for task_id in task_ids):
+        return None
+    return task_ids
+
+@app.websocket("/ws")
+async def websocket_multi_endpoint(websocket: WebSocket):
+    """
+    One socket for many tasks. The client sends {"subscribe": [task_id, ...]} or
+    {"unsubscribe": [task_id, ...]}; every update carries its task_id.
+    """
+    await websocket.accept()
+    queue = asyncio.Queue()
+    task_ids = set()
+    sender = asyncio.create_task(_send_updates(websocket, queue))
     try:
         while True:
             try:
-                result_file = ipc.results_dir / f"{task_id}_result.json"
-                
-                if result_file.exists():
-                    with open(result_file, "r") as f:
-                        result = json.load(f)
-                    await websocket.send_json({"status": "completed", "result": result})
-                    break
-                else:
-                    # Check if job still exists
-                    job_file = ipc.jobs_dir / f"{task_id}.json"
-                    if not job_file.exists() and not result_file.exists():
-                         # Job gone but no result? Maybe picked up but not finished?
-                         # Or maybe failed and deleted?
-                         # For now, assume processing if not found in result
-                         pass
-
-                    # Check for progress
-                    progress = ipc.get_progress(task_id)
-                    print(f"Checking progress for {task_id} in {ipc.progress_dir}: {progress}")
-                    if progress:
-                        await websocket.send_json({"status": "processing", "detail": progress})
-                    else:
-                        await websocket.send_json({"status": "processing"})
-                
-                import asyncio
-                await asyncio.sleep(1)
-            except Exception as e:
-                await websocket.send_json({"status": "error", "message": str(e)})
-                break
-                
+                request = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                request = None
+            subscribe = _task_id_list(request, "subscribe")
+            unsubscribe = _task_id_list(request, "unsubscribe")
+            if subscribe is None or unsubscribe is None:
+                # Bad messages are rejected but keep the socket (and its subscriptions) open
+                await websocket.send_json({
+                    "status": "error",
+                    "message": 'Expected {"subscribe": [task_id, ...]} or {"unsubscribe": [task_id, ...]}'
+                })
+                continue
+            for task_id in subscribe:
+                if task_id not in task_ids:
+                    task_ids.add(task_id)
+                    hub.subscribe(task_id, queue)
+            for task_id in unsubscribe:
+                if task_id in task_ids:
+                    task_ids.discard(task_id)
+                    hub.unsubscribe(task_id, queue)
     except WebSocketDisconnect:
-        print(f"Client disconnected for task {task_id}")
+        pass
+    finally:
+        sender.cancel()
+        for task_id in task_ids:
+            hub.unsubscribe(task_id, queue)
 
 if __name__ == "__main__":
     # SSL Configuration
@@ -0,0 +1,64 @@
+import json
+import os
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class TaskArchive:
+    """
+    Append-only archive of finished tasks: one JSON-lines file per day, plus a
+    small SQLite index (task_id -> file, offset) so an archived task is found
+    with a single lookup and one seek, however many tasks have run.
+    """
+
+    def __init__(self, archive_dir: str):
+        self.archive_dir = Path(archive_dir)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.archive_dir / "index.db"
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS archive_index (task_id TEXT PRIMARY KEY, day TEXT NOT NULL, offset INTEGER NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (and per process, after a fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.index_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def append(self, records):
+        """Archives task records (dicts with task_id and finished_at) into their day files"""
+        by_day = {}
+        for record in records:
+            day = time.strftime("%Y-%m-%d", time.localtime(record.get("finished_at") or time.time()))
+            by_day.setdefault(day, []).append(record)
+
+        index_rows = []
+        for day, day_records in by_day.items():
+            with open(self.archive_dir / f"{day}.jsonl", "ab") as f:
+                for record in day_records:
+                    index_rows.append((record["task_id"], day, f.tell()))
+                    f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO archive_index (task_id, day, offset) VALUES (?, ?, ?)", index_rows)
+
+    def lookup(self, task_id: str):
+        """Returns the archived record of a task, or None"""
+        row = self._connect().execute("SELECT day, offset FROM archive_index WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        day, offset = row
+        try:
+            with open(self.archive_dir / f"{day}.jsonl", "rb") as f:
+                f.seek(offset)
+                return json.loads(f.readline().decode("utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
@@ -0,0 +1,44 @@
+import json
+import os
+from pathlib import Path
+
+
+class TaskCheckpoint:
+    """
+    Durable record of the input files a task has finished, with their outputs.
+    Stored as an append-only JSON-lines file: marking an item done is a single
+    fsync'd append, and a line torn by a crash is ignored on load.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._items = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._items[entry["key"]] = entry.get("data")
+
+    def done(self, key: str) -> bool:
+        return key in self._items
+
+    def get(self, key: str, default=None):
+        return self._items.get(key, default)
+
+    def mark_done(self, key: str, data=None):
+        self._items[key] = data
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"key": key, "data": data}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __len__(self):
+        return len(self._items)
+
+    def delete(self):
+        self._items = {}
+        self.path.unlink(missing_ok=True)
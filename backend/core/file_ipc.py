@@ -3,43 +3,422 @@ import os
 import time
 import uuid
 import asyncio
+import threading
 from pathlib import Path
 
+from backend.core.progress_writer import ProgressWriter
+from backend.core import scheduler
+from backend.core.checkpoint import TaskCheckpoint
+from backend.core.archive import TaskArchive
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+def _pid_alive(pid: int) -> bool:
+    """Best-effort check whether a process with the given PID is still running"""
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill(pid, 0) would send CTRL_C_EVENT on Windows, so ask the kernel instead
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        try:
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        finally:
+            kernel32.CloseHandle(handle)
+        return exit_code.value == STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class _JobEventHandler(FileSystemEventHandler):
+    """Wakes up waiting workers whenever a job file appears in jobs/"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def on_created(self, event):
+        if event.src_path.endswith(".json"):
+            self.event.set()
+
+    def on_moved(self, event):
+        # create_task writes a temp file and renames it into place
+        if event.dest_path.endswith(".json"):
+            self.event.set()
+
+
 class FileIPC:
-    def __init__(self, storage_dir: str):
+    def __init__(self, storage_dir: str, max_progress_writes_per_sec: float = 4.0, lease_seconds: float = 60.0):
         self.storage_dir = Path(storage_dir)
         self.jobs_dir = self.storage_dir / "jobs"
         self.results_dir = self.storage_dir / "results"
         self.progress_dir = self.storage_dir / "progress"
+        # Jobs are moved here (renamed to {task_id}.{pid}.json) by the worker that owns them.
+        # The file mtime is the owner's lease: it is renewed by heartbeats and expires after lease_seconds.
+        self.claimed_dir = self.storage_dir / "claimed"
+        self.checkpoints_dir = self.storage_dir / "checkpoints"
+        self.lease_seconds = lease_seconds
         
         self.jobs_dir.mkdir(parents=True, exist_ok=True)
         self.results_dir.mkdir(parents=True, exist_ok=True)
         self.progress_dir.mkdir(parents=True, exist_ok=True)
+        self.claimed_dir.mkdir(parents=True, exist_ok=True)
+        self.checkpoints_dir.mkdir(parents=True, exist_ok=True)
 
-    def create_task(self, task_type: str, payload: dict) -> str:
+        self._job_event = threading.Event()
+        self._job_observer = None
+        self._job_watcher_lock = threading.Lock()
+        self._progress_writer = ProgressWriter(self._write_progress, max_progress_writes_per_sec)
+        # Parsed job files keyed by path, reused while their mtime is unchanged
+        self._job_cache = {}
+        self.stats_file = self.storage_dir / "queue_stats.json"
+        # Finished tasks are moved out of results/ and progress/ by compact()
+        self.archive = TaskArchive(self.storage_dir / "archive")
+
+    def create_task(self, task_type: str, payload: dict, priority: int = 0,
+                    estimated_cost: float = None, owner: str = None) -> str:
+        """
+        Queues a task. Higher priority runs first; estimated_cost (e.g. seconds of audio)
+        and owner (user or voice) feed the fair-share scheduling in claim_job.
+        """
         task_id = str(uuid.uuid4())
         task_data = {
             "task_id": task_id,
             "type": task_type,
             "payload": payload,
             "created_at": time.time(),
-            "status": "pending"
+            "status": "pending",
+            "priority": priority,
+            "estimated_cost": estimated_cost,
+            "owner": owner
         }
         
+        # Write to a temp name first so a worker never claims a half-written job
         file_path = self.jobs_dir / f"{task_id}.json"
-        with open(file_path, "w") as f:
+        temp_path = self.jobs_dir / f".{task_id}.json.tmp"
+        with open(temp_path, "w") as f:
             json.dump(task_data, f, indent=2)
+        os.replace(temp_path, file_path)
             
         return task_id
 
+    def claim_job(self):
+        """
+        Atomically claims the best pending job for the current process, by priority,
+        fair share between owners and waiting time (see scheduler.order_pending).
+        The job file is renamed into claimed/ so no other worker can pick it up.
+        Returns the task data, or None if the queue is empty.
+        """
+        pid = os.getpid()
+        self._requeue_expired_claims()
+        pending = self._read_jobs(self.jobs_dir)
+        running = self._read_jobs(self.claimed_dir)
+        for job in scheduler.order_pending(pending, running):
+            task_id = job["task_id"]
+            job_file = self.jobs_dir / f"{task_id}.json"
+            claim_path = self.claimed_dir / f"{task_id}.{pid}.json"
+            try:
+                os.rename(job_file, claim_path)
+                # The rename keeps the job's old mtime, which would read as an expired lease
+                os.utime(claim_path)
+            except (FileNotFoundError, PermissionError):
+                # Another worker claimed it first (or it is still being written)
+                continue
+
+            try:
+                with open(claim_path, "r") as f:
+                    task = json.load(f)
+            except FileNotFoundError:
+                # Lost a race with a worker requeueing it; it is back in jobs/
+                continue
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Discarding unreadable job {task_id}: {e}")
+                self._write_result(task_id, {"status": "error", "message": f"Unreadable job file: {e}"})
+                claim_path.unlink(missing_ok=True)
+                continue
+
+            task["status"] = "processing"
+            task["owner_pid"] = pid
+            task["claimed_at"] = time.time()
+            with open(claim_path, "w") as f:
+                json.dump(task, f, indent=2)
+            return task
+        return None
+
+    def next_job(self, timeout: float = None, poll_interval: float = 5.0):
+        """
+        Blocks until a job can be claimed and returns it (see claim_job).
+        Wakes up on filesystem events from watchdog; the directory is only re-scanned
+        every poll_interval seconds as a fallback (every second if watchdog is unavailable).
+        Returns None if timeout expires first.
+        """
+        if not self._start_job_watcher():
+            poll_interval = min(poll_interval, 1.0)
+        deadline = None if timeout is None else time.time() + timeout
+
+        while True:
+            # Clear before scanning so a job created during the scan still wakes us up
+            self._job_event.clear()
+            task = self.claim_job()
+            if task:
+                return task
+
+            wait = poll_interval
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining)
+            self._job_event.wait(wait)
+
+    def _start_job_watcher(self) -> bool:
+        """Starts the watchdog observer on jobs/ once. Returns False if it is unavailable."""
+        if Observer is None:
+            return False
+        with self._job_watcher_lock:
+            if self._job_observer is None:
+                try:
+                    observer = Observer()
+                    observer.daemon = True
+                    observer.schedule(_JobEventHandler(self._job_event), str(self.jobs_dir), recursive=False)
+                    observer.start()
+                    self._job_observer = observer
+                except Exception as e:
+                    print(f"Job watcher unavailable, falling back to polling: {e}")
+                    self._job_observer = False
+            return bool(self._job_observer)
+
+    def renew_lease(self, task_id: str) -> bool:
+        """Heartbeat of the owning worker. Returns False if the claim was lost to another worker."""
+        try:
+            os.utime(self.claimed_dir / f"{task_id}.{os.getpid()}.json")
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _requeue_expired_claims(self):
+        """Puts jobs whose owner stopped renewing its lease back into the queue"""
+        deadline = time.time() - self.lease_seconds
+        for claim_path in self.claimed_dir.glob("*.json"):
+            job = self._read_job(claim_path)
+            # A job renamed in a moment ago stays pending until its new owner marks it processing
+            if not job or job.get("status") != "processing":
+                continue
+            try:
+                # Checked after reading: marking a job processing also refreshes its mtime
+                if claim_path.stat().st_mtime >= deadline:
+                    continue
+            except FileNotFoundError:
+                continue
+            if self._requeue_claim(claim_path, job["task_id"]):
+                print(f"Lease of task {job['task_id']} expired, putting it back in the queue")
+
+    def _requeue_claim(self, claim_path: Path, task_id: str) -> bool:
+        """
+        Moves a claimed job back into jobs/ as pending. The claim is first renamed to a private
+        name, so only one worker requeues it and nobody sees it before it is rewritten.
+        Returns False if the claim was already gone.
+        """
+        temp_path = self.claimed_dir / f".{task_id}.{os.getpid()}.requeue.tmp"
+        try:
+            os.rename(claim_path, temp_path)
+        except OSError:
+            return False
+        self._job_cache.pop(claim_path, None)
+        try:
+            with open(temp_path, "r") as f:
+                task = json.load(f)
+            task["status"] = "pending"
+            task.pop("owner_pid", None)
+            task.pop("claimed_at", None)
+            with open(temp_path, "w") as f:
+                json.dump(task, f, indent=2)
+        except (OSError, json.JSONDecodeError) as e:
+            # Requeued as is; claim_job reports it as unreadable
+            print(f"Could not reset requeued job {task_id}: {e}")
+        os.replace(temp_path, self.jobs_dir / f"{task_id}.json")
+        return True
+
+    def open_checkpoint(self, task_id: str) -> TaskCheckpoint:
+        """Per-task record of finished input files, kept until the task completes"""
+        return TaskCheckpoint(self.checkpoints_dir / f"{task_id}.jsonl")
+
+    def complete_task(self, task_id: str, result: dict) -> bool:
+        """
+        Writes the task result and releases the claim this process holds on the job.
+        Returns False without writing anything if the claim was lost (its lease expired).
+        """
+        self._progress_writer.flush(task_id)
+        claim_path = self.claimed_dir / f"{task_id}.{os.getpid()}.json"
+        # Renamed away first so the lease can no longer expire while the result is written
+        done_path = self.claimed_dir / f".{task_id}.{os.getpid()}.done.tmp"
+        try:
+            os.rename(claim_path, done_path)
+        except FileNotFoundError:
+            return False
+        self._job_cache.pop(claim_path, None)
+        self._write_result(task_id, result)
+        (self.checkpoints_dir / f"{task_id}.jsonl").unlink(missing_ok=True)
+        try:
+            with open(done_path, "r") as f:
+                self._record_duration(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            pass
+        done_path.unlink(missing_ok=True)
+        return True
+
+    def queue_status(self, task_id: str):
+        """Queue position and estimated start time of a pending task, or None if it isn't queued"""
+        return scheduler.estimate_queue(
+            task_id, self._read_jobs(self.jobs_dir), self._read_jobs(self.claimed_dir), self._read_stats()
+        )
+
+    def _read_stats(self) -> dict:
+        try:
+            with open(self.stats_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _record_duration(self, job: dict):
+        stats = scheduler.update_stats(self._read_stats(), job, time.time())
+        temp_path = self.stats_file.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(stats, f)
+            os.replace(temp_path, self.stats_file)
+        except OSError as e:
+            print(f"Error saving queue statistics: {e}")
+
+    def recover_claims(self) -> int:
+        """
+        Puts jobs claimed by processes that no longer exist back into the queue.
+        Returns the number of recovered jobs.
+        """
+        recovered = 0
+        for claim_path in self.claimed_dir.glob("*.json"):
+            task_id, _, pid = claim_path.stem.rpartition(".")
+            if not pid.isdigit() or _pid_alive(int(pid)):
+                continue
+            if self._requeue_claim(claim_path, task_id):
+                recovered += 1
+        # Jobs a process was requeueing or completing when it stopped (see _requeue_claim, complete_task)
+        for temp_path in self.claimed_dir.glob(".*.tmp"):
+            task_id, pid, _, _ = temp_path.name[1:].split(".")
+            if not pid.isdigit() or _pid_alive(int(pid)):
+                continue
+            if (self.results_dir / f"{task_id}_result.json").exists():
+                temp_path.unlink(missing_ok=True)
+            elif self._requeue_claim(temp_path, task_id):
+                recovered += 1
+        return recovered
+
+    def count_pending(self) -> int:
+        return sum(1 for _ in self.jobs_dir.glob("*.json"))
+
+    def list_tasks(self, status: str = None, offset: int = 0, limit: int = 50) -> dict:
+        """
+        Lists known tasks, newest first. This has to scan every job and result file;
+        use SqliteIPC when the number of tasks grows large.
+        """
+        tasks = []
+        for job_file in list(self.jobs_dir.glob("*.json")) + list(self.claimed_dir.glob("*.json")):
+            try:
+                with open(job_file, "r") as f:
+                    task = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            tasks.append({
+                "task_id": task["task_id"],
+                "type": task["type"],
+                "status": "processing" if job_file.parent == self.claimed_dir else "pending",
+                "created_at": task["created_at"],
+            })
+        for result_file in self.results_dir.glob("*_result.json"):
+            try:
+                finished_at = result_file.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            tasks.append({
+                "task_id": self.task_id_from_path(str(result_file)),
+                "type": None,
+                "status": "completed",
+                "created_at": finished_at,
+            })
+
+        if status:
+            tasks = [t for t in tasks if t["status"] == status]
+        tasks.sort(key=lambda t: t["created_at"], reverse=True)
+        page = tasks[offset:offset + limit]
+        for task in page:
+            task["progress"] = self.get_progress(task["task_id"])
+        return {"total": len(tasks), "offset": offset, "limit": limit, "tasks": page}
+
+    def _read_jobs(self, directory: Path):
+        """All job files of a directory, parsed (cached while unchanged)"""
+        jobs = []
+        seen = set()
+        for job_file in directory.glob("*.json"):
+            seen.add(job_file)
+            job = self._read_job(job_file)
+            if job:
+                jobs.append(job)
+        # Forget jobs that have since been claimed or completed
+        for job_file in [p for p in self._job_cache if p.parent == directory and p not in seen]:
+            del self._job_cache[job_file]
+        return jobs
+
+    def _read_job(self, job_file: Path):
+        try:
+            mtime = job_file.stat().st_mtime_ns
+            cached = self._job_cache.get(job_file)
+            if cached and cached[0] == mtime:
+                return cached[1]
+            with open(job_file, "r") as f:
+                job = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._job_cache.pop(job_file, None)
+            return None
+        self._job_cache[job_file] = (mtime, job)
+        return job
+
+    def _write_result(self, task_id: str, result: dict):
+        result_file = self.results_dir / f"{task_id}_result.json"
+        temp_path = result_file.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(result, f)
+        os.replace(temp_path, result_file)
+
     def update_progress(self, task_id: str, message: str, percent: int = None):
-        """Updates the progress file for a task with robust retry logic"""
-        progress_data = {
+        """
+        Queues a progress update for a task. Never blocks: updates are coalesced
+        and written by a background thread (see ProgressWriter).
+        """
+        self._progress_writer.submit(task_id, {
             "task_id": task_id,
             "message": message,
             "percent": percent,
             "updated_at": time.time()
-        }
+        })
+
+    def _write_progress(self, task_id: str, progress_data: dict):
+        """Writes the progress file for a task with robust retry logic"""
         file_path = self.progress_dir / f"{task_id}.json"
         temp_path = file_path.with_suffix(".tmp")
         
@@ -79,15 +458,112 @@ class FileIPC:
         # The transcription will continue without updating progress
 
     def get_progress(self, task_id: str):
-        """Reads the progress file for a task"""
+        """Reads the progress file for a task (or its archived record)"""
         file_path = self.progress_dir / f"{task_id}.json"
-        if file_path.exists():
+        try:
+            with open(file_path, "r") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return None
+        except FileNotFoundError:
+            record = self.archive.lookup(task_id)
+            return record.get("progress") if record else None
+
+    def get_result(self, task_id: str):
+        """Reads the result file for a task (or its archived record), or None if it has not finished yet"""
+        result_file = self.results_dir / f"{task_id}_result.json"
+        try:
+            with open(result_file, "r") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return None
+        except FileNotFoundError:
+            record = self.archive.lookup(task_id)
+            return record.get("result") if record else None
+
+    def compact(self, retention_seconds: float, tmp_grace_seconds: float = 3600):
+        """
+        Archives results (with their last progress) older than retention_seconds into
+        archive/YYYY-MM-DD.jsonl and deletes their files. Also removes progress files and
+        checkpoints of tasks that no longer exist, and stray .tmp files.
+        Returns the number of archived tasks.
+        """
+        now = time.time()
+        cutoff = now - retention_seconds
+
+        records = []
+        archived_files = []
+        for result_file in self.results_dir.glob("*_result.json"):
             try:
-                with open(file_path, "r") as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                return None
-        return None
+                finished_at = result_file.stat().st_mtime
+                if finished_at >= cutoff:
+                    continue
+                with open(result_file, "r") as f:
+                    result = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            task_id = self.task_id_from_path(str(result_file))
+            progress_file = self.progress_dir / f"{task_id}.json"
+            progress = None
+            try:
+                with open(progress_file, "r") as f:
+                    progress = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                pass
+            records.append({
+                "task_id": task_id,
+                "status": "completed",
+                "result": result,
+                "progress": progress,
+                "finished_at": finished_at
+            })
+            archived_files.extend([result_file, progress_file])
+
+        # Index first, delete after: a crash in between only archives a task twice
+        if records:
+            self.archive.append(records)
+        for path in archived_files:
+            path.unlink(missing_ok=True)
+
+        # Leftovers of tasks that are gone (e.g. progress of a deleted job)
+        for directory, pattern in ((self.progress_dir, "*.json"), (self.checkpoints_dir, "*.jsonl")):
+            for path in directory.glob(pattern):
+                task_id = path.name.split(".")[0]
+                try:
+                    if path.stat().st_mtime >= cutoff:
+                        continue
+                except FileNotFoundError:
+                    continue
+                if (self.results_dir / f"{task_id}_result.json").exists():
+                    continue
+                if self.get_task_status(task_id) in ("pending", "processing"):
+                    continue
+                path.unlink(missing_ok=True)
+
+        # Temp files left behind by interrupted writes
+        for directory in (self.jobs_dir, self.results_dir, self.progress_dir, self.storage_dir):
+            for path in directory.glob("*.tmp"):
+                try:
+                    if path.stat().st_mtime < now - tmp_grace_seconds:
+                        path.unlink()
+                except OSError:
+                    pass
+
+        return len(records)
+
+    def event_dirs(self):
+        """Directories whose file events signal progress or result changes"""
+        return [self.progress_dir, self.results_dir]
+
+    def task_id_from_path(self, path: str):
+        """Maps a progress or result file path back to its task id, or None for other files"""
+        name = os.path.basename(path)
+        if not name.endswith(".json"):
+            return None
+        stem = name[:-len(".json")]
+        if stem.endswith("_result"):
+            return stem[:-len("_result")]
+        return stem
 
     async def watch_task(self, task_id: str, timeout: int = 300):
         """
@@ -121,6 +597,12 @@ class FileIPC:
         # Check if job file exists
         job_file = self.jobs_dir / f"{task_id}.json"
         if job_file.exists():
-            return "pending" # Or 'processing' if we had a way to mark it
+            return "pending"
+
+        if any(self.claimed_dir.glob(f"{task_id}.*.json")):
+            return "processing"
+
+        if self.archive.lookup(task_id) is not None:
+            return "completed"
             
         return "unknown"
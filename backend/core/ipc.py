@@ -0,0 +1,18 @@
+import os
+
+from backend.core.file_ipc import FileIPC
+from backend.core.sqlite_ipc import SqliteIPC
+
+
+def open_ipc(storage_dir: str, backend: str = None):
+    """
+    Opens the task store shared by the API and the worker.
+    The backend is 'file' (JSON files, default) or 'sqlite', and can be set with
+    the TTS_IPC_BACKEND environment variable. Both processes must use the same one.
+    """
+    backend = backend or os.environ.get("TTS_IPC_BACKEND", "file")
+    if backend == "sqlite":
+        return SqliteIPC(storage_dir)
+    if backend == "file":
+        return FileIPC(storage_dir)
+    raise ValueError(f"Unknown IPC backend: {backend}")
@@ -0,0 +1,133 @@
+import asyncio
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Returned by ipc.task_id_from_path when a change can't be attributed to a single task
+ALL_TASKS = "*"
+
+
+class _ProgressEventHandler(FileSystemEventHandler):
+    """Forwards progress/result file events from the watchdog thread to the event loop"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def on_created(self, event):
+        self.hub.notify_threadsafe(event.src_path)
+
+    def on_modified(self, event):
+        self.hub.notify_threadsafe(event.src_path)
+
+    def on_moved(self, event):
+        # update_progress writes a temp file and renames it into place
+        self.hub.notify_threadsafe(event.dest_path)
+
+
+class _TaskChannel:
+    """Subscribers of a single task and the last state broadcast to them"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.last_message = None
+        self.refresh_pending = False
+
+
+class ProgressHub:
+    """
+    Pushes task progress and results to websocket subscribers.
+    One shared filesystem watcher feeds a channel per task; each change is read
+    once and broadcast to every subscriber of that task.
+    """
+
+    def __init__(self, ipc, poll_interval: float = 5.0):
+        self.ipc = ipc
+        self.poll_interval = poll_interval
+        self._channels = {}
+        self._loop = None
+        self._observer = None
+        self._poll_task = None
+
+    def _start(self):
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+
+        if Observer is not None:
+            try:
+                observer = Observer()
+                observer.daemon = True
+                handler = _ProgressEventHandler(self)
+                for directory in self.ipc.event_dirs():
+                    observer.schedule(handler, str(directory), recursive=False)
+                observer.start()
+                self._observer = observer
+            except Exception as e:
+                print(f"Progress watcher unavailable, falling back to polling: {e}")
+        if self._observer is None:
+            self.poll_interval = min(self.poll_interval, 1.0)
+
+        # Periodic refresh as a safety net for missed or unsupported events
+        self._poll_task = self._loop.create_task(self._poll())
+
+    def subscribe(self, task_id: str, queue: asyncio.Queue):
+        """Registers queue for updates of task_id and pushes the current state to it"""
+        self._start()
+        channel = self._channels.setdefault(task_id, _TaskChannel())
+        channel.subscribers.add(queue)
+        message = channel.last_message or self._read_state(task_id)
+        channel.last_message = message
+        queue.put_nowait(message)
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        channel = self._channels.get(task_id)
+        if channel is None:
+            return
+        channel.subscribers.discard(queue)
+        if not channel.subscribers:
+            del self._channels[task_id]
+
+    def notify_threadsafe(self, path: str):
+        task_id = self.ipc.task_id_from_path(path)
+        if self._loop is not None and task_id is not None:
+            self._loop.call_soon_threadsafe(self._notify, task_id)
+
+    def _notify(self, task_id):
+        task_ids = list(self._channels) if task_id == ALL_TASKS else [task_id]
+        for tid in task_ids:
+            channel = self._channels.get(tid)
+            if channel is None or channel.refresh_pending:
+                continue
+            # Coalesce bursts of events into one read per task
+            channel.refresh_pending = True
+            self._loop.call_soon(self._refresh, tid)
+
+    def _refresh(self, task_id: str):
+        channel = self._channels.get(task_id)
+        if channel is None:
+            return
+        channel.refresh_pending = False
+        message = self._read_state(task_id)
+        if message == channel.last_message:
+            return
+        channel.last_message = message
+        for queue in channel.subscribers:
+            queue.put_nowait(message)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            self._notify(ALL_TASKS)
+
+    def _read_state(self, task_id: str) -> dict:
+        result = self.ipc.get_result(task_id)
+        if result is not None:
+            return {"task_id": task_id, "status": "completed", "result": result}
+        progress = self.ipc.get_progress(task_id)
+        if progress:
+            return {"task_id": task_id, "status": "processing", "detail": progress}
+        return {"task_id": task_id, "status": "processing"}
@@ -0,0 +1,59 @@
+import os
+import time
+import atexit
+import threading
+
+
+class ProgressWriter:
+    """
+    Coalesces progress updates and writes them from a background thread.
+    submit() never blocks on I/O: it only replaces the pending update of the task,
+    so the latest message is always kept and each task is written at most
+    max_writes_per_sec times per second.
+    """
+
+    def __init__(self, write, max_writes_per_sec: float = 4.0):
+        self._write = write
+        self._interval = 1.0 / max_writes_per_sec
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Held while writing so a flush never races an older update onto disk
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        atexit.register(self.flush)
+
+    def submit(self, task_id: str, data: dict):
+        with self._lock:
+            self._pending[task_id] = data
+            # Threads don't survive a fork, so worker processes start their own
+            if self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+        self._wakeup.set()
+
+    def flush(self, task_id: str = None):
+        """Synchronously writes pending updates (of one task, or all of them)"""
+        with self._write_lock:
+            with self._lock:
+                if task_id is None:
+                    items = list(self._pending.items())
+                    self._pending.clear()
+                elif task_id in self._pending:
+                    items = [(task_id, self._pending.pop(task_id))]
+                else:
+                    items = []
+            for tid, data in items:
+                try:
+                    self._write(tid, data)
+                except Exception as e:
+                    print(f"Error writing progress for {tid}: {e}")
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self.flush()
+            time.sleep(self._interval)
@@ -0,0 +1,103 @@
+import heapq
+import math
+import time
+
+# A job gains one priority level for every hour it has been waiting, so big jobs are never starved
+AGING_PER_HOUR = 1.0
+# Each running or earlier-queued job of the same owner costs one priority level (fair sharing)
+FAIR_SHARE_PENALTY = 1.0
+# Cheap jobs go first: 1 min of audio costs ~0.3 levels, 1 h ~1.8, 20 h ~3.1
+COST_PENALTY = 1.0
+# Running average weight of the newest sample in the duration statistics
+STATS_SMOOTHING = 0.2
+DEFAULT_TASK_SECONDS = 60.0
+
+
+def job_owner(job):
+    return job.get("owner") or "default"
+
+
+def order_pending(pending, running, now=None):
+    """
+    Returns the pending jobs in dispatch order, best first.
+    Jobs are dicts with task_id, created_at, priority, estimated_cost (seconds of audio) and owner.
+    """
+    now = now or time.time()
+    running_by_owner = {}
+    for job in running:
+        owner = job_owner(job)
+        running_by_owner[owner] = running_by_owner.get(owner, 0) + 1
+
+    # Rank each owner's own jobs by priority, then age
+    by_owner = {}
+    for job in sorted(pending, key=lambda j: (-(j.get("priority") or 0), j["created_at"])):
+        by_owner.setdefault(job_owner(job), []).append(job)
+
+    scored = []
+    for owner, jobs in by_owner.items():
+        for rank, job in enumerate(jobs):
+            waited_hours = max(0.0, now - job["created_at"]) / 3600
+            cost_minutes = (job.get("estimated_cost") or 0) / 60
+            score = ((job.get("priority") or 0)
+                     + AGING_PER_HOUR * waited_hours
+                     - FAIR_SHARE_PENALTY * (running_by_owner.get(owner, 0) + rank)
+                     - COST_PENALTY * math.log10(1 + cost_minutes))
+            scored.append((-score, job["created_at"], job["task_id"], job))
+    scored.sort()
+    return [job for _, _, _, job in scored]
+
+
+def estimate_duration(job, stats):
+    """Expected run time of a job in seconds, from the learned statistics of its task type"""
+    type_stats = stats.get(job.get("type")) or {}
+    if job.get("estimated_cost") and type_stats.get("seconds_per_cost"):
+        return job["estimated_cost"] * type_stats["seconds_per_cost"]
+    return type_stats.get("seconds_per_task", DEFAULT_TASK_SECONDS)
+
+
+def estimate_queue(task_id, pending, running, stats, now=None):
+    """
+    Queue position (0 = next) and estimated start time of a pending job.
+    Simulates the dispatch order over the workers currently busy (at least one).
+    Returns None if the task is not pending.
+    """
+    now = now or time.time()
+    ordered = order_pending(pending, running, now)
+    position = next((i for i, job in enumerate(ordered) if job["task_id"] == task_id), None)
+    if position is None:
+        return None
+
+    free_at = [now + max(0.0, estimate_duration(job, stats) - (now - (job.get("claimed_at") or now)))
+               for job in running]
+    if not free_at:
+        free_at = [now]
+    heapq.heapify(free_at)
+    for job in ordered[:position]:
+        start = heapq.heappop(free_at)
+        heapq.heappush(free_at, start + estimate_duration(job, stats))
+    start_at = free_at[0]
+
+    return {
+        "task_id": task_id,
+        "position": position,
+        "queue_length": len(ordered),
+        "estimated_start_in": start_at - now,
+        "estimated_start_at": start_at,
+    }
+
+
+def update_stats(stats, job, finished_at):
+    """Folds the run time of a finished job into the per-type duration statistics"""
+    if not job.get("claimed_at"):
+        return stats
+    elapsed = max(0.0, finished_at - job["claimed_at"])
+    type_stats = stats.setdefault(job.get("type") or "unknown", {})
+
+    def smooth(key, value):
+        previous = type_stats.get(key)
+        type_stats[key] = value if previous is None else (1 - STATS_SMOOTHING) * previous + STATS_SMOOTHING * value
+
+    smooth("seconds_per_task", elapsed)
+    if job.get("estimated_cost"):
+        smooth("seconds_per_cost", elapsed / job["estimated_cost"])
+    return stats
@@ -0,0 +1,472 @@
+import json
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from pathlib import Path
+
+from backend.core.file_ipc import _pid_alive
+from backend.core.progress_hub import ALL_TASKS
+from backend.core.progress_writer import ProgressWriter
+from backend.core import scheduler
+from backend.core.checkpoint import TaskCheckpoint
+from backend.core.archive import TaskArchive
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    owner_pid INTEGER,
+    progress_message TEXT,
+    progress_percent INTEGER,
+    progress_updated_at REAL,
+    result TEXT,
+    finished_at REAL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    estimated_cost REAL,
+    owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks (created_at);
+CREATE TABLE IF NOT EXISTS queue_stats (
+    task_type TEXT PRIMARY KEY,
+    seconds_per_task REAL,
+    seconds_per_cost REAL
+);
+"""
+
+# Columns added after the first release, created on databases that predate them
+MIGRATIONS = {
+    "priority": "ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 0",
+    "estimated_cost": "ALTER TABLE tasks ADD COLUMN estimated_cost REAL",
+    "owner": "ALTER TABLE tasks ADD COLUMN owner TEXT",
+    "lease_expires": "ALTER TABLE tasks ADD COLUMN lease_expires REAL",
+}
+
+# Columns the scheduler needs to order jobs
+SCHEDULING_COLUMNS = "task_id, type, created_at, claimed_at, priority, estimated_cost, owner"
+
+
+class _NewJobEventHandler(FileSystemEventHandler):
+    """Wakes up waiting workers when create_task touches the new-jobs marker file"""
+
+    def __init__(self, marker_name: str, event: threading.Event):
+        self.marker_name = marker_name
+        self.event = event
+
+    def on_any_event(self, event):
+        paths = (event.src_path, getattr(event, "dest_path", ""))
+        if any(os.path.basename(path) == self.marker_name for path in paths):
+            self.event.set()
+
+
+class SqliteIPC:
+    """
+    Task store backed by a single SQLite database in WAL mode.
+    Drop-in replacement for FileIPC: jobs, progress and results are rows of one
+    indexed table instead of separate JSON files.
+    """
+
+    def __init__(self, storage_dir: str, db_name: str = "tasks.db", max_progress_writes_per_sec: float = 4.0,
+                 lease_seconds: float = 60.0):
+        self.storage_dir = Path(storage_dir)
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.db_name = db_name
+        self.db_path = self.storage_dir / db_name
+        self.checkpoints_dir = self.storage_dir / "checkpoints"
+        self.lease_seconds = lease_seconds
+        # Written after every new job; idle workers watch it rather than the busy database and WAL
+        self.new_jobs_marker = self.storage_dir / f".{db_name}.new_jobs"
+
+        # Finished tasks are moved out of the table by compact()
+        self.archive = TaskArchive(self.storage_dir / "archive")
+
+        self._local = threading.local()
+        self._job_event = threading.Event()
+        self._job_observer = None
+        self._job_watcher_lock = threading.Lock()
+        self._progress_writer = ProgressWriter(self._write_progress, max_progress_writes_per_sec)
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(tasks)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                conn.execute(statement)
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (and per process, after a fork)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create_task(self, task_type: str, payload: dict, priority: int = 0,
+                    estimated_cost: float = None, owner: str = None) -> str:
+        task_id = str(uuid.uuid4())
+        self._connect().execute(
+            "INSERT INTO tasks (task_id, type, payload, status, created_at, priority, estimated_cost, owner) "
+            "VALUES (?, ?, ?, 'pending', ?, ?, ?, ?)",
+            (task_id, task_type, json.dumps(payload), time.time(), priority, estimated_cost, owner)
+        )
+        self._signal_new_jobs()
+        return task_id
+
+    def _signal_new_jobs(self):
+        try:
+            self.new_jobs_marker.write_text(str(time.time()))
+        except OSError as e:
+            # Workers still find the job on their next poll
+            print(f"Could not signal new jobs: {e}")
+
+    def _scheduling_rows(self, conn, status: str):
+        rows = conn.execute(f"SELECT {SCHEDULING_COLUMNS} FROM tasks WHERE status = ?", (status,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def claim_job(self):
+        """
+        Atomically claims the best pending job, by priority, fair share between owners
+        and waiting time (see scheduler.order_pending). Returns the task data, or None.
+        """
+        conn = self._connect()
+        # Read-only check first, so idle workers don't queue up for the write lock
+        claimable = conn.execute(
+            "SELECT 1 FROM tasks WHERE status = 'pending' "
+            "OR (status = 'processing' AND lease_expires < ?) LIMIT 1",
+            (time.time(),)
+        ).fetchone()
+        if claimable is None:
+            return None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose owner stopped renewing its lease go back into the queue
+            conn.execute(
+                "UPDATE tasks SET status = 'pending', owner_pid = NULL, claimed_at = NULL "
+                "WHERE status = 'processing' AND lease_expires < ?",
+                (time.time(),)
+            )
+            ordered = scheduler.order_pending(
+                self._scheduling_rows(conn, "pending"), self._scheduling_rows(conn, "processing")
+            )
+            if not ordered:
+                conn.execute("COMMIT")
+                return None
+            row = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (ordered[0]["task_id"],)).fetchone()
+            claimed_at = time.time()
+            conn.execute(
+                "UPDATE tasks SET status = 'processing', owner_pid = ?, claimed_at = ?, lease_expires = ? "
+                "WHERE task_id = ?",
+                (os.getpid(), claimed_at, claimed_at + self.lease_seconds, row["task_id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return {
+            "task_id": row["task_id"],
+            "type": row["type"],
+            "payload": json.loads(row["payload"]),
+            "created_at": row["created_at"],
+            "status": "processing",
+            "owner_pid": os.getpid(),
+            "claimed_at": claimed_at,
+            "priority": row["priority"],
+            "estimated_cost": row["estimated_cost"],
+            "owner": row["owner"],
+        }
+
+    def next_job(self, timeout: float = None, poll_interval: float = 5.0):
+        """
+        Blocks until a job can be claimed and returns it (see claim_job).
+        Wakes up when create_task signals a new job; polls every poll_interval seconds
+        as a fallback (and to pick up expired leases).
+        Returns None if timeout expires first.
+        """
+        if not self._start_job_watcher():
+            poll_interval = min(poll_interval, 1.0)
+        deadline = None if timeout is None else time.time() + timeout
+
+        while True:
+            self._job_event.clear()
+            task = self.claim_job()
+            if task:
+                return task
+
+            wait = poll_interval
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                wait = min(wait, remaining)
+            self._job_event.wait(wait)
+
+    def _start_job_watcher(self) -> bool:
+        if Observer is None:
+            return False
+        with self._job_watcher_lock:
+            if self._job_observer is None:
+                try:
+                    observer = Observer()
+                    observer.daemon = True
+                    handler = _NewJobEventHandler(self.new_jobs_marker.name, self._job_event)
+                    observer.schedule(handler, str(self.storage_dir), recursive=False)
+                    observer.start()
+                    self._job_observer = observer
+                except Exception as e:
+                    print(f"Job watcher unavailable, falling back to polling: {e}")
+                    self._job_observer = False
+            return bool(self._job_observer)
+
+    def renew_lease(self, task_id: str) -> bool:
+        """Heartbeat of the owning worker. Returns False if the claim was lost to another worker."""
+        cursor = self._connect().execute(
+            "UPDATE tasks SET lease_expires = ? WHERE task_id = ? AND owner_pid = ? AND status = 'processing'",
+            (time.time() + self.lease_seconds, task_id, os.getpid())
+        )
+        return cursor.rowcount > 0
+
+    def open_checkpoint(self, task_id: str) -> TaskCheckpoint:
+        """Per-task record of finished input files, kept until the task completes"""
+        return TaskCheckpoint(self.checkpoints_dir / f"{task_id}.jsonl")
+
+    def complete_task(self, task_id: str, result: dict) -> bool:
+        """
+        Stores the task result and marks it completed.
+        Returns False without storing anything if this process no longer owns the task (its lease expired).
+        """
+        self._progress_writer.flush(task_id)
+        conn = self._connect()
+        finished_at = time.time()
+        job = conn.execute(f"SELECT {SCHEDULING_COLUMNS} FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        cursor = conn.execute(
+            "UPDATE tasks SET status = 'completed', result = ?, finished_at = ? "
+            "WHERE task_id = ? AND owner_pid = ? AND status = 'processing'",
+            (json.dumps(result), finished_at, task_id, os.getpid())
+        )
+        if cursor.rowcount == 0:
+            return False
+        (self.checkpoints_dir / f"{task_id}.jsonl").unlink(missing_ok=True)
+        if job is not None:
+            stats = scheduler.update_stats(self._read_stats(conn), dict(job), finished_at)
+            type_stats = stats.get(job["type"])
+            if type_stats:
+                conn.execute(
+                    "INSERT OR REPLACE INTO queue_stats (task_type, seconds_per_task, seconds_per_cost) "
+                    "VALUES (?, ?, ?)",
+                    (job["type"], type_stats.get("seconds_per_task"), type_stats.get("seconds_per_cost"))
+                )
+        return True
+
+    def queue_status(self, task_id: str):
+        """Queue position and estimated start time of a pending task, or None if it isn't queued"""
+        conn = self._connect()
+        return scheduler.estimate_queue(
+            task_id, self._scheduling_rows(conn, "pending"), self._scheduling_rows(conn, "processing"),
+            self._read_stats(conn)
+        )
+
+    def _read_stats(self, conn) -> dict:
+        stats = {}
+        for row in conn.execute("SELECT * FROM queue_stats"):
+            stats[row["task_type"]] = {
+                key: row[key] for key in ("seconds_per_task", "seconds_per_cost") if row[key] is not None
+            }
+        return stats
+
+    def recover_claims(self) -> int:
+        """Puts jobs claimed by processes that no longer exist back into the queue"""
+        conn = self._connect()
+        rows = conn.execute("SELECT task_id, owner_pid FROM tasks WHERE status = 'processing'").fetchall()
+        recovered = 0
+        for row in rows:
+            if row["owner_pid"] is not None and _pid_alive(row["owner_pid"]):
+                continue
+            cursor = conn.execute(
+                "UPDATE tasks SET status = 'pending', owner_pid = NULL, claimed_at = NULL "
+                "WHERE task_id = ? AND status = 'processing'",
+                (row["task_id"],)
+            )
+            recovered += cursor.rowcount
+        if recovered:
+            self._signal_new_jobs()
+        return recovered
+
+    def count_pending(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM tasks WHERE status = 'pending'").fetchone()[0]
+
+    def update_progress(self, task_id: str, message: str, percent: int = None):
+        """Queues a progress update; coalesced and written by a background thread"""
+        self._progress_writer.submit(task_id, {"message": message, "percent": percent, "updated_at": time.time()})
+
+    def _write_progress(self, task_id: str, progress_data: dict):
+        """Failures are non-critical and only logged"""
+        try:
+            self._connect().execute(
+                "UPDATE tasks SET progress_message = ?, progress_percent = ?, progress_updated_at = ? "
+                "WHERE task_id = ?",
+                (progress_data["message"], progress_data["percent"], progress_data["updated_at"], task_id)
+            )
+        except sqlite3.Error as e:
+            print(f"Error in update_progress: {e}")
+
+    def get_progress(self, task_id: str):
+        row = self._connect().execute(
+            "SELECT progress_message, progress_percent, progress_updated_at FROM tasks WHERE task_id = ?",
+            (task_id,)
+        ).fetchone()
+        if row is None:
+            record = self.archive.lookup(task_id)
+            return record.get("progress") if record else None
+        if row["progress_updated_at"] is None:
+            return None
+        return {
+            "task_id": task_id,
+            "message": row["progress_message"],
+            "percent": row["progress_percent"],
+            "updated_at": row["progress_updated_at"]
+        }
+
+    def get_result(self, task_id: str):
+        row = self._connect().execute("SELECT result FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None:
+            record = self.archive.lookup(task_id)
+            return record.get("result") if record else None
+        if row["result"] is None:
+            return None
+        return json.loads(row["result"])
+
+    async def watch_task(self, task_id: str, timeout: int = 300):
+        """
+        Waits for the result of the given task_id.
+        Returns the result data if found, or raises TimeoutError.
+        """
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            result = self.get_result(task_id)
+            if result is not None:
+                return result
+            await asyncio.sleep(0.5)
+
+        raise TimeoutError(f"Timeout waiting for task {task_id}")
+
+    def get_task_status(self, task_id: str):
+        row = self._connect().execute("SELECT status FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row:
+            return row["status"]
+        return "completed" if self.archive.lookup(task_id) is not None else "unknown"
+
+    def compact(self, retention_seconds: float, batch_size: int = 1000):
+        """
+        Archives tasks completed more than retention_seconds ago into archive/YYYY-MM-DD.jsonl
+        and deletes their rows, plus checkpoints of tasks that no longer exist.
+        Returns the number of archived tasks.
+        """
+        conn = self._connect()
+        cutoff = time.time() - retention_seconds
+        archived = 0
+        while True:
+            rows = conn.execute(
+                "SELECT * FROM tasks WHERE status = 'completed' AND finished_at < ? LIMIT ?",
+                (cutoff, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            records = []
+            for row in rows:
+                progress = None
+                if row["progress_updated_at"] is not None:
+                    progress = {
+                        "task_id": row["task_id"],
+                        "message": row["progress_message"],
+                        "percent": row["progress_percent"],
+                        "updated_at": row["progress_updated_at"]
+                    }
+                records.append({
+                    "task_id": row["task_id"],
+                    "type": row["type"],
+                    "status": "completed",
+                    "result": json.loads(row["result"]) if row["result"] else None,
+                    "progress": progress,
+                    "created_at": row["created_at"],
+                    "finished_at": row["finished_at"]
+                })
+            # Index first, delete after: a crash in between only archives a task twice
+            self.archive.append(records)
+            conn.executemany("DELETE FROM tasks WHERE task_id = ?", [(r["task_id"],) for r in records])
+            archived += len(records)
+
+        for path in self.checkpoints_dir.glob("*.jsonl"):
+            task_id = path.name.split(".")[0]
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            if self.get_task_status(task_id) not in ("pending", "processing"):
+                path.unlink(missing_ok=True)
+
+        return archived
+
+    def list_tasks(self, status: str = None, offset: int = 0, limit: int = 50) -> dict:
+        """Lists tasks newest first, optionally filtered by status. Served from the indexes."""
+        conn = self._connect()
+        where, params = ("WHERE status = ?", [status]) if status else ("", [])
+        total = conn.execute(f"SELECT COUNT(*) FROM tasks {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT task_id, type, status, created_at, claimed_at, finished_at, "
+            f"progress_message, progress_percent, progress_updated_at "
+            f"FROM tasks {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+
+        tasks = []
+        for row in rows:
+            progress = None
+            if row["progress_updated_at"] is not None:
+                progress = {
+                    "task_id": row["task_id"],
+                    "message": row["progress_message"],
+                    "percent": row["progress_percent"],
+                    "updated_at": row["progress_updated_at"]
+                }
+            tasks.append({
+                "task_id": row["task_id"],
+                "type": row["type"],
+                "status": row["status"],
+                "created_at": row["created_at"],
+                "claimed_at": row["claimed_at"],
+                "finished_at": row["finished_at"],
+                "progress": progress,
+            })
+        return {"total": total, "offset": offset, "limit": limit, "tasks": tasks}
+
+    def event_dirs(self):
+        """Directories whose file events signal progress or result changes"""
+        return [self.storage_dir]
+
+    def task_id_from_path(self, path: str):
+        # Any write to the database may concern any task
+        if os.path.basename(path).startswith(self.db_name):
+            return ALL_TASKS
+        return None
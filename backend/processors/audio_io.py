@@ -0,0 +1,448 @@
+import json
+import math
+import wave
+import subprocess
+import threading
+from functools import lru_cache
+import numpy as np
+from pydub import AudioSegment
+from pydub.utils import get_prober_name
+
+# Rate and layout Silero VAD works on
+VAD_SAMPLE_RATE = 16000
+# Samples processed at a time by pad_and_normalize
+_GAIN_BLOCK = 65536
+# Rate of pydub's AudioSegment.silent(); chunks padded with it are never exported below this rate
+PADDING_MIN_SAMPLE_RATE = 11025
+# Audio decoded ahead of a seek point so the resampler and lossy decoders have settled there
+SEEK_PREROLL_MS = 1000
+
+_PCM_FORMATS = {
+    np.dtype(np.int16): 's16le',
+    np.dtype(np.int32): 's32le',
+    np.dtype(np.float32): 'f32le',
+}
+
+
+def probe_audio(path):
+    """
+    Reads the format of the first audio stream with ffprobe.
+    Returns a dict with sample_rate, channels, duration (seconds, 0 if unknown), bits and
+    sample_width (bytes per sample pydub would use for this source: 2, or 4 for >16 bit).
+    """
+    command = [get_prober_name(), '-v', 'error', '-select_streams', 'a:0',
+               '-show_entries', 'stream=sample_rate,channels,bits_per_sample,bits_per_raw_sample,sample_fmt,codec_name:format=duration',
+               '-of', 'json', path]
+    output = subprocess.run(command, capture_output=True, check=True).stdout
+    info = json.loads(output.decode('utf-8', 'ignore'))
+    streams = info.get('streams') or []
+    if not streams:
+        raise ValueError(f"No audio stream in {path}")
+    stream = streams[0]
+
+    # Same bit depth pydub picks when it converts the file (see AudioSegment.from_file)
+    bits = 16
+    if stream.get('sample_fmt') not in ('fltp', 'flt', 'dblp', 'dbl'):
+        bits = int(stream.get('bits_per_sample') or stream.get('bits_per_raw_sample') or 16)
+
+    try:
+        duration = float((info.get('format') or {}).get('duration') or 0)
+    except ValueError:
+        duration = 0.0
+
+    return {
+        'sample_rate': int(stream['sample_rate']),
+        'channels': int(stream['channels']),
+        'duration': duration,
+        'sample_width': 2 if bits <= 16 else 4,
+        'bits': bits,
+    }
+
+
+def _ffmpeg_command(path, sample_rate, channels, pcm_format, start=None, duration=None):
+    command = [AudioSegment.converter, '-nostdin', '-v', 'error']
+    if start:
+        # Input seeking: ffmpeg does not decode what comes before start
+        command += ['-ss', f'{start:.6f}']
+    command += ['-i', path]
+    if duration is not None:
+        command += ['-t', f'{duration:.6f}']
+    # rematrix_maxval 1: downmixing averages the channels like pydub's set_channels(1) instead of clipping
+    command += ['-map', '0:a:0', '-vn', '-ar', str(sample_rate), '-ac', str(channels), '-rematrix_maxval', '1',
+                '-f', pcm_format, '-acodec', f'pcm_{pcm_format}', '-']
+    return command
+
+
+def decode_audio(path, sample_rate=None, channels=None, dtype=np.int16, start=None, duration=None, expected_seconds=None):
+    """
+    Decodes path with ffmpeg straight into one preallocated (frames, channels) array.
+    sample_rate/channels: resample/remix to these (default: keep the source's).
+    dtype: int16, int32 or float32 (float samples are in [-1, 1]).
+    start/duration: seconds, to decode only a part of the file.
+    expected_seconds: length hint used to size the buffer; it grows if the hint was short.
+    """
+    dtype = np.dtype(dtype)
+    pcm_format = _PCM_FORMATS[dtype]
+    if sample_rate is None or channels is None:
+        info = probe_audio(path)
+        sample_rate = sample_rate or info['sample_rate']
+        channels = channels or info['channels']
+        if expected_seconds is None:
+            expected_seconds = info['duration']
+
+    if duration is not None:
+        expected_seconds = duration
+    command = _ffmpeg_command(path, sample_rate, channels, pcm_format, start, duration)
+
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        return _read_pcm(process, path, sample_rate, channels, dtype, expected_seconds)
+
+
+def _read_pcm(process, path, sample_rate, channels, dtype, expected_seconds):
+    """Reads the PCM output of an ffmpeg process into one (frames, channels) array"""
+    frame_bytes = dtype.itemsize * channels
+    # One second of slack so a correct hint never needs a resize
+    capacity = max(1, int(((expected_seconds or 0) + 1) * sample_rate))
+    buffer = np.empty(capacity * channels, dtype=dtype)
+    filled = 0
+
+    while True:
+        if filled == buffer.nbytes:
+            buffer.resize(int(buffer.size * 1.5) + sample_rate * channels, refcheck=False)
+        view = memoryview(buffer).cast('B')
+        read = process.stdout.readinto(view[filled:])
+        view.release()
+        if not read:
+            break
+        filled += read
+    error = process.stderr.read()
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {path}: {error.decode('utf-8', 'ignore').strip()}")
+
+    frames = filled // frame_bytes
+    buffer.resize(frames * channels, refcheck=False)
+    return buffer.reshape(frames, channels)
+
+
+def resample_audio(samples, sample_rate, target_rate, channels=1, dtype=np.float32):
+    """
+    Resamples/remixes (frames, channels) samples already in memory with ffmpeg, the same
+    resampler decode_audio uses: a copy in another format without decoding the source again.
+    """
+    dtype = np.dtype(dtype)
+    samples = np.ascontiguousarray(samples)
+    in_format = _PCM_FORMATS[samples.dtype]
+    out_format = _PCM_FORMATS[dtype]
+    command = [AudioSegment.converter, '-v', 'error',
+               '-f', in_format, '-ar', str(sample_rate), '-ac', str(samples.shape[1]), '-i', '-',
+               '-ar', str(target_rate), '-ac', str(channels), '-rematrix_maxval', '1',
+               '-f', out_format, '-acodec', f'pcm_{out_format}', '-']
+
+    with subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+
+        def feed():
+            # Written from another thread so ffmpeg's output never fills up its pipe while we write
+            try:
+                process.stdin.write(memoryview(samples.reshape(-1)).cast('B'))
+            except OSError:
+                # ffmpeg exited early; its error is reported below
+                pass
+            finally:
+                process.stdin.close()
+
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+        try:
+            return _read_pcm(process, 'samples in memory', target_rate, channels, dtype, len(samples) / sample_rate)
+        finally:
+            writer.join()
+
+
+def stream_audio(path, sample_rate, channels=1, dtype=np.float32, block_frames=VAD_SAMPLE_RATE * 60):
+    """
+    Decodes path with ffmpeg and yields it as (frames, channels) arrays of block_frames
+    frames (the last one may be shorter). Only one block is held at a time.
+    """
+    dtype = np.dtype(dtype)
+    frame_bytes = dtype.itemsize * channels
+    command = _ffmpeg_command(path, sample_rate, channels, _PCM_FORMATS[dtype])
+
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        try:
+            while True:
+                block = np.empty(block_frames * channels, dtype=dtype)
+                view = memoryview(block).cast('B')
+                filled = 0
+                while filled < len(view):
+                    read = process.stdout.readinto(view[filled:])
+                    if not read:
+                        break
+                    filled += read
+                view.release()
+                frames = filled // frame_bytes
+                if frames:
+                    yield block[:frames * channels].reshape(frames, channels)
+                if filled < block.nbytes:
+                    break
+        finally:
+            if process.poll() is None:
+                # The consumer stopped early
+                process.kill()
+        error = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {path}: {error.decode('utf-8', 'ignore').strip()}")
+
+
+def export_format(info):
+    """(sample_rate, channels, dtype) chunks of a source probed by probe_audio are written in"""
+    dtype = np.int16 if info['sample_width'] == 2 else np.int32
+    return max(info['sample_rate'], PADDING_MIN_SAMPLE_RATE), info['channels'], dtype
+
+
+def ms_to_frames(ms, sample_rate):
+    return int(ms * sample_rate / 1000.0)
+
+
+def ms_position(samples, sample_rate, ms):
+    """Frame of samples pydub slices at ms: positions are clamped to the length in ms"""
+    return ms_to_frames(min(ms, round(1000 * (len(samples) / sample_rate))), sample_rate)
+
+
+def slice_ms(samples, sample_rate, start_ms, end_ms):
+    """
+    samples[start_ms:end_ms] with pydub's slicing rules: positions are clamped to the
+    length in ms and a tail cut short by that rounding is filled with silence.
+    """
+    start = ms_position(samples, sample_rate, start_ms)
+    end = ms_position(samples, sample_rate, end_ms)
+    chunk = samples[start:end]
+    if len(chunk) < end - start:
+        chunk = np.concatenate([chunk, np.zeros((end - start - len(chunk), samples.shape[1]), dtype=samples.dtype)])
+    return chunk
+
+
+def decode_for_export(path, info, start_ms=None, end_ms=None):
+    """
+    Decodes path (or [start_ms, end_ms) of it) in its export format, with the samples pydub
+    would load: it widens 24-bit audio to 32 bits with the sign in the low byte as well.
+    """
+    if start_ms is not None:
+        sample_rate = export_format(info)[0]
+        return decode_frames(path, info, ms_to_frames(start_ms, sample_rate), ms_to_frames(end_ms, sample_rate))
+    sample_rate, channels, dtype = export_format(info)
+    samples = decode_audio(path, sample_rate, channels, dtype, expected_seconds=info['duration'])
+    if info.get('bits') == 24:
+        samples[samples < 0] |= 0xFF
+    return samples
+
+
+def decode_frames(path, info, start, end):
+    """
+    Frames [start, end) of path in its export format: the samples a whole-file decode_for_export
+    has there (fewer if the file ends first). Decoding starts up to SEEK_PREROLL_MS earlier, at a
+    time where source and output samples line up, and the lead-in is dropped.
+    """
+    sample_rate, channels, dtype = export_format(info)
+    # Source and output samples coincide every period_ms (a whole number of ms, so -ss is exact)
+    period_ms = 1000 // math.gcd(math.gcd(info['sample_rate'], sample_rate), 1000)
+    lead_ms = max(0, (start * 1000 // sample_rate - SEEK_PREROLL_MS) // period_ms * period_ms)
+    lead = lead_ms * sample_rate // 1000
+    # A little extra so rounding of the duration never cuts the last frame
+    duration = (end - lead) / sample_rate + 0.01
+    samples = decode_audio(path, sample_rate, channels, dtype, start=lead_ms / 1000, duration=duration)[start - lead:end - lead]
+    if info.get('bits') == 24:
+        samples[samples < 0] |= 0xFF
+    return samples
+
+
+class ExportStream:
+    """
+    A source decoded front to back in its export format by one ffmpeg process, for cutting chunks
+    requested in increasing order: frames(start, end) are the samples a whole-file decode_for_export
+    has there (fewer if the file ends first). Only the decoded frames from the start of the last
+    requested chunk on are held, a block of block_seconds at a time.
+    """
+
+    def __init__(self, path, info, block_seconds=10):
+        self.sample_rate, channels, dtype = export_format(info)
+        self._widen_24bit = info.get('bits') == 24
+        self._blocks = stream_audio(path, self.sample_rate, channels, dtype, block_frames=int(block_seconds * self.sample_rate))
+        self._buffer = np.empty((0, channels), dtype=dtype)
+        # Frame of the source _buffer starts at
+        self._offset = 0
+        self._ended = False
+
+    def _drop_before(self, start):
+        drop = min(start - self._offset, len(self._buffer))
+        self._buffer = self._buffer[drop:]
+        self._offset += drop
+
+    def frames(self, start, end):
+        if start < self._offset:
+            raise ValueError(f"Frame {start} was already passed (the stream is at {self._offset})")
+        while not self._ended and self._offset + len(self._buffer) < end:
+            try:
+                block = next(self._blocks)
+            except StopIteration:
+                self._ended = True
+                break
+            if self._widen_24bit:
+                block[block < 0] |= 0xFF
+            self._drop_before(start)
+            self._buffer = np.concatenate([self._buffer, block]) if len(self._buffer) else block
+        self._drop_before(start)
+        return self._buffer[start - self._offset:end - self._offset].copy()
+
+    def frames_ms(self, start_ms, end_ms):
+        """Frames of [start_ms, end_ms), as decode_for_export(path, info, start_ms, end_ms)"""
+        return self.frames(ms_to_frames(start_ms, self.sample_rate), ms_to_frames(end_ms, self.sample_rate))
+
+    def close(self):
+        # Stops ffmpeg if the source was not read to the end
+        self._blocks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _ms_energies(samples, sample_rate, length_ms):
+    """
+    Sum of squared samples of every millisecond of samples, as pydub slices them
+    (frames past the end count as silence). int64 for int16 input, so sums are exact.
+    """
+    flat_dtype = np.int64 if samples.dtype.itemsize <= 2 else np.float64
+    bounds = (np.arange(length_ms + 1) * (sample_rate / 1000.0)).astype(np.int64)
+    energies = np.zeros(length_ms, dtype=flat_dtype)
+    # A minute of audio at a time, so only that much is ever widened
+    step = 60000
+    for k in range(0, length_ms, step):
+        ms = min(step, length_ms - k)
+        block = samples[bounds[k]:bounds[k + ms]].astype(flat_dtype)
+        if not len(block):
+            break
+        squares = np.einsum('ij,ij->i', block, block)
+        starts = bounds[k:k + ms] - bounds[k]
+        starts = starts[starts < len(squares)]
+        energies[k:k + len(starts)] = np.add.reduceat(squares, starts)
+    return energies, bounds
+
+
+def detect_nonsilent(samples, sample_rate, min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    """
+    pydub.silence.detect_nonsilent over a (frames, channels) int16/int32 array: the same
+    [start, end] ms ranges, with every window's rms (as audioop.rms) taken from a running
+    sum of per-millisecond energies instead of slicing the audio once per window.
+    """
+    length_ms = round(1000 * (len(samples) / sample_rate))
+    if length_ms < min_silence_len:
+        return [[0, length_ms]]
+
+    max_amplitude = float(2 ** (samples.dtype.itemsize * 8) / 2)
+    threshold = 10 ** (silence_thresh / 20) * max_amplitude
+
+    energies, bounds = _ms_energies(samples, sample_rate, length_ms)
+    running = np.concatenate([np.zeros(1, dtype=energies.dtype), np.cumsum(energies)])
+    last_start = length_ms - min_silence_len
+    starts = np.arange(0, last_start + 1, seek_step)
+    if last_start % seek_step:
+        starts = np.append(starts, last_start)
+    counts = (bounds[starts + min_silence_len] - bounds[starts]) * samples.shape[1]
+    sums = (running[starts + min_silence_len] - running[starts]).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rms = np.where(counts > 0, np.floor(np.sqrt(sums / np.maximum(counts, 1))), 0)
+    silence_starts = starts[rms <= threshold]
+    if not len(silence_starts):
+        return [[0, length_ms]]
+
+    # Join silent windows into ranges the way detect_silence does
+    gaps = np.diff(silence_starts)
+    breaks = np.flatnonzero((gaps != seek_step) & (gaps > min_silence_len))
+    range_starts = np.concatenate([silence_starts[:1], silence_starts[breaks + 1]])
+    range_ends = np.concatenate([silence_starts[breaks], silence_starts[-1:]]) + min_silence_len
+    silent_ranges = list(zip(range_starts.tolist(), range_ends.tolist()))
+
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == length_ms:
+        return []
+    nonsilent_ranges = []
+    prev_end = 0
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([prev_end, start])
+        prev_end = end
+    if prev_end != length_ms:
+        nonsilent_ranges.append([prev_end, length_ms])
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+    return nonsilent_ranges
+
+
+@lru_cache(maxsize=None)
+def padding_frames(sample_rate, pad_ms=50):
+    """Length of AudioSegment.silent(pad_ms) once pydub has converted it to sample_rate"""
+    return len(AudioSegment.silent(duration=pad_ms).set_frame_rate(sample_rate).raw_data) // 2
+
+
+def normalization_gain(samples, sample_rate, target_dBFS=-20.0, pad_ms=50):
+    """
+    Factor pad_and_normalize multiplies samples by (rms as audioop.rms over the padded chunk),
+    or None for digital silence, which has no dBFS to match (pydub cannot normalize it either).
+    """
+    pad = padding_frames(sample_rate, pad_ms)
+    source = np.ascontiguousarray(samples).reshape(-1)
+    # Worked through in cache-sized float64 blocks: exact for int16, and no full-size temporaries
+    block = np.empty(min(_GAIN_BLOCK, max(1, source.size)), dtype=np.float64)
+    sum_squares = 0.0
+    for i in range(0, source.size, _GAIN_BLOCK):
+        values = block[:len(source[i:i + _GAIN_BLOCK])]
+        np.copyto(values, source[i:i + _GAIN_BLOCK])
+        sum_squares += float(np.dot(values, values))
+    rms = int(math.sqrt(sum_squares / (source.size + 2 * pad * samples.shape[1])))
+    if not rms:
+        return None
+    dBFS = 20 * math.log(rms / float(-int(np.iinfo(samples.dtype).min)), 10)
+    return 10 ** ((target_dBFS - dBFS) / 20)
+
+
+def pad_and_normalize(samples, sample_rate, target_dBFS=-20.0, pad_ms=50, gain=False):
+    """
+    The samples of silent(pad_ms) + chunk + silent(pad_ms) with the gain that brings it to
+    target_dBFS, as pydub computes them (rms as audioop.rms, gain as audioop.mul: clipped,
+    then floored), in one float64 pass over a (frames, channels) int16/int32 array.
+    gain: a factor from normalization_gain to apply instead of computing it again.
+    """
+    pad = padding_frames(sample_rate, pad_ms)
+    frames, channels = samples.shape
+    limits = np.iinfo(samples.dtype)
+    output = np.zeros((frames + 2 * pad, channels), dtype=samples.dtype)
+    source = np.ascontiguousarray(samples).reshape(-1)
+    target = output[pad:pad + frames].reshape(-1)
+
+    if gain is False:
+        gain = normalization_gain(samples, sample_rate, target_dBFS, pad_ms)
+    if gain is None:
+        target[:] = source
+        return output
+
+    block = np.empty(min(_GAIN_BLOCK, max(1, source.size)), dtype=np.float64)
+    for i in range(0, source.size, _GAIN_BLOCK):
+        values = block[:len(source[i:i + _GAIN_BLOCK])]
+        np.multiply(source[i:i + _GAIN_BLOCK], gain, out=values)
+        np.clip(values, limits.min, limits.max, out=values)
+        np.floor(values, out=values)
+        target[i:i + _GAIN_BLOCK] = values
+    return output
+
+
+def write_wav(path, samples, sample_rate):
+    """
+    Writes (frames, channels) int16/int32 samples as PCM WAV, byte for byte like pydub's wav export.
+    path may also be a writable binary file object.
+    """
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(samples.shape[1])
+        f.setsampwidth(samples.dtype.itemsize)
+        f.setframerate(sample_rate)
+        f.setnframes(len(samples))
+        f.writeframesraw(np.ascontiguousarray(samples).data)
@@ -1,14 +1,65 @@
 import os
+import bisect
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 import pandas as pd
-from pydub import AudioSegment
 from tqdm import tqdm
-import torch
 import numpy as np
 import warnings
+from contextlib import nullcontext
+from backend.processors.audio_io import (VAD_SAMPLE_RATE, probe_audio, decode_audio, stream_audio, export_format,
+                                        decode_for_export, ExportStream, ms_to_frames, ms_position, slice_ms, pad_and_normalize,
+                                        normalization_gain, write_wav, detect_nonsilent)
+from backend.processors.split_manifest import MANIFEST_NAME, SplitManifest, SpeechCache, content_hash
+from backend.processors.virtual_chunks import VirtualChunks
+from backend.processors.vad import (VAD_FRAME_SAMPLES, MERGE_GAP_MS, SpeechSegmenter, ChunkMerger, TorchSileroEngine,
+                                    merge_speech_chunks, load_vad_engine, find_silero_jit)
+
+try:
+    import torch
+except ImportError:
+    # Not needed with the ONNX Runtime VAD backend
+    torch = None
 
 # Filter warnings from torch/silero
 warnings.filterwarnings("ignore")
 
+# Files longer than this are split with the windowed VAD unless streaming_vad says otherwise
+STREAMING_VAD_MIN_SECONDS = 3600
+# Audio (seconds) decoded for one batched VAD call; at 16 kHz float32 this is ~110 MB
+VAD_BATCH_MAX_SECONDS = 1800
+# Silero settings used for every file
+# UPDATED: threshold 0.4 -> 0.5 (Stricter), min_silence 300 -> 100 (Find more pauses)
+VAD_THRESHOLD = 0.5
+VAD_MIN_SILENCE_MS = 100
+# Settings a sweep varies
+SWEEP_PARAMS = ('min_audio_len', 'max_audio_len', 'merge_gap_ms')
+# Chunks per I/O thread that may wait to be written before exporting blocks
+PENDING_CHUNKS_PER_THREAD = 4
+
+
+# Splitter of the current pool process, set up once by _init_split_worker
+_pool_splitter = None
+
+
+def _init_split_worker(splitter, threads):
+    """Process pool initializer: limits the process to its share of the cores and loads the VAD once"""
+    global _pool_splitter
+    if torch is not None:
+        torch.set_num_threads(threads)
+    try:
+        splitter.vad = load_vad_engine(splitter.vad_backend, num_threads=threads)
+    except Exception as e:
+        print(f"Error loading Silero VAD: {e}")
+        splitter.vad = None
+    _pool_splitter = splitter
+
+
+def _split_in_worker(filenames):
+    return _pool_splitter.split_audio_batch(filenames)
+
+
 class AudioSplitter:
     
     def __init__(self,
@@ -21,36 +72,58 @@ class AudioSplitter:
                  silence_thresh=None, # Deprecated/Not used in VAD directly
                  min_audio_len=2000, # 2 seconds
                  max_audio_len=25000, # 25 seconds
+                 merge_gap_ms=MERGE_GAP_MS, # Speech segments closer than this are joined into one chunk
                  output_splitted_audio_dir='./audios/splitted_audios',
                  output_audio_dir='./audios',
                  output_csv_dir='./datasets_csv/audio_datasets',
                  conditional_function=None,
-                 progress_callback=None
+                 progress_callback=None,
+                 vad_model=None, # Optional preloaded engine from load_vad_engine (or (model, get_speech_timestamps) from load_silero_vad)
+                 vad_backend=None, # 'onnx', 'torch' or None (auto) when the VAD is loaded here
+                 vad_batch_size=8, # Files whose VAD frames are scored together in one batched model call (up to VAD_BATCH_MAX_SECONDS of audio)
+                 num_workers=1, # Processes splitting files in parallel
+                 streaming_vad=None, # Windowed VAD with bounded memory: True, False, or None for files over an hour
+                 vad_window_seconds=300, # Audio decoded and scored at a time by the windowed VAD
+                 vad_cache_dir=None, # Where VAD speech timestamps are kept for re-splitting (default: <output_audio_dir>/_vad_cache)
+                 virtual_chunks=False, # Only index chunks (source, frames, gain) instead of writing WAV files
+                 layout='sharded', # Chunk files in <output>/<source>/ ('sharded') or all in the output folder ('flat')
+                 io_threads=2 # Threads decoding ahead and writing chunks while the current file is processed (0: one thread)
                 ):
         self.audio_name = audio_name
         self.channel_name = channel_name
         self.output_csv_name = output_csv_name
         self.min_audio_len = min_audio_len
         self.max_audio_len = max_audio_len
+        self.merge_gap_ms = merge_gap_ms
         self.output_splitted_audio_dir = output_splitted_audio_dir
         self.output_audio_dir = output_audio_dir
         self.output_csv_dir = output_csv_dir
         self.conditional_function = conditional_function
         self.progress_callback = progress_callback
+        self.num_workers = max(1, int(num_workers or 1))
+        self.streaming_vad = streaming_vad
+        self.vad_window_seconds = vad_window_seconds
+        self.vad_backend = vad_backend
+        self.vad_batch_size = max(1, int(vad_batch_size or 1))
+        if layout not in ('sharded', 'flat'):
+            raise ValueError(f"Unknown chunk layout: {layout}")
+        self.layout = layout
+        self.io_threads = max(0, int(io_threads or 0))
+        self._input_listing = None
         
-        # Load VAD model once
-        try:
-            print("Loading Silero VAD model...")
-            self.model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad',
-                                             model='silero_vad',
-                                             force_reload=False,
-                                             trust_repo=True,
-                                             verbose=False)
-            self.get_speech_timestamps = utils[0]
-            print("Silero VAD model loaded successfully.")
-        except Exception as e:
-            print(f"Error loading Silero VAD: {e}")
-            self.model = None
+        # Load VAD model once (unless the caller already holds one)
+        if isinstance(vad_model, tuple):
+            self.vad = TorchSileroEngine(vad_model[0], find_silero_jit())
+        elif vad_model is not None:
+            self.vad = vad_model
+        else:
+            try:
+                print("Loading Silero VAD model...")
+                self.vad = load_vad_engine(vad_backend)
+                print("Silero VAD model loaded successfully.")
+            except Exception as e:
+                print(f"Error loading Silero VAD: {e}")
+                self.vad = None
 
         if csv_path:
             self.df = pd.read_csv(csv_path, encoding='utf-8-sig')
@@ -84,264 +157,677 @@ class AudioSplitter:
         else:
              raise ValueError("Either csv_path or input_audio_folder must be provided")
 
+        # Which sources this output folder already holds chunks of, read once
+        self.manifest = SplitManifest(os.path.join(self.output_splitted_audio_dir, MANIFEST_NAME))
+        # Next to the downloaded audio, never inside a user's input folder
+        self.speech_cache = SpeechCache(vad_cache_dir or os.path.join(output_audio_dir, '_vad_cache'))
+        # Read on demand through VirtualChunks; written out as files only when the dataset is packaged
+        self.virtual = VirtualChunks(self.output_splitted_audio_dir) if virtual_chunks else None
+
+
+    def __getstate__(self):
+        # Sent to the pool processes: they load their own model and report progress through the parent
+        state = self.__dict__.copy()
+        for key in ('vad', 'progress_callback', 'df', 'manifest'):
+            state.pop(key, None)
+        # Each process lists the input folder itself when it first needs to
+        state['_input_listing'] = None
+        return state
+
 
     def _conditional_function_caller(self, func):
         return func()
 
     
-    def _match_target_amplitude(self, aChunk, target_dBFS):
-        change_in_dBFS = target_dBFS - aChunk.dBFS
-        return aChunk.apply_gain(change_in_dBFS)
+    def _use_streaming_vad(self, info):
+        if self.streaming_vad is None:
+            return info['duration'] > STREAMING_VAD_MIN_SECONDS
+        return self.streaming_vad
 
 
-    def split_audio(self, filename):
-        # Allow format auto-detection or fallback
-        file_path_wav = os.path.join(self.output_audio_dir, filename+'.wav')
-        file_path_mp3 = os.path.join(self.output_audio_dir, filename+'.mp3')
-        
-        file_path = None
-        if os.path.exists(file_path_wav):
-            file_path = file_path_wav
-        elif os.path.exists(file_path_mp3):
-            file_path = file_path_mp3
+    def _speech_to_ms(self, segments):
+        # Map 16k timestamps back to original audio ms
+        return [(int(start / 16000 * 1000), int(end / 16000 * 1000)) for start, end in segments]
+
+
+    def _new_segmenter(self):
+        return SpeechSegmenter(threshold=VAD_THRESHOLD, min_silence_duration_ms=VAD_MIN_SILENCE_MS)
+
+
+    def _speech_cache_key(self, file_path):
+        """(content hash, VAD version, settings) the speech segments of file_path are cached under, or None"""
+        version = getattr(self.vad, 'version', None)
+        if not version:
+            return None
+        try:
+            source_hash = content_hash(file_path)
+        except OSError:
+            return None
+        return source_hash, version, {'threshold': VAD_THRESHOLD, 'min_silence_ms': VAD_MIN_SILENCE_MS}
+
+
+    def _decode_for_vad(self, file_path, info):
+        try:
+            # Decode for VAD (16k, mono, float32) directly with ffmpeg, no full-rate copy
+            return decode_audio(file_path, VAD_SAMPLE_RATE, 1, np.float32, expected_seconds=info['duration'])[:, 0]
+        except Exception as e:
+            print(f"VAD processing failed: {e}. Falling back to pydub.")
+            return None
+
+
+    def _batch_speech_segments(self, sources, io_pool=None):
+        """
+        Speech segments (ms) of whole files, with the frames of all of them scored in batched
+        VAD calls. sources: (file_path, info) pairs. A file that cannot be decoded gets None.
+        io_pool: thread pool the files are decoded in side by side (ffmpeg runs in its own processes).
+        """
+        if io_pool is not None:
+            samples_list = list(io_pool.map(lambda source: self._decode_for_vad(*source), sources))
         else:
+            samples_list = [self._decode_for_vad(file_path, info) for file_path, info in sources]
+
+        decoded = [samples for samples in samples_list if samples is not None and len(samples)]
+        probabilities = iter(self.vad.batch_frame_probabilities(decoded)) if decoded else iter(())
+
+        speech = []
+        for samples in samples_list:
+            if samples is None:
+                speech.append(None)
+            elif not len(samples):
+                # Handle empty audio
+                speech.append([])
+            else:
+                segmenter = self._new_segmenter()
+                segments = segmenter.push(next(probabilities)) + segmenter.finish(len(samples))
+                print(f"DEBUG: VAD found {len(segments)} speech attributes.")
+                speech.append(self._speech_to_ms(segments))
+        return speech
+
+
+    def _streaming_vad_chunk_ranges(self, file_path, speech_ms=None):
+        """
+        Chunk ranges (ms) of a file, yielded as soon as they are final.
+        speech_ms: list the raw speech segments (ms) are appended to, if given.
+        The file is decoded and scored one window at a time. The model keeps its context and
+        the segmenter its open speech segment across window edges, so the result matches a
+        single pass while memory stays bounded by the window size.
+        """
+        self.vad.reset()
+        segmenter = self._new_segmenter()
+        merger = ChunkMerger(self.min_audio_len, self.max_audio_len, self.merge_gap_ms)
+        window_frames = max(1, int(self.vad_window_seconds * VAD_SAMPLE_RATE) // VAD_FRAME_SAMPLES) * VAD_FRAME_SAMPLES
+
+        def merged(segments):
+            for start, end in self._speech_to_ms(segments):
+                if speech_ms is not None:
+                    speech_ms.append((start, end))
+                yield from merger.push(start, end)
+
+        total_samples = 0
+        for window in stream_audio(file_path, VAD_SAMPLE_RATE, 1, np.float32, window_frames):
+            samples = window[:, 0]
+            total_samples += len(samples)
+            yield from merged(segmenter.push(self.vad.frame_probabilities(samples)))
+        yield from merged(segmenter.finish(total_samples))
+        yield from merger.finish()
+
+
+    def _silence_chunk_ranges(self, audio, sample_rate):
+        """Chunk ranges (ms) from energy-based silence detection, for when VAD is unavailable"""
+        nonsilent_ranges = detect_nonsilent(audio, sample_rate, min_silence_len=500, silence_thresh=-40)
+        chunk_ranges = []
+        for start_i, end_i in nonsilent_ranges:
+            if end_i - start_i >= self.min_audio_len:
+                 # Basic max len splitting for fallback
+                for i in range(start_i, end_i, self.max_audio_len):
+                    sub_end = min(i + self.max_audio_len, end_i)
+                    if sub_end - i >= self.min_audio_len:
+                        chunk_ranges.append((i, sub_end))
+        return chunk_ranges
+
+
+    def chunk_file(self, filename, chunk_name):
+        """Path of a chunk file relative to the output folder ('/'-separated, as in the manifest)"""
+        if self.layout == 'sharded':
+            return f"{filename}/{chunk_name}.wav"
+        return chunk_name + '.wav'
+
+
+    def chunk_path(self, filename, chunk_name):
+        return os.path.join(self.output_splitted_audio_dir, *self.chunk_file(filename, chunk_name).split('/'))
+
+
+    def _export_chunk(self, chunk, sample_rate, filename, chunk_idx):
+        """Pads with 50 ms of silence, normalizes to -20 dBFS and writes one chunk. Returns the chunk name."""
+        new_filename = filename+f'_v2_chunk_{chunk_idx}'
+        path = self.chunk_path(filename, new_filename)
+        write_wav(path, pad_and_normalize(chunk, sample_rate, -20.0), sample_rate)
+        return new_filename
+
+
+    def _record(self, filename, source_hash, chunks, originals):
+        """Adds a split source and its chunk files to the manifest"""
+        files = None if self.virtual is not None else [self.chunk_file(filename, name) for name in chunks]
+        self.manifest.record(filename, source_hash, self._split_params(), chunks, originals, files)
+
+
+    def _virtual_chunk(self, chunk, sample_rate, filename, chunk_idx, file_path, info, start):
+        """Index entry of a chunk that is not written: its frames in the source and the gain normalizing it"""
+        return {
+            'name': filename+f'_v2_chunk_{chunk_idx}',
+            'source': file_path,
+            'start': start,
+            'end': start + len(chunk),
+            'sample_rate': sample_rate,
+            'info': {key: info.get(key) for key in ('sample_rate', 'channels', 'sample_width', 'bits', 'duration')},
+            'gain': normalization_gain(chunk, sample_rate, -20.0),
+        }
+
+
+    def _input_files(self, refresh=False):
+        """Sorted names in the input folder, listed once (again on refresh, for files added since)"""
+        if self._input_listing is None or refresh:
+            names = sorted(os.listdir(self.output_audio_dir)) if os.path.isdir(self.output_audio_dir) else []
+            self._input_listing = (names, set(names))
+        return self._input_listing
+
+
+    def _find_audio_file(self, filename):
+        # Allow format auto-detection or fallback. The exact names are looked up on disk as well,
+        # so a file added since the listing is never passed over for an older one with a longer name
+        _, name_set = self._input_files()
+        for candidate in (filename+'.wav', filename+'.mp3'):
+            file_path = os.path.join(self.output_audio_dir, candidate)
+            if candidate in name_set or os.path.exists(file_path):
+                return file_path
+        for refresh in (False, True):
+            names, _ = self._input_files(refresh)
             # Try finding without extension if user passed full name or other extension
-            possible_files = [f for f in os.listdir(self.output_audio_dir) if f.startswith(filename)]
-            if possible_files:
-                file_path = os.path.join(self.output_audio_dir, possible_files[0])
-        
-        if not file_path:
-            print(f"DEBUG: Could not find audio file for {filename}")
+            i = bisect.bisect_left(names, filename)
+            if i < len(names) and names[i].startswith(filename):
+                return os.path.join(self.output_audio_dir, names[i])
+        return None
+
+
+    def _source_hash(self, filename):
+        file_path = self._find_audio_file(filename)
+        try:
+            return content_hash(file_path) if file_path else None
+        except OSError:
+            return None
+
+
+    def _split_params(self):
+        """Settings a manifest entry is only reused with"""
+        params = {'min_audio_len': self.min_audio_len, 'max_audio_len': self.max_audio_len,
+                  'vad_threshold': VAD_THRESHOLD, 'vad_min_silence_ms': VAD_MIN_SILENCE_MS}
+        if self.merge_gap_ms != MERGE_GAP_MS:
+            # Only recorded when changed, so manifests written before it was configurable stay valid
+            params['merge_gap_ms'] = self.merge_gap_ms
+        # Likewise the output mode: a source split into virtual chunks has no files for a normal split to reuse
+        if self.virtual is not None:
+            params['virtual_chunks'] = True
+        if self.layout != 'sharded':
+            params['layout'] = self.layout
+        return params
+
+
+    def _legacy_chunks(self):
+        """Chunks per source found in the output folder, from one listing"""
+        chunks = {}
+        for name in os.listdir(self.output_splitted_audio_dir):
+            stem, ext = os.path.splitext(name)
+            if ext == '.wav' and '_v2_chunk_' in stem:
+                source, _, index = stem.rpartition('_v2_chunk_')
+                if index.isdigit():
+                    chunks.setdefault(source, []).append((int(index), stem))
+        # Only sources whose first chunk exists count as processed, as before
+        return {source: [stem for _, stem in sorted(found)] for source, found in chunks.items() if min(found)[0] == 0}
+
+
+    def split_audio(self, filename):
+        split = self.split_audio_batch([filename])[0]
+        if split is None:
             return [], []
+        splitted_audio_lst, original_audio_lst = split
+        source_hash = self._source_hash(filename)
+        if source_hash:
+            # Also a source without chunks, so it is not decoded again on resume
+            self._record(filename, source_hash, splitted_audio_lst, original_audio_lst)
+        return splitted_audio_lst, original_audio_lst
+
+
+    def _probe_sources(self, filenames):
+        """(index, filename, file_path, info) of each of filenames that can be found and probed"""
+        sources = []
+        for i, filename in enumerate(filenames):
+            file_path = self._find_audio_file(filename)
+            if not file_path:
+                print(f"DEBUG: Could not find audio file for {filename}")
+                continue
+            print(f"DEBUG: Processing file: {file_path}")
+            try:
+                info = probe_audio(file_path)
+            except Exception as e:
+                 print(f"DEBUG: Failed to load audio file {file_path}: {e}")
+                 continue
+            sources.append((i, filename, file_path, info))
+        return sources
+
 
-        print(f"DEBUG: Processing file: {file_path}")
+    def _known_speech(self, sources, io_pool=None):
+        """
+        Speech segments (ms) by source index for the sources that are cached or short enough
+        for the batched VAD pass, plus the cache key of every source.
+        """
+        # Speech found by an earlier run needs no decode or VAD pass, only a new merge
+        speech = {}
+        cache_keys = {}
+        if self.vad:
+            for i, _, file_path, _ in sources:
+                cache_keys[i] = self._speech_cache_key(file_path)
+                if cache_keys[i] is not None:
+                    cached = self.speech_cache.get(*cache_keys[i])
+                    if cached is not None:
+                        speech[i] = cached
+
+        # Long files are scored window by window while their chunks are exported
+        batched = [source for source in sources if self.vad and source[0] not in speech and not self._use_streaming_vad(source[3])]
+        for group in self._vad_groups(batched):
+            try:
+                for source, segments in zip(group, self._batch_speech_segments([(file_path, info) for _, _, file_path, info in group], io_pool)):
+                    speech[source[0]] = segments
+                    if segments is not None and cache_keys.get(source[0]) is not None:
+                        self.speech_cache.put(*cache_keys[source[0]], segments)
+            except Exception as e:
+                print(f"VAD processing failed: {e}. Falling back to pydub.")
+        return speech, cache_keys
+
+
+    @staticmethod
+    def _vad_groups(sources):
+        """
+        sources in groups decoded for VAD together, each at most VAD_BATCH_MAX_SECONDS of audio
+        (a longer file goes on its own), so a batch never holds many long files at once.
+        """
+        groups = []
+        seconds = 0.0
+        for source in sources:
+            duration = source[3]['duration']
+            if not groups or seconds + duration > VAD_BATCH_MAX_SECONDS:
+                groups.append([])
+                seconds = 0.0
+            groups[-1].append(source)
+            seconds += duration
+        return groups
+
+
+    def _io_pool(self):
+        """Thread pool decoding ahead and writing chunks, or None when io_threads is 0"""
+        if not self.io_threads:
+            return None
+        return ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix='split-io')
+
+
+    def split_audio_batch(self, filenames):
+        """
+        Splits several files, scoring the VAD frames of those split in one pass together in batched calls.
+        Returns a (splitted_audio_name_lst, original_audio_name_lst) pair per filename, or None
+        for a file that could not be found or decoded.
+        With io_threads, the files are decoded side by side for VAD, the next file is decoded
+        for export while the current one is processed, and chunks are written in the background.
+        """
+        results = [None] * len(filenames)
+        sources = self._probe_sources(filenames)
+        with self._io_pool() or nullcontext() as io_pool:
+
+            def prefetch(k):
+                # Only files that are decoded whole; long files are read chunk by chunk
+                if io_pool is None or k >= len(sources):
+                    return None
+                _, _, file_path, info = sources[k]
+                if self.vad and self._use_streaming_vad(info):
+                    return None
+                return io_pool.submit(decode_for_export, file_path, info)
+
+            # The first file is decoded for export during the VAD pass
+            audio = prefetch(0)
+            speech, cache_keys = self._known_speech(sources, io_pool)
+            for k, (i, filename, file_path, info) in enumerate(sources):
+                next_audio = prefetch(k + 1)
+                results[i] = self._split_source(filename, file_path, info, speech.get(i), cache_keys.get(i), audio, io_pool)
+                audio = next_audio
+        return results
+
+
+    def _sweep_params(self, params):
+        """One parameter set of a sweep with this splitter's values filled in"""
+        if not isinstance(params, dict):
+            raise ValueError(f"A parameter set must be a dict, got {params!r}")
+        unknown = set(params) - set(SWEEP_PARAMS)
+        if unknown:
+            raise ValueError(f"Unknown split setting(s): {', '.join(sorted(map(str, unknown)))}")
+        swept = {}
+        for key in SWEEP_PARAMS:
+            value = params.get(key, getattr(self, key))
+            if isinstance(value, bool) or not isinstance(value, (int, float, np.integer, np.floating)) or not float(value).is_integer() or value < 0:
+                raise ValueError(f"{key} must be a non-negative whole number of ms, got {value!r}")
+            swept[key] = int(value)
+        return swept
+
+
+    def sweep(self, param_sets, histogram_bins=None):
+        """
+        Chunk statistics of splitting every file of the dataset with each of param_sets
+        (dicts of min_audio_len, max_audio_len, merge_gap_ms; missing keys keep this splitter's values).
+        VAD runs once per file (or not at all when its speech is cached), no audio is written.
+        histogram_bins: chunk duration bin edges in seconds, or a number of equal bins
+        (default: 1 s bins up to the largest max_audio_len).
+        """
+        param_sets = [self._sweep_params(params) for params in param_sets]
+        if not param_sets:
+            raise ValueError("No parameter sets to sweep")
+        if not self.vad:
+            raise RuntimeError("Sweeping split settings needs the Silero VAD")
+        longest = max(params['max_audio_len'] for params in param_sets) // 1000 + 1
+        if histogram_bins is None:
+            histogram_bins = range(0, longest + 1)
+        elif isinstance(histogram_bins, (int, np.integer)) and not isinstance(histogram_bins, bool):
+            # A bin count: that many equal bins up to the largest max_audio_len
+            if histogram_bins < 1:
+                raise ValueError(f"histogram_bins must be at least 1, got {histogram_bins}")
+            histogram_bins = np.linspace(0, longest, histogram_bins + 1)
+        elif isinstance(histogram_bins, (str, bytes, dict)) or not hasattr(histogram_bins, '__len__'):
+            raise ValueError(f"histogram_bins must be a bin count or a list of bin edges, got {histogram_bins!r}")
         try:
-            audio = AudioSegment.from_file(file_path)
-        except Exception as e:
-             print(f"DEBUG: Failed to load audio file {file_path}: {e}")
-             return [], []
-        
+            histogram_bins = np.asarray(histogram_bins, dtype=np.float64)
+        except (TypeError, ValueError):
+            raise ValueError(f"histogram_bins must be a bin count or a list of bin edges, got {histogram_bins!r}")
+        if histogram_bins.ndim != 1 or len(histogram_bins) < 2 or np.any(np.diff(histogram_bins) <= 0):
+            raise ValueError("histogram_bins must hold at least two increasing bin edges")
+
+        filenames = [row['audio_filename'] for _, row in self.df.iterrows() if 'audio_filename' in row and pd.notna(row['audio_filename'])]
+        file_speech = []
+        without_speech = 0
+        for start in range(0, len(filenames), self.vad_batch_size):
+            sources = self._probe_sources(filenames[start:start + self.vad_batch_size])
+            with self._io_pool() or nullcontext() as io_pool:
+                speech, cache_keys = self._known_speech(sources, io_pool)
+            for i, _, file_path, info in sources:
+                if i not in speech and self._use_streaming_vad(info):
+                    found_speech = []
+                    try:
+                        for _ in self._streaming_vad_chunk_ranges(file_path, found_speech):
+                            pass
+                    except Exception as e:
+                        print(f"VAD processing failed: {e}")
+                        continue
+                    speech[i] = found_speech
+                    if cache_keys.get(i) is not None:
+                        self.speech_cache.put(*cache_keys[i], found_speech)
+                if speech.get(i):
+                    file_speech.append(speech[i])
+                else:
+                    # Would be split by silence detection instead
+                    without_speech += 1
+            done = min(start + self.vad_batch_size, len(filenames))
+            if self.progress_callback:
+                self.progress_callback(f"Running VAD... {done}/{len(filenames)}", int(done / len(filenames) * 100))
+
+        results = []
+        for params in param_sets:
+            durations = np.asarray([end - start for segments in file_speech
+                                    for start, end in merge_speech_chunks(segments, params['min_audio_len'], params['max_audio_len'], params['merge_gap_ms'])],
+                                   dtype=np.float64) / 1000
+            counts, edges = np.histogram(durations, bins=histogram_bins)
+            results.append({
+                'params': params,
+                'chunks': int(len(durations)),
+                'kept_hours': round(float(durations.sum()) / 3600, 4),
+                'mean_seconds': round(float(durations.mean()), 3) if len(durations) else 0.0,
+                'histogram': [{'start': float(edges[k]), 'end': float(edges[k + 1]), 'count': int(count)} for k, count in enumerate(counts)],
+            })
+
+        speech_seconds = sum(end - start for segments in file_speech for start, end in segments) / 1000
+        return {
+            'files': len(filenames),
+            'files_without_speech': without_speech,
+            'speech_hours': round(speech_seconds / 3600, 4),
+            'results': results,
+        }
+
+
+    def _split_source(self, filename, file_path, info, speech_ms=None, cache_key=None, prefetched=None, io_pool=None):
+        """
+        Exports the chunks of one file (None if it cannot be decoded). speech_ms: its VAD speech segments, if already known.
+        cache_key: where speech segments found here are cached (see _speech_cache_key).
+        prefetched: future of the file decoded by decode_for_export, if already started.
+        io_pool: thread pool the chunks are written in, at most PENDING_CHUNKS_PER_THREAD per thread queued.
+        """
+        original_audio_name_lst = []
+        # Chunk names (virtual chunk entries), or futures of them while they are written
+        exported = []
+        pending = deque()
         chunks = []
+        chunk_dir = self.output_splitted_audio_dir if self.layout == 'flat' else os.path.join(self.output_splitted_audio_dir, filename)
+        # Chunks are written in the source's rate and layout, sliced from one decoded buffer
+        sample_rate = export_format(info)[0]
+        audio = None
+
+        def load_audio():
+            if prefetched is not None:
+                return prefetched.result()
+            return decode_for_export(file_path, info)
+
+        def export(chunk, start):
+            # start: first frame of the chunk in the source, at the export rate
+            chunk_idx = len(exported)
+            if self.virtual is None:
+                if chunk_idx == 0:
+                    os.makedirs(chunk_dir, exist_ok=True)
+                work = (self._export_chunk, chunk, sample_rate, filename, chunk_idx)
+            else:
+                work = (self._virtual_chunk, chunk, sample_rate, filename, chunk_idx, file_path, info, start)
+            if io_pool is None:
+                exported.append(work[0](*work[1:]))
+                return
+            # Bounded, so chunks are never sliced much faster than the disk takes them
+            while len(pending) >= PENDING_CHUNKS_PER_THREAD * self.io_threads:
+                pending.popleft().result()
+            pending.append(io_pool.submit(*work))
+            exported.append(pending[-1])
+
+        def written():
+            """Names or entries of the exported chunks, once all are written"""
+            pending.clear()
+            return [result.result() if isinstance(result, Future) else result for result in exported]
         
         # Method 1: Use Silero VAD (Preferred)
-        if self.model:
+        if self.vad:
             try:
-                # Prepare audio for VAD (16k, mono, float32)
-                audio_16k = audio.set_frame_rate(16000).set_channels(1)
-                samples = np.array(audio_16k.get_array_of_samples())
-                
-                # Handle empty audio
-                if len(samples) == 0:
-                    return [], []
-
-                # Convert to float32 and normalize
-                if audio_16k.sample_width == 2: # 16-bit
-                    samples_float = samples.astype(np.float32) / 32768.0
-                elif audio_16k.sample_width == 4: # 32-bit
-                     samples_float = samples.astype(np.float32) / 2147483648.0
-                else:
-                    # Fallback for 24-bit etc if needed, but pydub handles most
-                     samples_float = samples.astype(np.float32) / float(1 << (8 * audio_16k.sample_width - 1))
-
-                tensor = torch.from_numpy(samples_float)
-                
-                # Get speech timestamps (in samples at 16k)
-                # threshold=0.5 is standard. min_silence_duration_ms=100 helps find small gaps.
-                # UPDATED: threshold 0.4 -> 0.5 (Stricter), min_silence 300 -> 100 (Find more pauses)
-                timestamps = self.get_speech_timestamps(tensor, self.model, sampling_rate=16000, threshold=0.5, min_silence_duration_ms=100)
-                print(f"DEBUG: VAD found {len(timestamps)} speech attributes.")
-                
-                # Extract chunks using timestamps
-                # Map 16k timestamps back to original audio ms
-                
-                raw_chunks_ms = []
-                for ts in timestamps:
-                    start_ms = int(ts['start'] / 16000 * 1000)
-                    end_ms = int(ts['end'] / 16000 * 1000)
-                    raw_chunks_ms.append((start_ms, end_ms))
-                
-                # Merge logic
-                merged_chunks_ms = []
-                if raw_chunks_ms:
-                    current_start, current_end = raw_chunks_ms[0]
-                    
-                    for i in range(1, len(raw_chunks_ms)):
-                        next_start, next_end = raw_chunks_ms[i]
-                        gap = next_start - current_end
-                        current_dur = current_end - current_start
-                        
-                        should_merge = False
-                        
-                        # Logic Revised:
-                        # 1. If current chunk is too small (< min_len), we TRY to merge to reach min_len.
-                        # 2. If chunk is already good size (> min_len), we ONLY merge if gap is insignificant (< 200ms).
-                        # 3. If gap is distinct (> 200ms), we treat it as a sentence boundary and split, 
-                        #    UNLESS current chunk is tiny.
-                        
-                        merged_dur = next_end - current_start
-                        
-                        # Hard constraint: Never exceed max_audio_len
-                        if merged_dur > self.max_audio_len:
-                            should_merge = False
-                        else:
-                            if current_dur < self.min_audio_len:
-                                # Current is garbage/short, must merge to save it
-                                should_merge = True
-                            elif gap < 200: 
-                                # Tiny gap (intra-word or fast speech), keep together
-                                should_merge = True
-                            else:
-                                # Gap is > 200ms AND current is > min_len.
-                                # This is likely a valid pause between sentences. Do NOT merge.
-                                should_merge = False
-                        
-                        if should_merge:
-                            current_end = next_end
-                        else:
-                            # Commit current
-                            merged_chunks_ms.append((current_start, current_end))
-                            current_start = next_start
-                            current_end = next_end
-                    
-                    # Append last
-                    merged_chunks_ms.append((current_start, current_end))
-                
-                # Extract actual audio objects
-                for start, end in merged_chunks_ms:
-                    # Double check constraints
-                    dur = end - start
-                    if dur >= self.min_audio_len: # Strict min check
-                        # If > max_len (rare), we might want to split it, but VAD usually pauses.
-                        # If strict max needed:
-                        if dur > self.max_audio_len:
-                            # Split simply by max len
-                            sub_start = start
-                            while sub_start < end:
-                                sub_end = min(sub_start + self.max_audio_len, end)
-                                if sub_end - sub_start >= self.min_audio_len:
-                                    chunks.append(audio[sub_start:sub_end])
-                                sub_start = sub_end
-                        else:
-                            chunks.append(audio[start:end])
-                            
+                if speech_ms is None and self._use_streaming_vad(info):
+                    # Chunks are cut from a second sequential decode as the windows go by,
+                    # the file is never fully decoded
+                    found_speech = []
+                    with ExportStream(file_path, info) as stream:
+                        for start, end in self._streaming_vad_chunk_ranges(file_path, found_speech):
+                            export(stream.frames_ms(start, end), ms_to_frames(start, sample_rate))
+                    if cache_key is not None:
+                        self.speech_cache.put(*cache_key, found_speech)
+                elif speech_ms:
+                    chunk_ranges = merge_speech_chunks(speech_ms, self.min_audio_len, self.max_audio_len, self.merge_gap_ms)
+                    if chunk_ranges and self._use_streaming_vad(info):
+                        # Long file: chunks are cut in order from one sequential decode
+                        with ExportStream(file_path, info) as stream:
+                            for start, end in chunk_ranges:
+                                export(stream.frames_ms(start, end), ms_to_frames(start, sample_rate))
+                    elif chunk_ranges:
+                        audio = load_audio()
+                        for start, end in chunk_ranges:
+                            export(slice_ms(audio, sample_rate, start, end), ms_position(audio, sample_rate, start))
+                chunks = written()
             except Exception as e:
                 print(f"VAD processing failed: {e}. Falling back to pydub.")
+                # Chunks still being written finish before the fallback writes its own
+                wait([result for result in exported if isinstance(result, Future)])
+                if self.virtual is None:
+                    # The fallback may write fewer chunks: none of this pass may be left behind
+                    for chunk_idx in range(len(exported)):
+                        try:
+                            os.remove(self.chunk_path(filename, filename+f'_v2_chunk_{chunk_idx}'))
+                        except FileNotFoundError:
+                            pass
+                exported.clear()
+                pending.clear()
                 chunks = [] # Trigger fallback
         
         # Fallback: Pydub Silence (if VAD failed or no model)
         if not chunks:
-            from pydub.silence import detect_nonsilent
-            nonsilent_ranges = detect_nonsilent(audio, min_silence_len=500, silence_thresh=-40)
-            for start_i, end_i in nonsilent_ranges:
-                chunk = audio[start_i:end_i]
-                if len(chunk) >= self.min_audio_len:
-                     # Basic max len splitting for fallback
-                    if len(chunk) > self.max_audio_len:
-                         for i in range(0, len(chunk), self.max_audio_len):
-                             sub = chunk[i:i+self.max_audio_len]
-                             if len(sub) >= self.min_audio_len:
-                                 chunks.append(sub)
-                    else:
-                        chunks.append(chunk)
-
-        # Final Export
-        original_audio_name_lst = []
-        splitted_audio_name_lst = []
-        
-        chunk_idx = 0
-        for chunk in chunks:
-            # Padding
-            silence_chunk = AudioSegment.silent(duration=50) 
-            audio_chunk = silence_chunk + chunk + silence_chunk
-            
-            # Normalize
-            normalized_chunk = self._match_target_amplitude(audio_chunk, -20.0)
-            
-            new_filename = filename+f'_v2_chunk_{chunk_idx}'
-            normalized_chunk.export(
-                os.path.join(self.output_splitted_audio_dir, new_filename+'.wav'),
-                bitrate = "192k",
-                format = "wav"
-            )
-            
-            splitted_audio_name_lst.append(new_filename)
-            chunk_idx += 1
+            try:
+                if audio is None:
+                    audio = load_audio()
+                chunk_ranges = self._silence_chunk_ranges(audio, sample_rate)
+            except Exception as e:
+                 print(f"DEBUG: Failed to load audio file {file_path}: {e}")
+                 return None
+            for start, end in chunk_ranges:
+                export(slice_ms(audio, sample_rate, start, end), ms_position(audio, sample_rate, start))
+            chunks = written()
         
+        if self.virtual is not None:
+            self.virtual.write_source(filename, chunks)
+            splitted_audio_name_lst = [entry['name'] for entry in chunks]
+        else:
+            splitted_audio_name_lst = chunks
         original_audio_name_lst.extend([filename]*len(splitted_audio_name_lst))
 
         if self.conditional_function != None:
-            lst, _ = self._conditional_function_caller(lambda: self.conditional_function(splitted_audio_name_lst, original_audio_name_lst, self.output_splitted_audio_dir))
+            # Given the folder this source's chunk files are in
+            lst, _ = self._conditional_function_caller(lambda: self.conditional_function(splitted_audio_name_lst, original_audio_name_lst, chunk_dir))
             splitted_audio_name_lst, original_audio_name_lst = lst[0], lst[1]
         
         return splitted_audio_name_lst, original_audio_name_lst
 
 
-    def process_videos(self):
-        video_title_lst = []
-        splitted_audio_name_lst = []
-        original_audio_name_lst = []
-        voice_lst = []
+    def process_videos(self, checkpoint=None):
+        """
+        Splits every file of the dataset and writes the output CSV.
+        checkpoint: optional TaskCheckpoint; files it lists as done are not split again.
+        With num_workers > 1 the files are split in a pool of processes, each holding its own VAD model.
+        """
         os.makedirs(self.output_audio_dir, exist_ok=True)
         os.makedirs(self.output_splitted_audio_dir, exist_ok=True) # Ensure output dir exists
         
         total_videos = len(self.df)
+        # (row, chunks, originals, source hash) per file in dataset order; chunks is None until the file is split
+        results = []
+        params = self._split_params()
+        legacy_chunks = self._legacy_chunks() if not len(self.manifest) else {}
         
         for index, row in self.df.iterrows():
-            if self.progress_callback:
-                percent = int((index / total_videos) * 100)
-                self.progress_callback(f"Processing video {index + 1}/{total_videos}: {row['video_title'][:30]}...", percent)
-            
             if 'audio_filename' in row and pd.notna(row['audio_filename']):
                 filename = row['audio_filename']
             else:
                  print(f"Warning: No audio filename for {row['video_title']}, skipping...")
                  continue
 
-            # Check if file exists (handled inside split_audio now effectively, but kept simpler here)
-            # Remove strict check here to allow fuzzy match in split_audio
-            pass
-            
+            # Finished by an earlier run of this task
+            if checkpoint is not None and checkpoint.done(filename):
+                done = checkpoint.get(filename)
+                results.append([row, done['chunks'], done['originals'], None])
+                continue
+
             # --- RESUME LOGIC ---
-            # Check if ANY chunks for this file already exist to avoid re-splitting
-            # We assume if chunk_0 exists, the file was processed.
-            # Filename format: {filename}_v2_chunk_0.wav
-            expected_first_chunk = os.path.join(self.output_splitted_audio_dir, filename + '_v2_chunk_0.wav')
-            if os.path.exists(expected_first_chunk):
-                if self.progress_callback:
-                     self.progress_callback(f"Skipping {filename} (Already processed)", percent)
+            # Split by an earlier run from the same content with the same parameters: one manifest lookup
+            source_hash = self._source_hash(filename)
+            entry = self.manifest.lookup(filename, source_hash, params) if source_hash else None
+            if entry is None and filename in legacy_chunks:
+                # Output of a version without a manifest: adopt its chunks once
+                entry = {'chunks': legacy_chunks[filename], 'originals': [filename] * len(legacy_chunks[filename])}
+                if source_hash:
+                    self.manifest.record(filename, source_hash, params, entry['chunks'], entry['originals'],
+                                         [name + '.wav' for name in entry['chunks']])
+            if entry is not None:
                 print(f"DEBUG: Skipping {filename} - Chunks already exist.")
-                
-                # Logic to add existing chunks to list so CSV is still complete? 
-                # Ideally yes, but that requires scanning. 
-                # For now, let's just skip processing. 
-                # WARNING: If we skip, they won't be in the *current* execution's output lists 
-                # unless we scan for them.
-                # Let's scan for them to keep the CSV complete.
-                
-                existing_chunks = [f for f in os.listdir(self.output_splitted_audio_dir) if f.startswith(filename + '_v2_chunk_')]
-                # Sort them naturally/numerically if needed, but not critical for CSV listing
-                
-                if existing_chunks:
-                    splitted_audio_name_lst.extend([os.path.splitext(c)[0] for c in existing_chunks])
-                    original_audio_name_lst.extend([filename] * len(existing_chunks))
-                    video_title_lst.extend([row['video_title']] * len(existing_chunks))
-                    voice_lst.extend([row['voice']] * len(existing_chunks))
+                results.append([row, entry['chunks'], entry['originals'], source_hash])
                 continue
             # --------------------
 
-            splitted_audio_lst, original_audio_lst = self.split_audio(filename)   
-            
+            results.append([row, None, None, source_hash])
+
+        pending = [result for result in results if result[1] is None]
+        finished = total_videos - len(pending)
+        if self.progress_callback and finished:
+            self.progress_callback(f"Skipping {finished} already processed file(s)", int(finished / max(total_videos, 1) * 100))
+
+        def file_done(result, split):
+            nonlocal finished
+            filename = result[0]['audio_filename']
+            # None: the file could not be found or decoded, so it is tried again on resume
+            splitted_audio_lst, original_audio_lst = split if split is not None else ([], [])
             if not splitted_audio_lst:
                 print(f"DEBUG: No chunks generated for {filename}")
-                     
+            if checkpoint is not None and split is not None:
+                checkpoint.mark_done(filename, {'chunks': splitted_audio_lst, 'originals': original_audio_lst})
+            if split is not None and result[3]:
+                # Sources without chunks (silence, or all speech too short) are recorded as well
+                self._record(filename, result[3], splitted_audio_lst, original_audio_lst)
+            result[1], result[2] = splitted_audio_lst, original_audio_lst
+            finished += 1
+
+        workers = min(self.num_workers, len(pending))
+        if workers > 1 and multiprocessing.current_process().daemon:
+            # Daemonic processes cannot start children
+            print("DEBUG: Running inside a daemonic process, splitting files serially.")
+            workers = 1
+
+        # Files go out in batches whose VAD frames are scored together; with a pool, small
+        # enough batches that every process gets work
+        batch_size = self.vad_batch_size
+        if workers > 1:
+            batch_size = max(1, min(batch_size, len(pending) // workers))
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+
+        if workers <= 1:
+            for batch in batches:
+                if self.progress_callback:
+                    percent = int((finished / total_videos) * 100)
+                    self.progress_callback(f"Processing video {finished + 1}/{total_videos}: {batch[0][0]['video_title'][:30]}...", percent)
+                for result, split in zip(batch, self.split_audio_batch([result[0]['audio_filename'] for result in batch])):
+                    file_done(result, split)
+        else:
+            # Spawned rather than forked: torch thread pools do not survive a fork.
+            # Each process gets its share of the cores for torch / ONNX Runtime
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            print(f"DEBUG: Splitting {len(pending)} files with {workers} processes ({threads} threads each).")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_split_worker, initargs=(self, threads)) as pool:
+                futures = {pool.submit(_split_in_worker, [result[0]['audio_filename'] for result in batch]): batch for batch in batches}
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    for result, split in zip(batch, future.result()):
+                        file_done(result, split)
+                    if self.progress_callback:
+                        percent = int((finished / total_videos) * 100)
+                        self.progress_callback(f"Processed video {finished}/{total_videos}: {batch[-1][0]['video_title'][:30]}...", percent)
+            
+        if self.progress_callback:
+            self.progress_callback("Finalizing...", 100)
+
+        # Merge the per-file results in dataset order
+        video_title_lst = []
+        splitted_audio_name_lst = []
+        original_audio_name_lst = []
+        voice_lst = []
+        for row, splitted_audio_lst, original_audio_lst, _ in results:
             splitted_audio_name_lst.extend(splitted_audio_lst)
             original_audio_name_lst.extend(original_audio_lst)
             video_title_lst.extend([row['video_title']]*len(original_audio_lst))
             voice_lst.extend([row['voice']]*len(original_audio_lst))
-            
-        if self.progress_callback:
-            self.progress_callback("Finalizing...", 100)
         
+        self.save_csv(video_title_lst, original_audio_name_lst, splitted_audio_name_lst, voice_lst)
+
+
+    def save_csv(self, video_title_lst, original_audio_name_lst, splitted_audio_name_lst, voice_lst):
         output_df = pd.DataFrame({
             'channel_name': [self.channel_name]*len(video_title_lst),
             'video_title': video_title_lst,
@@ -4,6 +4,8 @@ from transformers import pipeline, SeamlessM4TTokenizer
 import torch
 import time
 import warnings
+from backend.processors.split_manifest import list_chunk_files
+from backend.processors.virtual_chunks import VirtualChunks
 
 # Suppress tokenizer conversion warnings
 warnings.filterwarnings("ignore", message=".*Converting from SentencePiece.*")
@@ -14,19 +16,25 @@ if torch.backends.mps.is_available():
 else:
     device = torch.device("cpu")  # Fallback to CPU if MPS is not available
 
+def load_transcription_pipeline(model_name="facebook/seamless-m4t-v2-large"):
+    """Builds the Seamless M4T speech recognition pipeline"""
+    # Use the specific tokenizer for SeamlessM4T to avoid conversion errors
+    tokenizer = SeamlessM4TTokenizer.from_pretrained(model_name)
+    
+    return pipeline(
+        "automatic-speech-recognition", 
+        model=model_name,
+        tokenizer=tokenizer,
+        device=0
+    )
+
+
 class AudioTranscriber:
     
     
-    def __init__(self, csv_filename, model_name="facebook/seamless-m4t-v2-large", target_lang="arb", output_csv_dir='./datasets_csv/audio_text_datasets'):
-        # Use the specific tokenizer for SeamlessM4T to avoid conversion errors
-        tokenizer = SeamlessM4TTokenizer.from_pretrained(model_name)
-        
-        self.transcription_pipeline = pipeline(
-            "automatic-speech-recognition", 
-            model=model_name,
-            tokenizer=tokenizer,
-            device=0
-        )
+    def __init__(self, csv_filename, model_name="facebook/seamless-m4t-v2-large", target_lang="arb", output_csv_dir='./datasets_csv/audio_text_datasets', transcription_pipeline=None):
+        # A preloaded pipeline can be injected to avoid reloading the model for every task
+        self.transcription_pipeline = transcription_pipeline or load_transcription_pipeline(model_name)
         self.csv_filename = csv_filename
         self.target_lang = target_lang
         self.output_csv_dir = output_csv_dir
@@ -35,6 +43,7 @@ class AudioTranscriber:
         os.makedirs(self.output_csv_dir, exist_ok=True)
 
     def transcribe_audio(self, audio_path):
+        # audio_path may also be the bytes of an audio file (a virtual chunk)
         transcription = self.transcription_pipeline(audio_path, generate_kwargs={"tgt_lang": self.target_lang})
         return transcription
 
@@ -77,13 +86,23 @@ class AudioTranscriber:
                     except Exception as backup_error:
                         print(f"❌ Failed to save backup: {backup_error}")
 
-    def transcribe_audio_folder(self, folder_path, progress_callback=None):
+    def transcribe_audio_folder(self, folder_path, progress_callback=None, checkpoint=None):
+        """
+        Transcribes every audio file of a splitter output folder, saving the CSV as it goes.
+        Files are enumerated from the folder's manifest (see list_chunk_files) and keyed by file name.
+        Virtual chunks indexed in folder_path are read from their sources, as <name>.wav.
+        checkpoint: optional TaskCheckpoint; files it lists as done are not transcribed again.
+        """
         transcriptions = {}
-        sorted_filenames = sorted(os.listdir(folder_path))
         
-        # Filter audio files with supported extensions
-        extensions = ('.wav', '.mp3', '.flac', '.m4a', '.ogg')
-        audio_files = [f for f in sorted_filenames if f.lower().endswith(extensions)]
+        # Relative path of every audio file by its file name
+        chunk_files = {os.path.basename(path): path for path in list_chunk_files(folder_path)}
+        virtual = VirtualChunks(folder_path) if VirtualChunks.exists(folder_path) else None
+        virtual_files = set()
+        if virtual is not None:
+            # A chunk that was also written out is read from its file
+            virtual_files = {name + '.wav' for name in virtual.names()} - set(chunk_files)
+        audio_files = sorted(list(chunk_files) + list(virtual_files))
         total_files = len(audio_files)
         
         print(f"Starting transcription of {total_files} audio files...")
@@ -91,9 +110,19 @@ class AudioTranscriber:
         
         try:
             for i, filename in enumerate(audio_files, 1):
-                audio_path = os.path.join(folder_path, filename)
+                if checkpoint is not None and checkpoint.done(filename):
+                    # Finished by an earlier run of this task
+                    transcriptions[filename] = checkpoint.get(filename)
+                    continue
+
+                if filename in virtual_files:
+                    audio_path = virtual.wav_bytes(os.path.splitext(filename)[0])
+                else:
+                    audio_path = os.path.join(folder_path, *chunk_files[filename].split('/'))
                 transcription = self.transcribe_audio(audio_path)
                 transcriptions[filename] = transcription['text']
+                if checkpoint is not None:
+                    checkpoint.mark_done(filename, transcription['text'])
                 
                 message = f"Finished processing {filename}, {i} out of {total_files}"
                 print(message)
@@ -1,13 +1,19 @@
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
-from pydub import AudioSegment
 from faster_whisper import WhisperModel
 import torch
 import warnings
+from backend.processors.audio_io import probe_audio, decode_audio, export_format, resample_audio, write_wav
+from backend.processors.split_manifest import MANIFEST_NAME, SplitManifest, content_hash
 
 # Filter warnings
 warnings.filterwarnings("ignore")
 
+# Whisper takes 16 kHz mono float32 audio
+WHISPER_SAMPLE_RATE = 16000
+
 class SemanticSplitter:
     
     def __init__(self,
@@ -16,30 +22,145 @@ class SemanticSplitter:
                  output_csv_dir='./datasets_csv/audio_datasets',
                  model_size="medium",
                  device="cuda" if torch.cuda.is_available() else "cpu",
-                 progress_callback=None
+                 progress_callback=None,
+                 model=None, # Optional preloaded WhisperModel
+                 batch_size=None, # > 1: faster-whisper's batched pipeline, transcribing this many windows of a file at once
+                 beam_size=5, # 1 is greedy decoding: faster, slightly less accurate
+                 word_timestamps=True,
+                 cpu_threads=0, # CTranslate2 threads per transcription (0: its default); used when the model is loaded here
+                 num_workers=1 # Files transcribed at the same time (the model needs as many workers)
                 ):
         self.input_audio_folder = input_audio_folder
         self.output_splitted_audio_dir = output_splitted_audio_dir
         self.output_csv_dir = output_csv_dir
         self.progress_callback = progress_callback
+        self.model_size = model_size
         self.device = device
         self.compute_type = "float16" if device == "cuda" else "int8"
+        self.batch_size = int(batch_size or 1)
+        self.beam_size = int(beam_size)
+        self.word_timestamps = bool(word_timestamps)
+        self.cpu_threads = int(cpu_threads or 0)
+        self.num_workers = max(1, int(num_workers or 1))
         
-        print(f"Loading Faster-Whisper model ({model_size}) on {device}...")
+        if model is not None:
+            self.model = model
+        else:
+            print(f"Loading Faster-Whisper model ({model_size}) on {device}...")
+            try:
+                self.model = WhisperModel(model_size, device=device, compute_type=self.compute_type,
+                                          cpu_threads=self.cpu_threads, num_workers=self.num_workers)
+                print("Faster-Whisper model loaded successfully.")
+            except Exception as e:
+                print(f"Error loading Faster-Whisper: {e}")
+                raise e
+
+        self.pipeline = None
+        if self.batch_size > 1:
+            try:
+                from faster_whisper import BatchedInferencePipeline
+                self.pipeline = BatchedInferencePipeline(model=self.model)
+            except ImportError:
+                # Added in faster-whisper 1.1
+                print("BatchedInferencePipeline needs faster-whisper >= 1.1, transcribing without batching.")
+                self.batch_size = 1
+
+    def options(self):
+        """Inference settings the clips were transcribed with, reported in the task result"""
+        return {
+            'model_size': self.model_size,
+            'device': self.device,
+            'compute_type': self.compute_type,
+            'batched': self.pipeline is not None,
+            'batch_size': self.batch_size,
+            'beam_size': self.beam_size,
+            'word_timestamps': self.word_timestamps,
+            'cpu_threads': self.cpu_threads,
+            'num_workers': self.num_workers,
+        }
+
+    def _transcribe(self, audio):
+        """(segments, info) of audio (16 kHz mono float32), through the batched pipeline when batch_size > 1"""
+        if self.pipeline is not None:
+            return self.pipeline.transcribe(audio, batch_size=self.batch_size, beam_size=self.beam_size,
+                                           word_timestamps=self.word_timestamps)
+        return self.model.transcribe(audio, beam_size=self.beam_size, word_timestamps=self.word_timestamps)
+
+    def _record(self, manifest, filename, file_path, segments):
+        """Lists the clips of a file in the output folder's manifest"""
+        if not segments:
+            return
+        base_name = os.path.splitext(filename)[0]
+        clips = [os.path.splitext(segment['audio_filename'])[0] for segment in segments]
+        # Keyed by the file name with its extension, apart from AudioSplitter's entry for the same source
+        manifest.record(filename, content_hash(file_path), {'splitter': 'semantic'}, clips, [filename] * len(clips),
+                        [f"{base_name}/{segment['audio_filename']}" for segment in segments])
+
+    def _split_file(self, filename):
+        """
+        Transcribes one file and exports its sentence clips.
+        Returns (clip rows, seconds of audio, error or None); on an error the rows of the clips exported before it.
+        """
+        file_path = os.path.join(self.input_audio_folder, filename)
+        base_name = os.path.splitext(filename)[0]
+        file_segments_data = []
         try:
-            self.model = WhisperModel(model_size, device=device, compute_type=self.compute_type)
-            print("Faster-Whisper model loaded successfully.")
+            # Decoded once, in the source's rate and layout, for cutting
+            info = probe_audio(file_path)
+            sample_rate = info['sample_rate']
+            audio = decode_audio(file_path, sample_rate, info['channels'], export_format(info)[2], expected_seconds=info['duration'])
+            # Clips of a file go in their own folder, like AudioSplitter chunks
+            clip_dir = os.path.join(self.output_splitted_audio_dir, base_name)
+            os.makedirs(clip_dir, exist_ok=True)
+            
+            # Transcribe the model's copy, resampled from the decoded buffer
+            segments, _ = self._transcribe(resample_audio(audio, sample_rate, WHISPER_SAMPLE_RATE)[:, 0])
+            
+            # Iterate over segments (sentences)
+            segment_idx = 0
+            for segment in segments:
+                start = int(round(segment.start * sample_rate))
+                end = min(int(round(segment.end * sample_rate)), len(audio))
+                text = segment.text.strip()
+                
+                # Basic constraints
+                if end - start < sample_rate: # Skip very short segments < 1s
+                    continue
+                
+                # Export
+                new_filename = f"{base_name}_seg_{segment_idx:04d}.wav"
+                output_path = os.path.join(clip_dir, new_filename)
+                
+                write_wav(output_path, audio[start:end], sample_rate)
+                
+                file_segments_data.append({
+                    'original_file': filename,
+                    'audio_filename': new_filename,
+                    'text': text,
+                    'duration_sec': round((end - start) / sample_rate, 3),
+                    'speaker': 'unknown' 
+                })
+                
+                segment_idx += 1
+
+            return file_segments_data, len(audio) / sample_rate, None
         except Exception as e:
-            print(f"Error loading Faster-Whisper: {e}")
-            raise e
+            return file_segments_data, 0.0, e
 
-    def split_audio(self):
+    def split_audio(self, checkpoint=None):
+        """
+        Transcribes and cuts every file of the input folder into sentence clips.
+        checkpoint: optional TaskCheckpoint; files it lists as done are not processed again.
+        With num_workers > 1 that many files are transcribed at the same time.
+        """
         if not self.input_audio_folder or not os.path.exists(self.input_audio_folder):
             raise ValueError(f"Input folder not found: {self.input_audio_folder}")
 
         # Ensure output directories exist
         os.makedirs(self.output_splitted_audio_dir, exist_ok=True)
         os.makedirs(self.output_csv_dir, exist_ok=True)
+        # Clips are listed in the output folder's manifest, where the transcribers find them
+        manifest = SplitManifest(os.path.join(self.output_splitted_audio_dir, MANIFEST_NAME))
 
         # Get audio files
         extensions = ('.wav', '.mp3', '.flac', '.m4a', '.ogg')
@@ -51,57 +172,38 @@ class SemanticSplitter:
 
         print(f"Found {total_files} audio files for semantic spitting.")
         
-        all_segments_data = []
+        # Clip rows per file, in folder order
+        file_rows = {}
+        pending = []
+        for filename in audio_files:
+            if checkpoint is not None and checkpoint.done(filename):
+                # Finished by an earlier run of this task
+                file_rows[filename] = checkpoint.get(filename)
+            else:
+                pending.append(filename)
 
-        for idx, filename in enumerate(audio_files):
-            file_path = os.path.join(self.input_audio_folder, filename)
-            base_name = os.path.splitext(filename)[0]
-            
-            if self.progress_callback:
-                percent = int((idx / total_files) * 100)
-                self.progress_callback(f"Processing {filename}...", percent)
-            
-            try:
-                # Load Audio for cutting
-                audio = AudioSegment.from_file(file_path)
-                
-                # Transcribe
-                segments, info = self.model.transcribe(file_path, beam_size=5, word_timestamps=True)
-                
-                # Iterate over segments (sentences)
-                segment_idx = 0
-                for segment in segments:
-                    start_ms = int(segment.start * 1000)
-                    end_ms = int(segment.end * 1000)
-                    text = segment.text.strip()
-                    
-                    # Basic constraints
-                    duration_ms = end_ms - start_ms
-                    if duration_ms < 1000: # Skip very short segments < 1s
-                        continue
-                        
-                    # Extract audio clip
-                    clip = audio[start_ms:end_ms]
-                    
-                    # Export
-                    new_filename = f"{base_name}_seg_{segment_idx:04d}.wav"
-                    output_path = os.path.join(self.output_splitted_audio_dir, new_filename)
-                    
-                    clip.export(output_path, format="wav")
-                    
-                    all_segments_data.append({
-                        'original_file': filename,
-                        'audio_filename': new_filename,
-                        'text': text,
-                        'duration_sec': duration_ms / 1000.0,
-                        'speaker': 'unknown' 
-                    })
-                    
-                    segment_idx += 1
-                    
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-                continue
+        audio_seconds = 0.0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            # Results come back in order, so clips are recorded as files finish
+            results = pool.map(self._split_file, pending) if self.num_workers > 1 else map(self._split_file, pending)
+            for done, (filename, (file_segments_data, duration, error)) in enumerate(zip(pending, results), len(file_rows) + 1):
+                file_path = os.path.join(self.input_audio_folder, filename)
+                if self.progress_callback:
+                    percent = int((done / total_files) * 100)
+                    self.progress_callback(f"Processed {filename} ({done}/{total_files})", percent)
+                # Keep the clips exported before a failure
+                file_rows[filename] = file_segments_data
+                self._record(manifest, filename, file_path, file_segments_data)
+                if error is not None:
+                    print(f"Error processing {filename}: {error}")
+                    continue
+                audio_seconds += duration
+                if checkpoint is not None:
+                    checkpoint.mark_done(filename, file_segments_data)
+        elapsed = time.monotonic() - started
+
+        all_segments_data = [row for filename in audio_files for row in file_rows.get(filename, [])]
 
         if self.progress_callback:
             self.progress_callback("Finalizing...", 100)
@@ -115,5 +217,8 @@ class SemanticSplitter:
         return {
             "csv_path": csv_path,
             "csv_filename": output_csv_name,
-            "audio_dir": self.output_splitted_audio_dir
+            "audio_dir": self.output_splitted_audio_dir,
+            "options": self.options(),
+            # Seconds of audio transcribed by this run per second of processing
+            "speed_factor": round(audio_seconds / elapsed, 2) if elapsed > 0 else None
         }
@@ -0,0 +1,248 @@
+import io
+import os
+import json
+import time
+import wave
+import tarfile
+import pandas as pd
+from backend.processors.audio_io import write_wav
+from backend.processors.split_manifest import list_chunk_files
+from backend.processors.virtual_chunks import VirtualChunks
+
+SHARD_FORMATS = ('tar', 'parquet')
+# Parquet rows buffered before they are written out as one row group
+PARQUET_ROW_GROUP_ROWS = 256
+
+
+def tar_key(name):
+    """
+    Key of a sample in a tar shard. WebDataset splits member names at the first dot into key
+    and extension, so dots are percent-escaped (and '%' itself, which keeps distinct names distinct).
+    """
+    return name.replace('%', '%25').replace('.', '%2E')
+
+
+class _ShardWriter:
+    """
+    Writes samples into rolling shard files <prefix>-000000.<ext>, <prefix>-000001.<ext>, ...
+    A new shard is started once the current one would grow past max_bytes. Shards are written
+    front to back, to a temporary name that is renamed when the shard is complete.
+    """
+    extension = None
+
+    def __init__(self, output_dir, prefix='shard', max_bytes=1024 ** 3):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.samples = 0
+        self._path = None
+        self._size = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, key, audio, text=None, metadata=None):
+        """audio: bytes of a WAV file. metadata: JSON-serializable dict stored with the sample."""
+        if self._path is not None and self._size and self._size + len(audio) > self.max_bytes:
+            self._finish()
+        if self._path is None:
+            self._path = os.path.join(self.output_dir, f"{self.prefix}-{len(self.shards):06d}.{self.extension}")
+            self._size = 0
+            self._open(self._path + '.tmp')
+        self._size += self._write(key, audio, text, metadata or {})
+        self.samples += 1
+
+    def _finish(self):
+        self._close()
+        os.replace(self._path + '.tmp', self._path)
+        self.shards.append(self._path)
+        self._path = None
+
+    def close(self):
+        """Completes the last shard. Returns the paths of all shards written."""
+        if self._path is not None:
+            self._finish()
+        return self.shards
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._path is not None:
+            # Leave no partial shard behind
+            self._close()
+            os.remove(self._path + '.tmp')
+
+
+class TarShardWriter(_ShardWriter):
+    """
+    WebDataset-style tar shards: each sample is <key>.wav, <key>.json (metadata and text)
+    and <key>.txt (the transcript, when there is one), streamed into an uncompressed tar.
+    """
+    extension = 'tar'
+
+    def _open(self, path):
+        self._tar = tarfile.open(path, mode='w|', format=tarfile.PAX_FORMAT)
+        self._mtime = time.time()
+
+    def _add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self._mtime
+        self._tar.addfile(info, io.BytesIO(data))
+        # Header block plus data padded to whole 512-byte blocks
+        return 512 + -(-len(data) // 512) * 512
+
+    def _write(self, key, audio, text, metadata):
+        key = tar_key(key)
+        size = self._add(f"{key}.wav", audio)
+        size += self._add(f"{key}.json", json.dumps({**metadata, 'text': text}, ensure_ascii=False).encode('utf-8'))
+        if text is not None:
+            size += self._add(f"{key}.txt", text.encode('utf-8'))
+        return size
+
+    def _close(self):
+        self._tar.close()
+
+
+class ParquetShardWriter(_ShardWriter):
+    """
+    Parquet shards with one row per sample: key, audio (WAV bytes), sample_rate, duration,
+    text and metadata (a JSON string). Needs pyarrow.
+    """
+    extension = 'parquet'
+
+    def __init__(self, *args, **kwargs):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet shards need pyarrow. Please install 'pyarrow'.")
+        self._pa, self._pq = pa, pq
+        self._schema = pa.schema([
+            ('key', pa.string()),
+            ('audio', pa.binary()),
+            ('sample_rate', pa.int32()),
+            ('duration', pa.float64()),
+            ('text', pa.string()),
+            ('metadata', pa.string()),
+        ])
+        super().__init__(*args, **kwargs)
+
+    def _open(self, path):
+        self._writer = self._pq.ParquetWriter(path, self._schema)
+        self._rows = []
+
+    def _flush(self):
+        if self._rows:
+            columns = list(zip(*self._rows))
+            self._writer.write_table(self._pa.Table.from_arrays([self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)], schema=self._schema))
+            self._rows = []
+
+    def _write(self, key, audio, text, metadata):
+        sample_rate, duration = wav_format(audio)
+        self._rows.append((key, audio, sample_rate, duration, text, json.dumps(metadata, ensure_ascii=False)))
+        if len(self._rows) >= PARQUET_ROW_GROUP_ROWS:
+            self._flush()
+        return len(audio)
+
+    def _close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_shard_writer(shard_format, output_dir, prefix='shard', max_bytes=1024 ** 3):
+    if shard_format == 'tar':
+        return TarShardWriter(output_dir, prefix, max_bytes)
+    if shard_format == 'parquet':
+        return ParquetShardWriter(output_dir, prefix, max_bytes)
+    raise ValueError(f"Unknown shard format: {shard_format} (expected one of {', '.join(SHARD_FORMATS)})")
+
+
+def wav_format(audio):
+    """(sample_rate, duration in seconds) of the bytes of a WAV file"""
+    with wave.open(io.BytesIO(audio), 'rb') as f:
+        return f.getframerate(), f.getnframes() / f.getframerate()
+
+
+def _csv_rows(csv_path, name_columns):
+    """Rows of a dataset CSV by chunk name (file name without extension)"""
+    if not csv_path:
+        return {}
+    df = pd.read_csv(csv_path, encoding='utf-8-sig')
+    column = next((c for c in name_columns if c in df.columns), None)
+    if column is None:
+        raise ValueError(f"{csv_path} has none of the columns {', '.join(name_columns)}")
+    rows = {}
+    for row in df.to_dict('records'):
+        name = os.path.splitext(str(row.pop(column)))[0]
+        rows[name] = {key: value for key, value in row.items() if pd.notna(value)}
+    return rows
+
+
+def package_dataset(audio_folder, output_dir, shard_format='tar', shard_size_mb=1024, split_csv=None, transcript_csv=None,
+                    prefix='shard', require_text=False, progress_callback=None):
+    """
+    Packs the chunks of a splitter output folder (files and virtual chunks) into shards,
+    read and written one chunk at a time.
+    split_csv: AudioSplitter/SemanticSplitter CSV whose columns are stored as each chunk's metadata.
+    transcript_csv: AudioTranscriber/ElevenLabsTranscriber CSV with the text of each chunk.
+    Chunks are stored under their names (file name without extension).
+    require_text: leave out chunks without a transcript.
+    Returns a summary with the shard paths.
+    """
+    metadata = _csv_rows(split_csv, ('splitted_audio_name', 'audio_filename'))
+    transcripts = {name: row.get('text') for name, row in _csv_rows(transcript_csv, ('filename', 'audio_file')).items()}
+
+    # Chunk name -> path of its file, or None for a virtual chunk
+    chunks = {os.path.splitext(os.path.basename(path))[0]: os.path.join(audio_folder, *path.split('/')) for path in list_chunk_files(audio_folder)}
+    virtual = VirtualChunks(audio_folder) if VirtualChunks.exists(audio_folder) else None
+    if virtual is not None:
+        for name in virtual.names():
+            chunks.setdefault(name, None)
+    names = sorted(name for name in chunks
+                   if not require_text or transcripts.get(name, metadata.get(name, {}).get('text')) is not None)
+    if not names:
+        raise ValueError(f"No chunks to package in {audio_folder}")
+
+    def chunk_audio():
+        """(name, WAV bytes, or the exception reading them) of every chunk, files first"""
+        for name in names:
+            if chunks[name] is not None:
+                try:
+                    with open(chunks[name], 'rb') as f:
+                        yield name, f.read()
+                except Exception as e:
+                    yield name, e
+        # Virtual chunks source by source, each source decoded once rather than once per chunk
+        virtual_names = [name for name in names if chunks[name] is None]
+        if virtual_names:
+            for name, chunk in virtual.read_sources(virtual_names):
+                if isinstance(chunk, Exception):
+                    yield name, chunk
+                    continue
+                buffer = io.BytesIO()
+                write_wav(buffer, *chunk)
+                yield name, buffer.getvalue()
+
+    skipped = 0
+    with open_shard_writer(shard_format, output_dir, prefix, int(shard_size_mb * 1024 ** 2)) as writer:
+        for i, (name, audio) in enumerate(chunk_audio(), 1):
+            if isinstance(audio, Exception):
+                print(f"Skipping chunk {name}: {audio}")
+                skipped += 1
+                continue
+            # SemanticSplitter CSVs carry the text of their clips themselves
+            text = transcripts.get(name, metadata.get(name, {}).get('text'))
+            writer.write(name, audio, None if text is None else str(text), {'name': name, **metadata.get(name, {})})
+            if progress_callback and (i % 100 == 0 or i == len(names)):
+                progress_callback(f"Packing chunks... {i}/{len(names)}", int(i / len(names) * 100))
+        shards = writer.close()
+
+    return {
+        'format': shard_format,
+        'shards': shards,
+        'samples': writer.samples,
+        'skipped': skipped,
+    }
@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+
+# Kept in the output folder next to the chunks it describes
+MANIFEST_NAME = '_split_manifest.jsonl'
+# Bytes read from each end of a file for its content hash
+HASH_SAMPLE_BYTES = 1024 * 1024
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.m4a', '.ogg')
+
+
+def content_hash(path):
+    """
+    Hash identifying the content of an audio file: its size and mtime plus its first and last MiB.
+    Cheap to compute however long the recording is. Only the ends are read, so an in-place edit of
+    the middle that keeps the size is caught by the mtime alone; copying a file without preserving
+    its mtime changes the hash (the file is then split again).
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    digest = hashlib.sha1(f"{size}:{stat.st_mtime_ns}".encode())
+    with open(path, 'rb') as f:
+        digest.update(f.read(HASH_SAMPLE_BYTES))
+        if size > 2 * HASH_SAMPLE_BYTES:
+            f.seek(size - HASH_SAMPLE_BYTES)
+        digest.update(f.read(HASH_SAMPLE_BYTES))
+    return digest.hexdigest()
+
+
+class SplitManifest:
+    """
+    Source file -> chunks index of a splitter output folder. Stored as an append-only
+    JSON-lines file that is read once: a source is only recorded after all its chunks are
+    written, so a file interrupted mid-split has no entry and is split again.
+    The newest entry of a source wins; a line torn by a crash is ignored on load.
+    It is also the list of chunk files readers of the folder enumerate (see list_chunk_files).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._entries[entry['source']] = entry
+
+    def lookup(self, source, source_hash, params):
+        """Entry of source if it was split from the same content with the same parameters, else None"""
+        entry = self._entries.get(source)
+        if entry is None or entry.get('hash') != source_hash or entry.get('params') != params:
+            return None
+        return entry
+
+    def get(self, source):
+        """Newest entry of source, or None"""
+        return self._entries.get(source)
+
+    def record(self, source, source_hash, params, chunks, originals, files=None):
+        """files: paths of the chunk files relative to the output folder (None: the chunks are virtual)"""
+        entry = {'source': source, 'hash': source_hash, 'params': params, 'chunks': chunks, 'originals': originals, 'files': files}
+        self._entries[source] = entry
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def chunk_files(self):
+        """Paths (relative to the output folder, '/'-separated) of the chunk files of every source"""
+        files = []
+        for entry in self._entries.values():
+            if 'files' not in entry:
+                # Recorded before chunks were sharded by source: all in the output folder itself
+                files.extend(name + '.wav' for name in entry['chunks'])
+            elif entry['files']:
+                files.extend(entry['files'])
+        return files
+
+
+def list_chunk_files(folder):
+    """
+    Audio files of a splitter output folder, as paths relative to it sorted by file name:
+    the chunk files listed in the folder's manifest, plus the audio files in the folder itself
+    (output of versions without a manifest, or written without being recorded).
+    Only the top level is listed, chunk folders are known from the manifest.
+    """
+    files = set(f for f in os.listdir(folder) if f.lower().endswith(AUDIO_EXTENSIONS))
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        files.update(SplitManifest(manifest_path).chunk_files())
+    return sorted(files, key=lambda path: (os.path.basename(path), path))
+
+
+class SpeechCache:
+    """
+    Raw VAD speech segments (ms) of source files, one small JSON file per source content,
+    VAD model version and segmenter settings. Splitting again with other length limits then
+    only needs the merge and the export, not another decode and VAD pass.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, source_hash, vad_version, settings):
+        key = json.dumps([vad_version, settings], sort_keys=True)
+        return os.path.join(self.directory, f"{source_hash}-{hashlib.sha1(key.encode()).hexdigest()[:16]}.json")
+
+    def get(self, source_hash, vad_version, settings):
+        """Cached segments as (start, end) pairs, or None"""
+        try:
+            with open(self._path(source_hash, vad_version, settings), 'r', encoding='utf-8') as f:
+                return [tuple(segment) for segment in json.load(f)['speech']]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, source_hash, vad_version, settings, speech):
+        path = self._path(source_hash, vad_version, settings)
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'vad': vad_version, 'settings': settings, 'speech': [list(segment) for segment in speech]}, f)
+        os.replace(temp_path, path)
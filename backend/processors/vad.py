@@ -0,0 +1,381 @@
+import os
+import hashlib
+import importlib.util
+import numpy as np
+
+from backend.processors.audio_io import VAD_SAMPLE_RATE
+
+# Samples Silero scores at a time at 16 kHz
+VAD_FRAME_SAMPLES = 512
+# Audio of the previous frame Silero v5 sees with each frame
+VAD_CONTEXT_SAMPLES = 64
+# Pauses shorter than this never end a chunk that is already long enough
+MERGE_GAP_MS = 200
+# Where a copy of the Silero ONNX model shipped with the app is looked for
+BUNDLED_ONNX_MODEL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models', 'silero_vad.onnx')
+
+
+def _silero_hub_dir():
+    """torch.hub's checkout of snakers4/silero-vad (same location rules as torch.hub.get_dir)"""
+    torch_home = os.environ.get('TORCH_HOME') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'torch')
+    return os.path.join(torch_home, 'hub', 'snakers4_silero-vad_master')
+
+
+def find_silero_onnx():
+    """Path of a local Silero VAD ONNX model, or None"""
+    candidates = [os.environ.get('SILERO_VAD_ONNX'), BUNDLED_ONNX_MODEL]
+    hub_dir = _silero_hub_dir()
+    candidates += [os.path.join(hub_dir, 'src', 'silero_vad', 'data', 'silero_vad.onnx'),
+                   os.path.join(hub_dir, 'files', 'silero_vad.onnx')]
+    spec = importlib.util.find_spec('silero_vad')
+    if spec is not None and spec.origin:
+        candidates.append(os.path.join(os.path.dirname(spec.origin), 'data', 'silero_vad.onnx'))
+    return next((path for path in candidates if path and os.path.isfile(path)), None)
+
+
+def find_silero_jit():
+    """Path of the TorchScript model in the torch.hub checkout, or None"""
+    hub_dir = _silero_hub_dir()
+    candidates = [os.path.join(hub_dir, 'src', 'silero_vad', 'data', 'silero_vad.jit'),
+                  os.path.join(hub_dir, 'files', 'silero_vad.jit')]
+    return next((path for path in candidates if os.path.isfile(path)), None)
+
+
+def _file_version(prefix, path):
+    """Version string of a model file: changes whenever the file does"""
+    with open(path, 'rb') as f:
+        return f"{prefix}-{hashlib.sha1(f.read()).hexdigest()[:12]}"
+
+
+def load_silero_vad():
+    """
+    Loads the TorchScript Silero VAD. Returns (model, get_speech_timestamps).
+    Uses the torch.hub checkout when there is one, so only a cold cache needs GitHub.
+    """
+    import torch
+    hub_dir = _silero_hub_dir()
+    if os.path.isfile(os.path.join(hub_dir, 'hubconf.py')):
+        model, utils = torch.hub.load(repo_or_dir=hub_dir, model='silero_vad', source='local', verbose=False)
+    else:
+        model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad',
+                                      model='silero_vad',
+                                      force_reload=False,
+                                      trust_repo=True,
+                                      verbose=False)
+    return model, utils[0]
+
+
+def load_vad_engine(backend=None, model_path=None, num_threads=1):
+    """
+    Loads a Silero VAD engine.
+    backend: 'onnx', 'torch', or None for TTS_VAD_BACKEND / auto (ONNX Runtime when it and a
+    local ONNX model are available, otherwise TorchScript).
+    """
+    backend = backend or os.environ.get('TTS_VAD_BACKEND') or 'auto'
+    if backend not in ('auto', 'onnx', 'torch'):
+        raise ValueError(f"Unknown VAD backend: {backend}")
+    if backend != 'torch':
+        model_path = model_path or find_silero_onnx()
+        onnx_available = importlib.util.find_spec('onnxruntime') is not None
+        if model_path and onnx_available:
+            return OnnxSileroEngine(model_path, num_threads=num_threads)
+        if backend == 'onnx':
+            raise RuntimeError(f"ONNX VAD needs onnxruntime and a Silero ONNX model (e.g. {BUNDLED_ONNX_MODEL})")
+    model, _ = load_silero_vad()
+    return TorchSileroEngine(model, find_silero_jit())
+
+
+def silero_frame_probabilities(model, samples):
+    """
+    Speech probability of every 512-sample frame of samples (16 kHz mono float32), in order.
+    The model keeps its state between calls, so a long recording can be scored window by
+    window as long as every window but the last is a whole number of frames.
+    """
+    import torch
+    probabilities = np.empty((len(samples) + VAD_FRAME_SAMPLES - 1) // VAD_FRAME_SAMPLES, dtype=np.float32)
+    with torch.no_grad():
+        for i in range(len(probabilities)):
+            frame = samples[i * VAD_FRAME_SAMPLES:(i + 1) * VAD_FRAME_SAMPLES]
+            if len(frame) < VAD_FRAME_SAMPLES:
+                frame = np.pad(frame, (0, VAD_FRAME_SAMPLES - len(frame)))
+            probabilities[i] = model(torch.from_numpy(frame), VAD_SAMPLE_RATE).item()
+    return probabilities
+
+
+class TorchSileroEngine:
+    """Silero VAD through the TorchScript model"""
+
+    def __init__(self, model, model_path=None):
+        """model_path: the file model was loaded from, if known; it identifies the model version"""
+        self.model = model
+        if model_path:
+            self.version = _file_version('silero-torch', model_path)
+        else:
+            # Loaded elsewhere: identified by its weights (None, so nothing is cached, if it has none)
+            weights = sorted(model.state_dict().items())
+            digest = hashlib.sha1()
+            for name, tensor in weights:
+                digest.update(name.encode())
+                digest.update(tensor.detach().cpu().numpy().tobytes())
+            self.version = f"silero-torch-{digest.hexdigest()[:12]}" if weights else None
+
+    def reset(self):
+        self.model.reset_states()
+
+    def frame_probabilities(self, samples):
+        """Frame probabilities of the next part of the stream started by reset()"""
+        return silero_frame_probabilities(self.model, samples)
+
+    def batch_frame_probabilities(self, samples_list):
+        """Frame probabilities of several recordings, scored together one frame step at a time"""
+        import torch
+        batch = _FrameBatch(samples_list)
+        self.model.reset_states()
+        with torch.no_grad():
+            for step in range(batch.steps):
+                # The TorchScript state cannot drop finished rows, so they are fed silence
+                frames = batch.frames(step, len(samples_list))
+                batch.store(step, self.model(torch.from_numpy(frames), VAD_SAMPLE_RATE).numpy().reshape(-1))
+        self.model.reset_states()
+        return batch.probabilities
+
+
+class OnnxSileroEngine:
+    """Silero VAD (v4 or v5 ONNX export) through ONNX Runtime, without torch"""
+
+    def __init__(self, model_path, num_threads=1):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.inter_op_num_threads = 1
+        options.intra_op_num_threads = max(1, int(num_threads or 1))
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        # v5 takes one recurrent state plus 64 samples of context, v4 separate h and c states
+        self.v5 = 'state' in {i.name for i in self.session.get_inputs()}
+        self.version = _file_version('silero-onnx', model_path)
+        self._sr = np.array(VAD_SAMPLE_RATE, dtype=np.int64)
+        self.reset()
+
+    def reset(self, batch_size=1):
+        self._rows = batch_size
+        if self.v5:
+            self._state = np.zeros((2, batch_size, 128), dtype=np.float32)
+            self._context = np.zeros((batch_size, VAD_CONTEXT_SAMPLES), dtype=np.float32)
+        else:
+            self._h = np.zeros((2, batch_size, 64), dtype=np.float32)
+            self._c = np.zeros((2, batch_size, 64), dtype=np.float32)
+
+    def _keep(self, rows):
+        """Drops the state of all but the first rows of the batch"""
+        self._rows = rows
+        if self.v5:
+            self._state = np.ascontiguousarray(self._state[:, :rows])
+            self._context = self._context[:rows]
+        else:
+            self._h = np.ascontiguousarray(self._h[:, :rows])
+            self._c = np.ascontiguousarray(self._c[:, :rows])
+
+    def _run(self, frames):
+        if self.v5:
+            x = np.concatenate([self._context, frames], axis=1)
+            out, self._state = self.session.run(None, {'input': x, 'state': self._state, 'sr': self._sr})
+            self._context = x[:, -VAD_CONTEXT_SAMPLES:]
+        else:
+            out, self._h, self._c = self.session.run(None, {'input': frames, 'sr': self._sr, 'h': self._h, 'c': self._c})
+        return out.reshape(-1)
+
+    def frame_probabilities(self, samples):
+        """Frame probabilities of the next part of the stream started by reset()"""
+        batch = _FrameBatch([samples])
+        for step in range(batch.steps):
+            batch.store(step, self._run(batch.frames(step, 1)))
+        return batch.probabilities[0]
+
+    def batch_frame_probabilities(self, samples_list):
+        """Frame probabilities of several recordings, scored together one frame step at a time"""
+        # Longest first, so finished recordings are always the tail of the batch and can be dropped
+        order = sorted(range(len(samples_list)), key=lambda i: -len(samples_list[i]))
+        batch = _FrameBatch([samples_list[i] for i in order])
+        self.reset(len(order))
+        for step in range(batch.steps):
+            rows = batch.active(step)
+            if rows != self._rows:
+                self._keep(rows)
+            batch.store(step, self._run(batch.frames(step, rows)))
+        self.reset()
+        probabilities = [None] * len(order)
+        for position, i in enumerate(order):
+            probabilities[i] = batch.probabilities[position]
+        return probabilities
+
+
+class _FrameBatch:
+    """Frame-step view over several recordings: frames are gathered per step, the last one zero-padded"""
+
+    def __init__(self, samples_list):
+        self.samples_list = samples_list
+        self.frame_counts = [(len(s) + VAD_FRAME_SAMPLES - 1) // VAD_FRAME_SAMPLES for s in samples_list]
+        self.steps = max(self.frame_counts, default=0)
+        self.probabilities = [np.empty(n, dtype=np.float32) for n in self.frame_counts]
+        self._frames = np.zeros((len(samples_list), VAD_FRAME_SAMPLES), dtype=np.float32)
+
+    def active(self, step):
+        """Number of leading recordings that still have a frame at step (recordings sorted longest first)"""
+        return sum(1 for n in self.frame_counts if n > step)
+
+    def frames(self, step, rows):
+        frames = self._frames[:rows]
+        start = step * VAD_FRAME_SAMPLES
+        for row in range(rows):
+            frame = self.samples_list[row][start:start + VAD_FRAME_SAMPLES]
+            frames[row, :len(frame)] = frame
+            frames[row, len(frame):] = 0
+        return frames
+
+    def store(self, step, probabilities):
+        for row, n in enumerate(self.frame_counts):
+            if n > step:
+                self.probabilities[row][step] = probabilities[row]
+
+
+class SpeechSegmenter:
+    """
+    Silero's get_speech_timestamps decision logic (threshold with hysteresis, minimum
+    silence and speech durations, padding), fed frame probabilities incrementally.
+    push() returns the speech segments that can no longer change, as (start, end) in
+    samples; finish() returns the rest. Feeding a whole file gives the same segments as
+    get_speech_timestamps with the same parameters (and no max_speech_duration_s).
+    """
+
+    def __init__(self, threshold=0.5, min_speech_duration_ms=250, min_silence_duration_ms=100,
+                 speech_pad_ms=30, sampling_rate=VAD_SAMPLE_RATE, window_size_samples=VAD_FRAME_SAMPLES):
+        self.threshold = threshold
+        self.neg_threshold = max(threshold - 0.15, 0.01)
+        self.window_size_samples = window_size_samples
+        self.min_speech_samples = sampling_rate * min_speech_duration_ms / 1000
+        self.min_silence_samples = sampling_rate * min_silence_duration_ms / 1000
+        self.speech_pad_samples = int(sampling_rate * speech_pad_ms / 1000)
+        self.frame = 0
+        self.triggered = False
+        self.start = 0
+        self.temp_end = 0
+        # Last detected segment, padded once the next one (or the end) is known
+        self.pending = None
+
+    def push(self, probabilities):
+        segments = []
+        for speech_prob in probabilities:
+            position = self.frame * self.window_size_samples
+            self.frame += 1
+
+            if speech_prob >= self.threshold and self.temp_end:
+                self.temp_end = 0
+
+            if speech_prob >= self.threshold and not self.triggered:
+                self.triggered = True
+                self.start = position
+                continue
+
+            if speech_prob < self.neg_threshold and self.triggered:
+                if not self.temp_end:
+                    self.temp_end = position
+                if position - self.temp_end < self.min_silence_samples:
+                    continue
+                if self.temp_end - self.start > self.min_speech_samples:
+                    segments.extend(self._detected(self.start, self.temp_end))
+                self.temp_end = 0
+                self.triggered = False
+        return segments
+
+    def finish(self, total_samples):
+        """Closes the stream; total_samples is the length of the audio that was scored"""
+        segments = []
+        if self.triggered and total_samples - self.start > self.min_speech_samples:
+            segments.extend(self._detected(self.start, total_samples))
+        self.triggered = False
+        if self.pending is not None:
+            start, end = self.pending
+            segments.append((start, int(min(total_samples, end + self.speech_pad_samples))))
+            self.pending = None
+        return segments
+
+    def _detected(self, start, end):
+        if self.pending is None:
+            self.pending = (int(max(0, start - self.speech_pad_samples)), end)
+            return []
+        previous_start, previous_end = self.pending
+        silence_duration = start - previous_end
+        if silence_duration < 2 * self.speech_pad_samples:
+            previous_end += int(silence_duration // 2)
+            start = int(max(0, start - silence_duration // 2))
+        else:
+            previous_end = previous_end + self.speech_pad_samples
+            start = int(max(0, start - self.speech_pad_samples))
+        self.pending = (start, end)
+        return [(previous_start, previous_end)]
+
+
+class ChunkMerger:
+    """
+    Merges speech segments (ms) into chunks of min_len..max_len ms, incrementally:
+    a segment too short is merged with the next one, a long enough one only across
+    pauses shorter than gap_ms, and nothing is merged past max_len. Chunks still over
+    max_len are cut into max_len pieces; pieces under min_len are dropped.
+    """
+
+    def __init__(self, min_len, max_len, gap_ms=MERGE_GAP_MS):
+        self.min_len = min_len
+        self.max_len = max_len
+        self.gap_ms = gap_ms
+        self.current = None
+
+    def push(self, start, end):
+        """Adds the next speech segment; returns the chunks that are final"""
+        if self.current is None:
+            self.current = (start, end)
+            return []
+        current_start, current_end = self.current
+        gap = start - current_end
+        current_dur = current_end - current_start
+
+        # Hard constraint: Never exceed max_len
+        if end - current_start > self.max_len:
+            should_merge = False
+        else:
+            # Short chunks are merged to save them; good-sized ones only across tiny (intra-word) gaps
+            should_merge = current_dur < self.min_len or gap < self.gap_ms
+
+        if should_merge:
+            self.current = (current_start, end)
+            return []
+        self.current = (start, end)
+        return self._bounded(current_start, current_end)
+
+    def finish(self):
+        if self.current is None:
+            return []
+        chunks = self._bounded(*self.current)
+        self.current = None
+        return chunks
+
+    def _bounded(self, start, end):
+        if end - start < self.min_len:
+            return []
+        chunks = []
+        sub_start = start
+        while sub_start < end:
+            sub_end = min(sub_start + self.max_len, end)
+            if sub_end - sub_start >= self.min_len:
+                chunks.append((sub_start, sub_end))
+            sub_start = sub_end
+        return chunks
+
+
+def merge_speech_chunks(segments_ms, min_len, max_len, gap_ms=MERGE_GAP_MS):
+    """Chunk ranges (ms) for a whole list of speech segments (ms)"""
+    merger = ChunkMerger(min_len, max_len, gap_ms)
+    chunks = []
+    for start, end in segments_ms:
+        chunks.extend(merger.push(start, end))
+    chunks.extend(merger.finish())
+    return chunks
@@ -0,0 +1,200 @@
+import io
+import os
+import json
+import numpy as np
+from backend.processors.audio_io import ExportStream, decode_frames, pad_and_normalize, write_wav
+from backend.processors.split_manifest import MANIFEST_NAME, SplitManifest, content_hash
+
+# Subfolder of a splitter output folder holding one index file per source
+VIRTUAL_DIR = '_virtual'
+
+
+class VirtualChunks:
+    """
+    Chunks of a splitter output folder kept as (source file, start frame, end frame, gain)
+    (frames at the chunk's sample rate; info is the probe_audio format of the source)
+    instead of WAV files. Each source has one small JSON index, replaced whole when the
+    source is split again, so writers in different processes never share a file.
+    A chunk is read by decoding its frames from the source and applying the stored gain:
+    the samples are the same as the WAV the splitter would have written.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_dir = os.path.join(directory, VIRTUAL_DIR)
+        self._entries = None
+        # Chunk name -> source (index file) it belongs to
+        self._sources = None
+
+    @staticmethod
+    def exists(directory):
+        return os.path.isdir(os.path.join(directory, VIRTUAL_DIR))
+
+    def write_source(self, source, entries):
+        """Replaces the chunks of source (filename of the split file) with entries"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        for entry in entries:
+            try:
+                # Relative to the output folder, so storage can be moved as a whole
+                entry['source'] = os.path.relpath(entry['source'], self.directory)
+            except ValueError:
+                entry['source'] = os.path.abspath(entry['source'])
+        path = os.path.join(self.index_dir, f"{source}.json")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        self._entries = None
+        self._sources = None
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            self._sources = {}
+            if os.path.isdir(self.index_dir):
+                for name in sorted(os.listdir(self.index_dir)):
+                    if not name.endswith('.json'):
+                        continue
+                    try:
+                        with open(os.path.join(self.index_dir, name), 'r', encoding='utf-8') as f:
+                            entries = json.load(f)
+                    except (OSError, ValueError):
+                        continue
+                    for entry in entries:
+                        self._entries[entry['name']] = entry
+                        self._sources[entry['name']] = name[:-len('.json')]
+        return self._entries
+
+    def names(self):
+        """Chunk names (without extension), sorted"""
+        return sorted(self._load())
+
+    def __contains__(self, name):
+        return name in self._load()
+
+    def __len__(self):
+        return len(self._load())
+
+    def read(self, name):
+        """
+        (samples, sample_rate) of a chunk: padded and normalized (frames, channels) int16/int32.
+        Decodes just the chunk's frames, for random access; read_sources reads many chunks at once.
+        """
+        entry = self._load()[name]
+        return self._finish(entry, decode_frames(self._source_path(entry), entry['info'], entry['start'], entry['end']))
+
+    def read_sources(self, names=None):
+        """
+        (name, (samples, sample_rate)) of chunks (all by default), source by source in the order of
+        their frames: each source is decoded once, front to back, instead of once per chunk.
+        A chunk that cannot be read comes with the exception instead of its samples.
+        """
+        entries = self._load()
+        by_source = {}
+        for name in (self.names() if names is None else names):
+            by_source.setdefault(self._sources[name], []).append(name)
+        for source_names in by_source.values():
+            source_names.sort(key=lambda name: (entries[name]['start'], name))
+            first = entries[source_names[0]]
+            with ExportStream(self._source_path(first), first['info']) as stream:
+                for k, name in enumerate(source_names):
+                    try:
+                        samples = stream.frames(entries[name]['start'], entries[name]['end'])
+                    except Exception as e:
+                        # The rest of the source cannot be read either
+                        for failed in source_names[k:]:
+                            yield failed, e
+                        break
+                    yield name, self._finish(entries[name], samples)
+
+    def _finish(self, entry, samples):
+        if len(samples) < entry['end'] - entry['start']:
+            # Silence pydub's slicing added past the end of the source
+            missing = entry['end'] - entry['start'] - len(samples)
+            samples = np.concatenate([samples, np.zeros((missing, samples.shape[1]), dtype=samples.dtype)])
+        return pad_and_normalize(samples, entry['sample_rate'], gain=entry['gain']), entry['sample_rate']
+
+    def wav_bytes(self, name):
+        """The chunk as a WAV file in memory, byte for byte the file the splitter would have written"""
+        samples, sample_rate = self.read(name)
+        buffer = io.BytesIO()
+        write_wav(buffer, samples, sample_rate)
+        return buffer.getvalue()
+
+    def _source_path(self, entry):
+        source = entry['source']
+        return source if os.path.isabs(source) else os.path.join(self.directory, source)
+
+    def materialize(self, output_dir=None, names=None, progress_callback=None):
+        """
+        Writes chunks (all by default) as WAV files to output_dir (default: the output folder),
+        in <source>/<chunk>.wav like a split does, and lists them in output_dir's manifest.
+        A source whose chunks are all written is recorded as a normal split of it.
+        Returns the written paths.
+        """
+        output_dir = output_dir or self.directory
+        os.makedirs(output_dir, exist_ok=True)
+        names = self.names() if names is None else list(names)
+        self._load()
+        paths = []
+        written = {}
+        for i, (name, chunk) in enumerate(self.read_sources(names), 1):
+            if isinstance(chunk, Exception):
+                raise chunk
+            samples, sample_rate = chunk
+            source = self._sources[name]
+            path = os.path.join(output_dir, source, name + '.wav')
+            if source not in written:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_wav(path, samples, sample_rate)
+            written.setdefault(source, []).append(name)
+            paths.append(path)
+            if progress_callback:
+                progress_callback(f"Writing chunk files... {i}/{len(names)}", int(i / len(names) * 100))
+
+        # Recorded so the folder's readers (see list_chunk_files) find the files
+        in_place = os.path.abspath(output_dir) == os.path.abspath(self.directory)
+        split_manifest = SplitManifest(os.path.join(self.directory, MANIFEST_NAME))
+        manifest = split_manifest if in_place else SplitManifest(os.path.join(output_dir, MANIFEST_NAME))
+        for source, source_names in written.items():
+            entry = split_manifest.get(source)
+            if entry is not None:
+                source_hash, params, chunks = entry['hash'], dict(entry['params']), entry['chunks']
+            else:
+                chunks = sorted((name for name, chunk_source in self._sources.items() if chunk_source == source),
+                                key=lambda name: self._entries[name]['start'])
+                source_hash, params = content_hash(self._source_path(self._entries[chunks[0]])), {}
+            # Together with the files of earlier calls
+            previous = manifest.get(source)
+            files = set(previous['files'] or []) if previous is not None and 'files' in previous else set()
+            files.update(f"{source}/{name}.wav" for name in source_names)
+            if all(f"{source}/{name}.wav" in files for name in chunks):
+                # The files are the ones a split without virtual chunks writes
+                params.pop('virtual_chunks', None)
+            manifest.record(source, source_hash, params, chunks, [source] * len(chunks),
+                            [f"{source}/{name}.wav" for name in chunks if f"{source}/{name}.wav" in files])
+        if in_place:
+            # Only after the manifest lists the files, so a crash in between never loses a chunk;
+            # otherwise readers of the folder would find each chunk as a file and as a virtual chunk
+            for source, source_names in written.items():
+                self._remove(source, source_names)
+        return paths
+
+    def _remove(self, source, names):
+        """Drops names from the index of source; the index file goes once no chunk is left in it"""
+        names = set(names)
+        entries = self._load()
+        remaining = sorted((entries[name] for name, chunk_source in self._sources.items()
+                            if chunk_source == source and name not in names), key=lambda entry: entry['start'])
+        path = os.path.join(self.index_dir, f"{source}.json")
+        if remaining:
+            # Entries as loaded: their sources are already relative to the output folder
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(remaining, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        elif os.path.exists(path):
+            os.remove(path)
+        for name in names:
+            entries.pop(name, None)
+            self._sources.pop(name, None)
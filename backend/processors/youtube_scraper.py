@@ -90,8 +90,32 @@ class YouTubeScraper:
         
         return video_title_lst, release_date_lst1, release_date_lst2, video_link_lst, video_duration_lst
 
-    def download_videos(self, df):
+    def download_video(self, index, row):
+        """Downloads the audio of one metadata row. Returns the audio filename, or None on failure."""
         os.makedirs(self.output_audio_dir, exist_ok=True)
+
+        # Construct filename: channel_audio_index
+        # We use a standard naming convention to easily find it later
+        filename = f"{self.channel_name.lower()}_audio_{index}"
+        file_path = os.path.join(self.output_audio_dir, f'{filename}')
+        
+        # Copy the options so concurrent downloads never share an output template
+        ydl_opts = dict(self.ydl_opts, outtmpl=file_path)
+        
+        try:
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([row['video_link']])
+            print(f"Successfully downloaded: {row['video_title']}")
+            return filename
+        except Exception as e:
+            print(f"Error downloading {row['video_title']}: {str(e)}")
+            return None
+
+    def download_videos(self, df, checkpoint=None):
+        """
+        Downloads every video of df. Returns the audio filenames (None for failed downloads).
+        checkpoint: optional TaskCheckpoint; videos it lists as done are not downloaded again.
+        """
         total_videos = len(df)
         downloaded_files = []
         
@@ -106,25 +130,21 @@ class YouTubeScraper:
                 percent = int((index / total_videos) * 100)
                 self.progress_callback(f"Downloading {index + 1}/{total_videos}: {row['video_title'][:30]}...", percent)
             
-            # Construct filename: channel_audio_index
-            # We use a standard naming convention to easily find it later
-            filename = f"{self.channel_name.lower()}_audio_{index}"
-            file_path = os.path.join(self.output_audio_dir, f'{filename}')
-            
-            self.ydl_opts['outtmpl'] = file_path
-            
-            try:
-                with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                    ydl.download([row['video_link']])
-                print(f"Successfully downloaded: {row['video_title']}")
-                downloaded_files.append(filename)
-            except Exception as e:
-                print(f"Error downloading {row['video_title']}: {str(e)}")
-                downloaded_files.append(None) # Mark as failed
+            if checkpoint is not None and checkpoint.done(row['video_link']):
+                # Downloaded by an earlier run of this task
+                downloaded_files.append(checkpoint.get(row['video_link']))
+                continue
+
+            # None marks a failed download
+            filename = self.download_video(index, row)
+            downloaded_files.append(filename)
+            if checkpoint is not None and filename:
+                checkpoint.mark_done(row['video_link'], filename)
                 
         return downloaded_files
 
-    def collect_data(self):
+    def collect_metadata(self):
+        """Scrapes the video list of the URL. Returns a DataFrame of videos, without downloading them."""
         self._driver.get(self.channel_url)
         time.sleep(2)
 
@@ -218,9 +238,13 @@ class YouTubeScraper:
             'video_duration (min)': video_duration_lst,
             'voice': [voice_label]*len(video_link_lst),
         })
+        return df
+
+    def collect_data(self, checkpoint=None):
+        df = self.collect_metadata()
         
         # Start Downloading
-        audio_filenames = self.download_videos(df)
+        audio_filenames = self.download_videos(df, checkpoint=checkpoint)
         
         # Add filename column
         df['audio_filename'] = audio_filenames
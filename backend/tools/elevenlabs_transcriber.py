@@ -1,6 +1,9 @@
+import io
 import os
 import requests
 from pathlib import Path
+from backend.processors.split_manifest import list_chunk_files
+from backend.processors.virtual_chunks import VirtualChunks
 
 
 class ElevenLabsTranscriber:
@@ -53,7 +56,7 @@ class ElevenLabsTranscriber:
                     except Exception as backup_error:
                         print(f"❌ Failed to save backup: {backup_error}")
     
-    def transcribe_audio_folder(self, folder_path, progress_callback=None):
+    def transcribe_audio_folder(self, folder_path, progress_callback=None, checkpoint=None):
         """
         Transcribe all audio files in the given folder using ElevenLabs API.
         Saves CSV progressively after each file to preserve partial results.
@@ -61,16 +64,21 @@ class ElevenLabsTranscriber:
         Args:
             folder_path: Path to folder containing audio files
             progress_callback: Optional callback function(message, percent)
+            checkpoint: Optional TaskCheckpoint; files it lists as done are not sent again
         """
         folder = Path(folder_path)
         if not folder.exists():
             raise FileNotFoundError(f"Folder not found: {folder_path}")
         
-        # Get all audio files
-        audio_extensions = ['.wav', '.mp3', '.m4a', '.flac', '.ogg']
-        audio_files = []
-        for ext in audio_extensions:
-            audio_files.extend(folder.glob(f'*{ext}'))
+        # Get all audio files (from the manifest of a splitter output folder, see list_chunk_files)
+        audio_files = [folder.joinpath(*path.split('/')) for path in list_chunk_files(str(folder))]
+        
+        # Virtual chunks are read from their sources (a chunk also written out is read from its file)
+        virtual = VirtualChunks(str(folder)) if VirtualChunks.exists(str(folder)) else None
+        virtual_names = set()
+        if virtual is not None:
+            virtual_names = {name + '.wav' for name in virtual.names()} - {f.name for f in audio_files}
+            audio_files.extend(folder / name for name in virtual_names)
         
         # Sort files for consistent ordering
         audio_files = sorted(audio_files, key=lambda x: x.name)
@@ -87,17 +95,30 @@ class ElevenLabsTranscriber:
         try:
             # Process each audio file
             for idx, audio_file in enumerate(audio_files):
+                if checkpoint is not None and checkpoint.done(audio_file.name):
+                    # Finished by an earlier run of this task
+                    self.results.append({
+                        'audio_file': audio_file.name,
+                        'text': checkpoint.get(audio_file.name)
+                    })
+                    continue
+
                 try:
                     if progress_callback:
                         progress_callback(f"Transcribing {audio_file.name}...", int((idx / total_files) * 100))
                     
                     # Call ElevenLabs API
-                    text = self._transcribe_file(audio_file)
+                    if audio_file.name in virtual_names:
+                        text = self._transcribe_file(audio_file, virtual.wav_bytes(audio_file.stem))
+                    else:
+                        text = self._transcribe_file(audio_file)
                     
                     self.results.append({
                         'audio_file': audio_file.name,
                         'text': text
                     })
+                    if checkpoint is not None:
+                        checkpoint.mark_done(audio_file.name, text)
                     
                     # Save CSV after each successful transcription to preserve progress
                     self._save_csv()
@@ -144,12 +165,13 @@ class ElevenLabsTranscriber:
             self._save_csv()
             raise
     
-    def _transcribe_file(self, audio_file_path):
+    def _transcribe_file(self, audio_file_path, audio_bytes=None):
         """
         Transcribe a single audio file using ElevenLabs API.
         
         Args:
             audio_file_path: Path to the audio file
+            audio_bytes: Content to upload instead of reading the file (a virtual chunk)
             
         Returns:
             Transcribed text
@@ -162,7 +184,7 @@ class ElevenLabsTranscriber:
             "xi-api-key": self.api_key
         }
         
-        with open(audio_file_path, 'rb') as audio_file:
+        with (io.BytesIO(audio_bytes) if audio_bytes is not None else open(audio_file_path, 'rb')) as audio_file:
             files = {
                 'file': (audio_file_path.name, audio_file, 'audio/mpeg')
             }
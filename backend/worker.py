@@ -1,20 +1,29 @@
 import time
-import json
 import os
 import sys
+import gc
+import queue
+import argparse
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
 from pathlib import Path
 
 # Add project root to path to import user scripts
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(PROJECT_ROOT)
 
-from backend.core.file_ipc import FileIPC
+from backend.core.ipc import open_ipc
 
 # Import user scripts
 try:
     from backend.processors.youtube_scraper import YouTubeScraper
-    from backend.processors.audio_splitter import AudioSplitter
-    from backend.processors.audio_transcriber import AudioTranscriber
+    from backend.processors.audio_splitter import AudioSplitter, SWEEP_PARAMS
+    from backend.processors.vad import load_vad_engine
+    from backend.processors.virtual_chunks import VirtualChunks
+    from backend.processors.shard_writer import package_dataset
+    from backend.processors.audio_transcriber import AudioTranscriber, load_transcription_pipeline
     from backend.processors.semantic_splitter import SemanticSplitter
 except ImportError as e:
     print(f"Error importing user scripts: {e}")
@@ -23,7 +32,7 @@ except ImportError as e:
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 STORAGE_DIR = BASE_DIR / "storage"
-ipc = FileIPC(str(STORAGE_DIR))
+ipc = open_ipc(str(STORAGE_DIR))
 
 # Ensure directories exist
 (STORAGE_DIR / "datasets_csv").mkdir(parents=True, exist_ok=True)
@@ -31,18 +40,385 @@ ipc = FileIPC(str(STORAGE_DIR))
 (STORAGE_DIR / "audios" / "splitted_audios").mkdir(parents=True, exist_ok=True)
 (STORAGE_DIR / "datasets_csv" / "audio_datasets").mkdir(parents=True, exist_ok=True)
 (STORAGE_DIR / "datasets_csv" / "audio_text_datasets").mkdir(parents=True, exist_ok=True)
+# VAD speech timestamps of split files, shared by every split task
+VAD_CACHE_DIR = STORAGE_DIR / "audios" / "_vad_cache"
 
+# Rough resident sizes for models we can't introspect (bytes)
+WHISPER_MODEL_SIZES = {
+    "tiny": 75 * 1024**2,
+    "base": 150 * 1024**2,
+    "small": 500 * 1024**2,
+    "medium": 1500 * 1024**2,
+    "large-v2": 3100 * 1024**2,
+    "large-v3": 3100 * 1024**2,
+}
 
-def process_task(task_file):
-    with open(task_file, "r") as f:
-        task = json.load(f)
-    
+
+def _estimate_model_size(model):
+    """Estimates the memory held by a loaded model from its torch parameters and buffers"""
+    if isinstance(model, tuple):
+        return sum(_estimate_model_size(m) for m in model)
+    module = getattr(model, "model", model)  # transformers pipelines wrap the model
+    try:
+        tensors = list(module.parameters()) + list(module.buffers())
+    except (AttributeError, TypeError, RuntimeError):
+        return 0
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """
+    Keeps loaded models resident between tasks, keyed by (name, device, compute_type).
+    When the estimated size of all resident models exceeds the memory budget, the least
+    recently used models are evicted (the one just requested is always kept).
+    """
+
+    def __init__(self, memory_budget_bytes: int):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._models = OrderedDict()  # key -> (model, size in bytes)
+        self._lock = threading.Lock()
+
+    def get(self, name: str, device: str, compute_type: str, loader, size_bytes: int = None):
+        key = (name, device, compute_type)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+
+            print(f"Loading model {name} ({device}, {compute_type})...")
+            model = loader()
+            size = size_bytes if size_bytes is not None else _estimate_model_size(model)
+            self._models[key] = (model, size)
+            self._evict()
+            return model
+
+    def _evict(self):
+        evicted = False
+        while len(self._models) > 1 and self.resident_bytes() > self.memory_budget_bytes:
+            key, _ = self._models.popitem(last=False)
+            print(f"Evicting model {key[0]} ({key[1]}, {key[2]}) to stay within the memory budget")
+            evicted = True
+        if evicted:
+            gc.collect()
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except ImportError:
+                pass
+
+    def resident_bytes(self) -> int:
+        return sum(size for _, size in self._models.values())
+
+
+models = ModelRegistry(memory_budget_bytes=8 * 1024**3)
+
+
+def get_vad_model(backend=None):
+    """Resident Silero VAD engine, or None so the splitter falls back to silence detection"""
+    try:
+        return models.get("silero_vad", "cpu", backend or "auto", lambda: load_vad_engine(backend))
+    except Exception as e:
+        print(f"Error loading Silero VAD: {e}")
+        return None
+
+
+def get_transcription_pipeline():
+    return models.get("facebook/seamless-m4t-v2-large", "cuda:0", "float32", load_transcription_pipeline)
+
+
+def get_whisper_model(model_size, device, compute_type, cpu_threads=0, num_workers=1):
+    from faster_whisper import WhisperModel
+    name = f"faster-whisper-{model_size}"
+    if cpu_threads or num_workers > 1:
+        # Thread settings are fixed when the model is loaded
+        name += f"-t{cpu_threads}-w{num_workers}"
+    return models.get(
+        name, device, compute_type,
+        lambda: WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads, num_workers=num_workers),
+        size_bytes=WHISPER_MODEL_SIZES.get(model_size, 1500 * 1024**2)
+    )
+
+
+def payload_flag(payload, key, default):
+    """Boolean payload option, also given as the strings form posts send ("true"/"false", "1"/"0", ...)"""
+    value = payload.get(key)
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ("true", "1", "yes", "on"):
+            return True
+        if value in ("false", "0", "no", "off"):
+            return False
+        raise ValueError(f"Invalid value for {key}: {payload[key]!r} (expected true or false)")
+    return bool(value)
+
+
+def name_prefix_from_url(url):
+    """Derives the dataset name prefix from a YouTube video, playlist or channel URL"""
+    # Determine URL type and generate appropriate naming
+    if "/watch?v=" in url:
+        # Single video URL
+        # Extract video ID from URL
+        if "v=" in url:
+            video_id = url.split("v=")[-1].split("&")[0]
+            return f"video_{video_id}"
+        return "single_video"
+    elif "list=" in url:
+        # Playlist URL
+        identifier = url.split("list=")[-1].split("&")[0]
+        return f"playlist_{identifier}"
+    elif "@" in url:
+        # Channel URL
+        return url.split("@")[-1].split("/")[0]
+    return "scraped_data"
+
+
+class PipelineStopped(Exception):
+    """Raised inside a pipeline stage when another stage has failed"""
+
+
+def _put(q, item, stop_event):
+    """Puts into a bounded queue without deadlocking if the consumer has died"""
+    while True:
+        if stop_event.is_set():
+            raise PipelineStopped()
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _close(q, stop_event):
+    """Sends the end-of-stream sentinel; dropped when the pipeline is stopping, as the consumer no longer reads"""
+    try:
+        _put(q, None, stop_event)
+    except PipelineStopped:
+        pass
+
+
+def _get(q, stop_event):
+    while True:
+        if stop_event.is_set():
+            raise PipelineStopped()
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+
+def run_pipeline(task_id, payload, checkpoint):
+    """
+    Streams every video of a URL through download -> split -> transcribe, one file at a time.
+    Stages run concurrently and hand files over through bounded queues, so VAD and ASR
+    of earlier videos overlap with the download of later ones.
+    """
+    url = payload.get("playlist_url") or payload.get("channel_url")
+    name_prefix = name_prefix_from_url(url)
+    voice_name = payload.get("voice_name") or name_prefix
+    method = payload.get("method", "local")
+    queue_size = int(payload.get("queue_size", 2))
+
+    csv_dir = STORAGE_DIR / "datasets_csv"
+    csv_name = f"{name_prefix}_metadata.csv"
+    output_csv_name = payload.get("output_csv_name") or f"{name_prefix}_transcription.csv"
+
+    def progress_callback(message, percent):
+        ipc.update_progress(task_id, message, percent)
+
+    progress_callback(f"Collecting videos from {url}...", 0)
+    scraper = YouTubeScraper(
+        channel_name=name_prefix,
+        channel_url=url,
+        voice=voice_name,
+        output_dir=str(csv_dir),
+        csv_name=csv_name,
+        output_audio_dir=str(STORAGE_DIR / "audios")
+    )
+    df = scraper.collect_metadata()
+    total = len(df)
+    if total == 0:
+        raise ValueError(f"No videos found at {url}")
+    # The splitter reads titles and voices from the metadata CSV
+    df.to_csv(csv_dir / csv_name, encoding='utf-8-sig', index=False)
+
+    splitter = AudioSplitter(
+        csv_path=str(csv_dir / csv_name),
+        channel_name=name_prefix,
+        output_csv_name=f"{name_prefix}_splitted.csv",
+        output_splitted_audio_dir=str(STORAGE_DIR / "audios" / "splitted_audios"),
+        output_audio_dir=str(STORAGE_DIR / "audios"),
+        output_csv_dir=str(csv_dir / "audio_datasets"),
+        silence_len=int(payload.get("silence_len", 300)),
+        min_audio_len=int(payload.get("min_audio_len", 2000)),
+        max_audio_len=int(payload.get("max_audio_len", 25000)),
+        merge_gap_ms=int(payload.get("merge_gap_ms", 200)),
+        vad_model=get_vad_model(payload.get("vad_backend")),
+        vad_backend=payload.get("vad_backend"),
+        vad_cache_dir=str(VAD_CACHE_DIR),
+        streaming_vad=payload_flag(payload, "streaming_vad", None)
+    )
+
+    if method == "elevenlabs":
+        api_key = payload.get("api_key")
+        if not api_key:
+            raise ValueError("API key is required for ElevenLabs transcription")
+        from backend.tools.elevenlabs_transcriber import ElevenLabsTranscriber
+        transcriber = ElevenLabsTranscriber(
+            api_key=api_key,
+            csv_filename=output_csv_name,
+            output_csv_dir=str(csv_dir / "audio_text_datasets")
+        )
+        transcribe_file = lambda path: transcriber._transcribe_file(Path(path))
+        save_transcriptions = lambda transcriptions: transcriber._save_csv(
+            [{'audio_file': name, 'text': text} for name, text in transcriptions.items()])
+    else:
+        transcriber = AudioTranscriber(
+            csv_filename=output_csv_name,
+            output_csv_dir=str(csv_dir / "audio_text_datasets"),
+            transcription_pipeline=get_transcription_pipeline()
+        )
+        transcribe_file = lambda path: transcriber.transcribe_audio(path)['text']
+        save_transcriptions = transcriber._save_csv
+
+    downloaded_q = queue.Queue(maxsize=queue_size)
+    splitted_q = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+    errors = []
+    counts = {"downloaded": 0, "splitted": 0, "transcribed": 0}
+    split_rows = ([], [], [], [])  # video titles, original names, chunk names, voices
+
+    def report(message):
+        done = counts["downloaded"] + counts["splitted"] + counts["transcribed"]
+        progress_callback(
+            f"{message} (downloaded {counts['downloaded']}/{total}, split {counts['splitted']}/{total}, "
+            f"transcribed {counts['transcribed']}/{total})",
+            int(done / (3 * total) * 100)
+        )
+
+    audio_filenames = {}
+
+    def download_stage():
+        try:
+            for index, row in df.iterrows():
+                key = f"download:{row['video_link']}"
+                if checkpoint.done(key):
+                    filename = checkpoint.get(key)
+                else:
+                    filename = scraper.download_video(index, row)
+                    if filename:
+                        checkpoint.mark_done(key, filename)
+                audio_filenames[index] = filename
+                counts["downloaded"] += 1
+                report(f"Downloaded {row['video_title'][:30]}")
+                if filename:
+                    _put(downloaded_q, (row, filename), stop_event)
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            _close(downloaded_q, stop_event)
+
+    def split_stage():
+        try:
+            while True:
+                item = _get(downloaded_q, stop_event)
+                if item is None:
+                    break
+                row, filename = item
+                key = f"split:{filename}"
+                if checkpoint.done(key):
+                    chunks, originals = checkpoint.get(key)
+                else:
+                    chunks, originals = splitter.split_audio(filename)
+                    checkpoint.mark_done(key, [chunks, originals])
+                split_rows[0].extend([row['video_title']] * len(chunks))
+                split_rows[1].extend(originals)
+                split_rows[2].extend(chunks)
+                split_rows[3].extend([row['voice']] * len(chunks))
+                counts["splitted"] += 1
+                report(f"Split {filename} into {len(chunks)} chunks")
+                _put(splitted_q, (filename, chunks), stop_event)
+        except PipelineStopped:
+            pass
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            _close(splitted_q, stop_event)
+
+    stages = [threading.Thread(target=download_stage, daemon=True),
+              threading.Thread(target=split_stage, daemon=True)]
+    for stage in stages:
+        stage.start()
+
+    # Transcription runs on this thread, next to the model
+    transcriptions = {}
+    try:
+        while True:
+            item = _get(splitted_q, stop_event)
+            if item is None:
+                break
+            filename, chunks = item
+            key = f"transcribe:{filename}"
+            if checkpoint.done(key):
+                transcriptions.update(checkpoint.get(key))
+            else:
+                file_transcriptions = {}
+                for chunk in chunks:
+                    chunk_path = splitter.chunk_path(filename, chunk)
+                    file_transcriptions[chunk + '.wav'] = transcribe_file(chunk_path)
+                checkpoint.mark_done(key, file_transcriptions)
+                transcriptions.update(file_transcriptions)
+            counts["transcribed"] += 1
+            report(f"Transcribed {filename}")
+            # Save after each file to preserve progress
+            save_transcriptions(transcriptions)
+    except PipelineStopped:
+        pass
+    except Exception as e:
+        errors.append(e)
+        stop_event.set()
+    finally:
+        for stage in stages:
+            stage.join()
+        # Same metadata CSV as a scrape task, so the files can be re-split later
+        df['audio_filename'] = [audio_filenames.get(index) for index in df.index]
+        df[df['audio_filename'].notna()].to_csv(csv_dir / csv_name, encoding='utf-8-sig', index=False)
+        splitter.save_csv(*split_rows)
+        save_transcriptions(transcriptions)
+
+    if errors:
+        raise errors[0]
+
+    progress_callback("Pipeline finished", 100)
+    return {
+        "status": "success",
+        "csv_filename": csv_name,
+        "output_csv": splitter.output_csv_name,
+        "transcription_csv": output_csv_name,
+        "method": method,
+        "videos": total,
+        "clips": len(transcriptions)
+    }
+
+
+def process_task(task):
     task_id = task["task_id"]
     task_type = task["type"]
     payload = task["payload"]
     
     print(f"Processing task: {task_id} ({task_type})")
     
+    # Input files finished by an earlier (crashed) run of this task are skipped
+    checkpoint = ipc.open_checkpoint(task_id)
+    if len(checkpoint):
+        print(f"Resuming task {task_id}: {len(checkpoint)} item(s) already done")
+
     result = None
     try:
         if task_type == "scrape_youtube":
@@ -51,25 +427,7 @@ def process_task(task_file):
             url = payload.get("playlist_url") or payload.get("channel_url")
             
             # Voice name is optional now, derive from URL or use default
-            # Determine URL type and generate appropriate naming
-            if "/watch?v=" in url:
-                # Single video URL
-                # Extract video ID from URL
-                if "v=" in url:
-                    video_id = url.split("v=")[-1].split("&")[0]
-                    name_prefix = f"video_{video_id}"
-                else:
-                    name_prefix = "single_video"
-            elif "list=" in url:
-                # Playlist URL
-                identifier = url.split("list=")[-1].split("&")[0]
-                name_prefix = f"playlist_{identifier}"
-            elif "@" in url:
-                # Channel URL
-                identifier = url.split("@")[-1].split("/")[0]
-                name_prefix = identifier
-            else:
-                name_prefix = "scraped_data"
+            name_prefix = name_prefix_from_url(url)
                 
             voice_name = payload.get("voice_name") or name_prefix
             
@@ -91,7 +449,7 @@ def process_task(task_file):
                 output_audio_dir=output_audio_dir,
                 progress_callback=scraper_progress
             )
-            scraper.collect_data()
+            scraper.collect_data(checkpoint=checkpoint)
             
             result = {
                 "status": "success", 
@@ -131,7 +489,18 @@ def process_task(task_file):
                     output_csv_dir=str(STORAGE_DIR / "datasets_csv" / "audio_datasets"),
                     progress_callback=progress_callback,
                     silence_len=int(silence_len),
-                    max_audio_len=int(max_audio_len)
+                    min_audio_len=int(payload.get("min_audio_len", 2000)),
+                    max_audio_len=int(max_audio_len),
+                    merge_gap_ms=int(payload.get("merge_gap_ms", 200)),
+                    vad_model=get_vad_model(payload.get("vad_backend")),
+                    # Pool workers (num_workers > 1) load their own engine from this
+                    vad_backend=payload.get("vad_backend"),
+                    vad_cache_dir=str(VAD_CACHE_DIR),
+                    num_workers=int(payload.get("num_workers", 1)),
+                    streaming_vad=payload_flag(payload, "streaming_vad", None),
+                    virtual_chunks=payload_flag(payload, "virtual_chunks", False),
+                    layout=payload.get("chunk_layout", "sharded"),
+                    io_threads=int(payload.get("io_threads", 2))
                 )
             elif audio_folder:
                 # Handle direct folder input
@@ -155,7 +524,17 @@ def process_task(task_file):
                     output_csv_dir=str(STORAGE_DIR / "datasets_csv" / "audio_datasets"),
                     progress_callback=progress_callback,
                     silence_len=int(silence_len),
-                    max_audio_len=int(max_audio_len)
+                    min_audio_len=int(payload.get("min_audio_len", 2000)),
+                    max_audio_len=int(max_audio_len),
+                    merge_gap_ms=int(payload.get("merge_gap_ms", 200)),
+                    vad_model=get_vad_model(payload.get("vad_backend")),
+                    vad_backend=payload.get("vad_backend"),
+                    vad_cache_dir=str(VAD_CACHE_DIR),
+                    num_workers=int(payload.get("num_workers", 1)),
+                    streaming_vad=payload_flag(payload, "streaming_vad", None),
+                    virtual_chunks=payload_flag(payload, "virtual_chunks", False),
+                    layout=payload.get("chunk_layout", "sharded"),
+                    io_threads=int(payload.get("io_threads", 2))
                 )
             else:
                 raise ValueError("Either csv_filename or audio_folder must be provided")
@@ -190,22 +569,38 @@ def process_task(task_file):
                 if SemanticSplitter is None:
                     raise ImportError("SemanticSplitter is not available. Please install 'faster-whisper' and 'torchaudio'.")
 
+                import torch
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+                compute_type = "float16" if device == "cuda" else "int8"
+                model_size = payload.get("whisper_model", "medium")
+                cpu_threads = int(payload.get("whisper_cpu_threads", 0))
+                whisper_workers = max(1, int(payload.get("whisper_num_workers", 1)))
                 semantic_splitter = SemanticSplitter(
                     input_audio_folder=target_folder_semantic,
                     output_splitted_audio_dir=str(STORAGE_DIR / "audios" / "splitted_audios"),
                     output_csv_dir=str(STORAGE_DIR / "datasets_csv" / "audio_datasets"),
-                    progress_callback=progress_callback
+                    model_size=model_size,
+                    device=device,
+                    progress_callback=progress_callback,
+                    model=get_whisper_model(model_size, device, compute_type, cpu_threads, whisper_workers),
+                    batch_size=payload.get("whisper_batch_size"),
+                    beam_size=int(payload.get("whisper_beam_size", 5)),
+                    word_timestamps=payload_flag(payload, "whisper_word_timestamps", True),
+                    cpu_threads=cpu_threads,
+                    num_workers=whisper_workers
                 )
-                res = semantic_splitter.split_audio()
+                res = semantic_splitter.split_audio(checkpoint=checkpoint)
                 
                 result = {
                     "status": "success",
                     "output_csv": res["csv_filename"],
-                    "audio_dir": res["audio_dir"]
+                    "audio_dir": res["audio_dir"],
+                    "whisper_options": res["options"],
+                    "speed_factor": res["speed_factor"]
                 }
             else:
                 # VAD Mode (Existing)
-                splitter.process_videos()
+                splitter.process_videos(checkpoint=checkpoint)
                 
                 result = {
                     "status": "success",
@@ -213,6 +608,116 @@ def process_task(task_file):
                     "audio_dir": str(STORAGE_DIR / "audios" / "splitted_audios")
                 }
 
+        elif task_type == "split_sweep":
+            # Payload: csv_filename OR audio_folder, and param_sets (list of {min_audio_len, max_audio_len,
+            # merge_gap_ms}) or param_grid (lists of values per key, every combination is tried),
+            # optional histogram_bins (seconds). Writes no audio.
+            def progress_callback(message, percent):
+                ipc.update_progress(task_id, message, percent)
+
+            param_sets = payload.get("param_sets")
+            if param_sets:
+                if not isinstance(param_sets, list) or not all(isinstance(params, dict) for params in param_sets):
+                    raise ValueError("param_sets must be a list of objects")
+            else:
+                grid = payload.get("param_grid") or {}
+                if not isinstance(grid, dict):
+                    raise ValueError("param_grid must be an object of value lists")
+                unknown = set(grid) - set(SWEEP_PARAMS)
+                if unknown:
+                    raise ValueError(f"Unknown split setting(s) in param_grid: {', '.join(sorted(unknown))}")
+                if not all(isinstance(values, list) for values in grid.values()):
+                    raise ValueError("Every param_grid entry must be a list of values")
+                keys = [key for key in SWEEP_PARAMS if grid.get(key)]
+                param_sets = [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+            if not param_sets:
+                raise ValueError("param_sets or param_grid must list at least one split setting")
+
+            common = dict(
+                output_splitted_audio_dir=str(STORAGE_DIR / "audios" / "splitted_audios"),
+                output_csv_dir=str(STORAGE_DIR / "datasets_csv" / "audio_datasets"),
+                progress_callback=progress_callback,
+                vad_model=get_vad_model(payload.get("vad_backend")),
+                vad_backend=payload.get("vad_backend"),
+                vad_cache_dir=str(VAD_CACHE_DIR),
+                streaming_vad=payload_flag(payload, "streaming_vad", None)
+            )
+            if payload.get("csv_filename"):
+                splitter = AudioSplitter(
+                    csv_path=str(STORAGE_DIR / "datasets_csv" / payload["csv_filename"]),
+                    output_audio_dir=str(STORAGE_DIR / "audios"),
+                    **common
+                )
+            elif payload.get("audio_folder"):
+                target_folder = Path(payload["audio_folder"])
+                if not target_folder.is_absolute():
+                    target_folder = STORAGE_DIR / target_folder
+                if not target_folder.exists():
+                    raise FileNotFoundError(f"Audio folder not found: {target_folder}")
+                splitter = AudioSplitter(input_audio_folder=str(target_folder), **common)
+            else:
+                raise ValueError("Either csv_filename or audio_folder must be provided")
+
+            print(f"Sweeping {len(param_sets)} split setting(s)...")
+            result = {"status": "success", **splitter.sweep(param_sets, payload.get("histogram_bins"))}
+
+        elif task_type == "materialize_chunks":
+            # Payload: audio_folder (split output holding virtual chunks, default splitted_audios),
+            # output_folder (default: the same folder)
+            def progress_callback(message, percent):
+                ipc.update_progress(task_id, message, percent)
+
+            audio_folder = Path(payload.get("audio_folder") or STORAGE_DIR / "audios" / "splitted_audios")
+            if not audio_folder.is_absolute():
+                audio_folder = STORAGE_DIR / audio_folder
+            output_folder = payload.get("output_folder")
+            if output_folder and not Path(output_folder).is_absolute():
+                output_folder = str(STORAGE_DIR / output_folder)
+            if not VirtualChunks.exists(str(audio_folder)):
+                raise FileNotFoundError(f"No virtual chunks in {audio_folder}")
+
+            paths = VirtualChunks(str(audio_folder)).materialize(output_folder, progress_callback=progress_callback)
+            result = {
+                "status": "success",
+                "chunks": len(paths),
+                "audio_dir": output_folder or str(audio_folder)
+            }
+
+        elif task_type == "package_dataset":
+            # Payload: audio_folder (split output, default splitted_audios), output_folder (default
+            # datasets/<name>), name, format ('tar' or 'parquet'), shard_size_mb, split_csv_name
+            # (in datasets_csv/audio_datasets), transcript_csv_name (in datasets_csv/audio_text_datasets), require_text
+            def progress_callback(message, percent):
+                ipc.update_progress(task_id, message, percent)
+
+            audio_folder = Path(payload.get("audio_folder") or STORAGE_DIR / "audios" / "splitted_audios")
+            if not audio_folder.is_absolute():
+                audio_folder = STORAGE_DIR / audio_folder
+            name = payload.get("name") or "dataset"
+            output_folder = Path(payload.get("output_folder") or STORAGE_DIR / "datasets" / name)
+            if not output_folder.is_absolute():
+                output_folder = STORAGE_DIR / output_folder
+            split_csv = payload.get("split_csv_name")
+            transcript_csv = payload.get("transcript_csv_name")
+
+            summary = package_dataset(
+                str(audio_folder),
+                str(output_folder),
+                shard_format=payload.get("format", "tar"),
+                shard_size_mb=float(payload.get("shard_size_mb", 1024)),
+                split_csv=str(STORAGE_DIR / "datasets_csv" / "audio_datasets" / split_csv) if split_csv else None,
+                transcript_csv=str(STORAGE_DIR / "datasets_csv" / "audio_text_datasets" / transcript_csv) if transcript_csv else None,
+                prefix=name,
+                require_text=payload_flag(payload, "require_text", False),
+                progress_callback=progress_callback
+            )
+            result = {"status": "success", "output_dir": str(output_folder), **summary}
+
+        elif task_type == "pipeline":
+            # Payload: playlist_url/channel_url, voice_name, silence_len, max_audio_len,
+            # method ('local' or 'elevenlabs'), api_key, output_csv_name, queue_size
+            result = run_pipeline(task_id, payload, checkpoint)
+
         elif task_type == "transcribe_audio":
             # Payload: output_csv_name, method ('local' or 'elevenlabs'), api_key (if elevenlabs)
             
@@ -247,14 +752,15 @@ def process_task(task_file):
                     csv_filename=output_csv_name,
                     output_csv_dir=str(STORAGE_DIR / "datasets_csv" / "audio_text_datasets")
                 )
-                transcriber.transcribe_audio_folder(target_folder, progress_callback=progress_callback)
+                transcriber.transcribe_audio_folder(target_folder, progress_callback=progress_callback, checkpoint=checkpoint)
             else:
                 # Use local STT model
                 transcriber = AudioTranscriber(
                     csv_filename=output_csv_name,
-                    output_csv_dir=str(STORAGE_DIR / "datasets_csv" / "audio_text_datasets")
+                    output_csv_dir=str(STORAGE_DIR / "datasets_csv" / "audio_text_datasets"),
+                    transcription_pipeline=get_transcription_pipeline()
                 )
-                transcriber.transcribe_audio_folder(target_folder, progress_callback=progress_callback)
+                transcriber.transcribe_audio_folder(target_folder, progress_callback=progress_callback, checkpoint=checkpoint)
             
             result = {
                 "status": "success",
@@ -262,42 +768,115 @@ def process_task(task_file):
                 "method": method
             }
 
-        # Write Result
-        result_file = ipc.results_dir / f"{task_id}_result.json"
-        with open(result_file, "w") as f:
-            json.dump(result, f)
-            
+        # Write Result and release the claim
+        if not ipc.complete_task(task_id, result):
+            print(f"Task {task_id} finished after its lease was lost; another worker owns it, result discarded.")
+            return
+
         print(f"Task {task_id} completed.")
-        
-        # Remove job file
-        os.remove(task_file)
 
     except Exception as e:
         print(f"Error processing task {task_id}: {e}")
         import traceback
         traceback.print_exc()
         
-        # Write error result
-        result_file = ipc.results_dir / f"{task_id}_result.json"
-        with open(result_file, "w") as f:
-            json.dump({"status": "error", "message": str(e)}, f)
-        os.remove(task_file)
+        # Write error result (skipped if the lease was lost to another worker)
+        ipc.complete_task(task_id, {"status": "error", "message": str(e)})
+
+class LeaseHeartbeat:
+    """Renews the lease on a claimed task in the background while it is being processed"""
+
+    def __init__(self, task_id: str, interval: float):
+        self.task_id = task_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not ipc.renew_lease(self.task_id):
+                # The claim cannot come back; complete_task will discard this worker's result
+                print(f"WARNING: lost the lease on task {self.task_id}; another worker may take it over")
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def compaction_loop(retention_hours: float, interval_minutes: float):
+    """Periodically archives finished tasks so the storage directories stay small"""
+    while True:
+        try:
+            archived = ipc.compact(retention_hours * 3600)
+            if archived:
+                print(f"Archived {archived} finished task(s).")
+        except Exception as e:
+            print(f"Error during compaction: {e}")
+        time.sleep(interval_minutes * 60)
+
+
+def worker_loop(model_memory_gb: float = None):
+    """Claims and processes jobs until interrupted. Safe to run in several processes at once."""
+    if model_memory_gb is not None:
+        models.memory_budget_bytes = int(model_memory_gb * 1024**3)
+    print(f"TTS Worker {os.getpid()} started. Waiting for jobs...")
+    try:
+        while True:
+            # Blocks on filesystem events until a job is available
+            task = ipc.next_job()
+            with LeaseHeartbeat(task["task_id"], ipc.lease_seconds / 3):
+                process_task(task)
+    except KeyboardInterrupt:
+        pass
 
 def main():
+    parser = argparse.ArgumentParser(description="TTS dataset worker")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes draining the job queue in parallel (default: 1)")
+    parser.add_argument("--model-memory-gb", type=float, default=8.0,
+                        help="Memory budget per worker for models kept loaded between tasks (default: 8)")
+    parser.add_argument("--retention-hours", type=float, default=168,
+                        help="Archive finished task records older than this, 0 to keep them (default: 168)")
+    parser.add_argument("--compact-interval-minutes", type=float, default=60,
+                        help="How often finished tasks are archived (default: 60)")
+    args = parser.parse_args()
+
+    # Jobs claimed by a worker that died are put back in the queue
+    recovered = ipc.recover_claims()
+    if recovered:
+        print(f"Recovered {recovered} job(s) from stopped workers.")
+
+    if args.retention_hours > 0:
+        threading.Thread(
+            target=compaction_loop, args=(args.retention_hours, args.compact_interval_minutes), daemon=True
+        ).start()
+
     # Check for pending jobs on startup
-    pending_jobs = list(ipc.jobs_dir.glob("*.json"))
+    pending_jobs = ipc.count_pending()
     if pending_jobs:
-        print(f"Found {len(pending_jobs)} pending job(s). Will process them...")
-    
-    print("TTS Worker started. Waiting for jobs...")
-    while True:
-        # List all json files in jobs dir
-        job_files = list(ipc.jobs_dir.glob("*.json"))
-        if job_files:
-            # Pick the first one
-            process_task(job_files[0])
-        else:
-            time.sleep(1)
+        print(f"Found {pending_jobs} pending job(s). Will process them...")
+
+    if args.workers <= 1:
+        worker_loop(args.model_memory_gb)
+        return
+
+    print(f"Starting {args.workers} worker processes...")
+    # Not daemonic, so a task can still start its own process pool (split_audio num_workers)
+    processes = [multiprocessing.Process(target=worker_loop, args=(args.model_memory_gb,)) for _ in range(args.workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("Stopping workers...")
+        for process in processes:
+            process.terminate()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,161 @@
+import os
+import sys
+import io
+import glob
+import importlib.util
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent as pydub_detect_nonsilent
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from backend.processors.audio_io import detect_nonsilent, pad_and_normalize, write_wav
+from backend.processors.vad import VAD_FRAME_SAMPLES, SpeechSegmenter, _silero_hub_dir
+
+
+def random_audio(rng, seconds, sample_rate, channels, dtype=np.int16):
+    """Noise bursts of random loudness separated by quiet stretches, as a (frames, channels) array"""
+    limit = np.iinfo(dtype).max
+    parts = []
+    frames = int(seconds * sample_rate)
+    while sum(len(part) for part in parts) < frames:
+        length = int(rng.uniform(0.05, 0.6) * sample_rate)
+        level = rng.choice([0.0, 0.001, 0.3, 0.8])
+        parts.append((rng.standard_normal((length, channels)) * level * limit / 3).clip(-limit, limit).astype(dtype))
+    return np.concatenate(parts)[:frames]
+
+
+def to_segment(samples, sample_rate):
+    return AudioSegment(data=samples.tobytes(), sample_width=samples.dtype.itemsize, frame_rate=sample_rate, channels=samples.shape[1])
+
+
+def test_detect_nonsilent_matches_pydub():
+    print("Testing detect_nonsilent against pydub.silence.detect_nonsilent...")
+    rng = np.random.default_rng(0)
+    mismatches = 0
+    cases = 0
+    for channels in (1, 2):
+        for sample_rate in (8000, 22050):
+            for min_silence_len, silence_thresh, seek_step in ((300, -40, 1), (500, -30, 10), (100, -50, 7)):
+                samples = random_audio(rng, 3, sample_rate, channels)
+                expected = pydub_detect_nonsilent(to_segment(samples, sample_rate), min_silence_len, silence_thresh, seek_step)
+                got = detect_nonsilent(samples, sample_rate, min_silence_len, silence_thresh, seek_step)
+                cases += 1
+                if got != expected:
+                    mismatches += 1
+                    print(f"  {channels} ch, {sample_rate} Hz, {min_silence_len}/{silence_thresh}/{seek_step}: {got} != {expected}")
+    if mismatches:
+        print(f"FAILURE: {mismatches} of {cases} cases differ from pydub.")
+    else:
+        print(f"SUCCESS: {cases} cases give the same ranges as pydub.")
+
+
+def test_pad_and_normalize_matches_pydub():
+    print("Testing pad_and_normalize and write_wav against pydub's pad, normalize and export...")
+    rng = np.random.default_rng(1)
+    mismatches = 0
+    cases = 0
+    for channels in (1, 2):
+        for sample_rate in (16000, 44100):
+            for seconds in (0.3, 2.5):
+                samples = random_audio(rng, seconds, sample_rate, channels)
+                # What the splitter did before: silent(50) + chunk + silent(50), matched to -20 dBFS
+                silence = AudioSegment.silent(duration=50)
+                padded = silence + to_segment(samples, sample_rate) + silence
+                normalized = padded.apply_gain(-20.0 - padded.dBFS)
+                expected = io.BytesIO()
+                normalized.export(expected, format="wav")
+
+                got = io.BytesIO()
+                write_wav(got, pad_and_normalize(samples, sample_rate, -20.0), sample_rate)
+                cases += 1
+                if got.getvalue() != expected.getvalue():
+                    mismatches += 1
+                    print(f"  {channels} ch, {sample_rate} Hz, {seconds} s: WAV bytes differ")
+    if mismatches:
+        print(f"FAILURE: {mismatches} of {cases} chunks differ from pydub's export.")
+    else:
+        print(f"SUCCESS: {cases} chunks are byte for byte pydub's export.")
+
+
+def load_reference_get_speech_timestamps():
+    """Silero's own get_speech_timestamps (silero-vad package or torch.hub checkout), or None"""
+    if importlib.util.find_spec('torch') is None:
+        return None
+    try:
+        from silero_vad import get_speech_timestamps
+        return get_speech_timestamps
+    except ImportError:
+        pass
+    hub_dir = _silero_hub_dir()
+    paths = glob.glob(os.path.join(hub_dir, 'src', 'silero_vad', 'utils_vad.py')) + glob.glob(os.path.join(hub_dir, 'utils_vad.py'))
+    if not paths:
+        return None
+    spec = importlib.util.spec_from_file_location('silero_utils_vad', paths[0])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.get_speech_timestamps
+
+
+class FixedProbabilities:
+    """Stands in for the Silero model: returns a fixed speech probability per frame"""
+
+    def __init__(self, probabilities):
+        self.probabilities = probabilities
+        self.frame = 0
+
+    def reset_states(self):
+        self.frame = 0
+
+    def __call__(self, chunk, sampling_rate):
+        import torch
+        probability = self.probabilities[self.frame]
+        self.frame += 1
+        return torch.tensor([[probability]])
+
+
+def test_speech_segmenter_matches_get_speech_timestamps():
+    print("Testing SpeechSegmenter against Silero's get_speech_timestamps...")
+    get_speech_timestamps = load_reference_get_speech_timestamps()
+    if get_speech_timestamps is None:
+        print("SKIPPED: needs torch and silero-vad (package or torch.hub checkout).")
+        return
+    import torch
+
+    rng = np.random.default_rng(2)
+    mismatches = 0
+    cases = 0
+    for threshold, min_silence_ms in ((0.5, 100), (0.4, 300)):
+        for total_samples in (VAD_FRAME_SAMPLES * 900, VAD_FRAME_SAMPLES * 900 - 200):
+            frames = (total_samples + VAD_FRAME_SAMPLES - 1) // VAD_FRAME_SAMPLES
+            # Runs of speech-like and silence-like frames, with values around both thresholds
+            probabilities = np.repeat(rng.uniform(0, 1, frames // 5 + 1), 5)[:frames].astype(np.float32)
+            probabilities += rng.normal(0, 0.1, frames).astype(np.float32)
+            probabilities = probabilities.clip(0, 1)
+
+            expected = get_speech_timestamps(torch.zeros(total_samples), FixedProbabilities(probabilities.tolist()),
+                                             threshold=threshold, min_silence_duration_ms=min_silence_ms)
+            expected = [(segment['start'], segment['end']) for segment in expected]
+
+            # Fed in uneven pieces, as the windowed VAD does
+            segmenter = SpeechSegmenter(threshold=threshold, min_silence_duration_ms=min_silence_ms)
+            got = []
+            for start in range(0, frames, 137):
+                got += segmenter.push(probabilities[start:start + 137].tolist())
+            got += segmenter.finish(total_samples)
+            cases += 1
+            if got != expected:
+                mismatches += 1
+                print(f"  threshold {threshold}, min silence {min_silence_ms} ms, {total_samples} samples: {got} != {expected}")
+    if mismatches:
+        print(f"FAILURE: {mismatches} of {cases} probability sequences differ from get_speech_timestamps.")
+    else:
+        print(f"SUCCESS: {cases} probability sequences give the same segments as get_speech_timestamps.")
+
+
+if __name__ == "__main__":
+    test_detect_nonsilent_matches_pydub()
+    test_pad_and_normalize_matches_pydub()
+    test_speech_segmenter_matches_get_speech_timestamps()
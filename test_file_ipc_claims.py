@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from backend.core.file_ipc import FileIPC
+
+
+def drain_queue(storage_dir, claimed):
+    ipc = FileIPC(storage_dir)
+    task_ids = []
+    while True:
+        task = ipc.claim_job()
+        if task is None:
+            break
+        task_ids.append(task["task_id"])
+    claimed.put(task_ids)
+
+
+def claim_then_complete(storage_dir, claimed, go, completed):
+    ipc = FileIPC(storage_dir, lease_seconds=1)
+    task_id = ipc.claim_job()["task_id"]
+    claimed.put(task_id)
+    go.wait(30)
+    completed.put(ipc.complete_task(task_id, {"status": "success", "by": "first worker"}))
+
+
+def expire_claims(ipc):
+    """Backdates every claim as if its owner had stopped renewing the lease"""
+    past = time.time() - 3600
+    for claim_path in ipc.claimed_dir.glob("*.json"):
+        os.utime(claim_path, (past, past))
+
+
+def test_each_job_claimed_once():
+    print("Testing concurrent claim_job from several processes...")
+    with tempfile.TemporaryDirectory() as storage_dir:
+        ipc = FileIPC(storage_dir)
+        task_ids = {ipc.create_task("test", {"n": i}) for i in range(40)}
+
+        claimed = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=drain_queue, args=(storage_dir, claimed)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        results = [claimed.get(timeout=60) for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        all_claims = [task_id for result in results for task_id in result]
+        if len(all_claims) == len(set(all_claims)) and set(all_claims) == task_ids:
+            print(f"SUCCESS: {len(task_ids)} jobs claimed exactly once by {len(workers)} workers.")
+        else:
+            print(f"FAILURE: {len(all_claims)} claims, {len(set(all_claims))} distinct, expected {len(task_ids)}.")
+
+
+def test_expired_lease_is_requeued():
+    print("Testing that a claim with an expired lease goes back into the queue...")
+    with tempfile.TemporaryDirectory() as storage_dir:
+        ipc = FileIPC(storage_dir, lease_seconds=1)
+        task_id = ipc.create_task("test", {})
+        ipc.claim_job()
+
+        if not ipc.renew_lease(task_id):
+            print("FAILURE: Could not renew the lease of a claimed task.")
+            return
+        if ipc.claim_job() is not None:
+            print("FAILURE: A claim with a valid lease was handed out again.")
+            return
+
+        expire_claims(ipc)
+        ipc._requeue_expired_claims()
+        if ipc.get_task_status(task_id) != "pending":
+            print(f"FAILURE: Expected the expired task to be pending, got {ipc.get_task_status(task_id)}.")
+            return
+        if ipc.renew_lease(task_id):
+            print("FAILURE: The lease of a requeued task could still be renewed.")
+            return
+
+        task = ipc.claim_job()
+        if task and task["task_id"] == task_id and task["status"] == "processing":
+            print("SUCCESS: The expired job was requeued and claimed again.")
+        else:
+            print(f"FAILURE: Expected to reclaim {task_id}, got {task}")
+
+
+def test_complete_after_lost_lease():
+    print("Testing complete_task from a worker whose lease was taken over...")
+    with tempfile.TemporaryDirectory() as storage_dir:
+        ipc = FileIPC(storage_dir, lease_seconds=1)
+        task_id = ipc.create_task("test", {})
+
+        claimed, completed = multiprocessing.Queue(), multiprocessing.Queue()
+        go = multiprocessing.Event()
+        first = multiprocessing.Process(target=claim_then_complete, args=(storage_dir, claimed, go, completed))
+        first.start()
+        claimed.get(timeout=30)
+
+        # The first worker stalls past its lease and this process takes the job over
+        expire_claims(ipc)
+        task = ipc.claim_job()
+        go.set()
+        first_completed = completed.get(timeout=30)
+        first.join()
+
+        if task is None or task["task_id"] != task_id:
+            print(f"FAILURE: Expected to take over {task_id}, got {task}")
+        elif first_completed or ipc.get_result(task_id) is not None:
+            print("FAILURE: The worker that lost its lease still completed the task.")
+        elif not ipc.renew_lease(task_id):
+            print("FAILURE: The new owner's claim was released by the old owner.")
+        elif ipc.complete_task(task_id, {"status": "success", "by": "second worker"}) \
+                and ipc.get_result(task_id) == {"status": "success", "by": "second worker"}:
+            print("SUCCESS: Only the current owner completed the task.")
+        else:
+            print(f"FAILURE: Unexpected result {ipc.get_result(task_id)}")
+
+
+if __name__ == "__main__":
+    test_each_job_claimed_once()
+    test_expired_lease_is_requeued()
+    test_complete_after_lost_lease()
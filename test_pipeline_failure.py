@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import threading
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from backend import worker
+
+
+class MemoryCheckpoint:
+    def __init__(self):
+        self.items = {}
+
+    def done(self, key):
+        return key in self.items
+
+    def get(self, key):
+        return self.items[key]
+
+    def mark_done(self, key, value):
+        self.items[key] = value
+
+
+def test_pipeline_stage_failure():
+    print("Testing run_pipeline with a failing transcription stage...")
+
+    # More videos than the bounded queues hold, so the upstream stages are blocked on a full queue
+    df = pd.DataFrame({
+        'video_link': [f"https://youtu.be/v{i}" for i in range(10)],
+        'video_title': [f"video {i}" for i in range(10)],
+        'voice': ['test'] * 10,
+    })
+    scraper = MagicMock()
+    scraper.collect_metadata.return_value = df
+    scraper.download_video.side_effect = lambda index, row: f"v{index}"
+    splitter = MagicMock()
+    splitter.split_audio.side_effect = lambda filename: ([f"{filename}_v2_chunk_0"], [filename])
+    transcriber = MagicMock()
+
+    def transcribe_audio(path):
+        # Slow enough for the stages before it to fill their queues
+        time.sleep(1)
+        raise RuntimeError("transcription failed")
+
+    transcriber.transcribe_audio.side_effect = transcribe_audio
+
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = worker.run_pipeline("test-task", {"playlist_url": "https://youtube.com/playlist?list=test", "queue_size": 1}, MemoryCheckpoint())
+        except Exception as e:
+            outcome['error'] = e
+
+    with patch.object(worker, 'ipc'), \
+         patch.object(worker, 'YouTubeScraper', return_value=scraper, create=True), \
+         patch.object(worker, 'AudioSplitter', return_value=splitter, create=True), \
+         patch.object(worker, 'AudioTranscriber', return_value=transcriber, create=True), \
+         patch.object(worker, 'get_vad_model'), \
+         patch.object(worker, 'get_transcription_pipeline'), \
+         patch('pandas.DataFrame.to_csv'):
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(timeout=30)
+
+    if thread.is_alive():
+        print("FAILURE: run_pipeline hung after a stage failed.")
+    elif isinstance(outcome.get('error'), RuntimeError):
+        print(f"SUCCESS: run_pipeline raised the stage's error: {outcome['error']}")
+    else:
+        print(f"FAILURE: Expected the stage's error, got {outcome}")
+
+
+if __name__ == "__main__":
+    test_pipeline_stage_failure()
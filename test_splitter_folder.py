@@ -71,7 +71,8 @@ def test_folder_splitting():
         # Check if split files exist (might be empty if dummy audio is too simple/short/silence logic filters it)
         # Note: My dummy wav is a sine wave (non-silent), so it should be detected as one chunk or split if long enough.
         # Length is 3s. min_audio_len default is 2s. So it should likely preserve it.
-        split_files = list(output_audio_dir.glob("*.wav"))
+        # Chunks are written to <output>/<source>/<chunk>.wav
+        split_files = list(output_audio_dir.glob("*/*.wav"))
         print(f"Found {len(split_files)} split audio files.")
         if len(split_files) > 0:
             print("SUCCESS: Split audio files generated.")
@@ -0,0 +1,60 @@
+import os
+import sys
+import wave
+import tempfile
+from unittest.mock import MagicMock
+
+# Add project root to path
+sys.path.append(os.getcwd())
+
+from backend.core.checkpoint import TaskCheckpoint
+from backend.processors.audio_splitter import AudioSplitter
+
+
+def create_silent_wav(path):
+    with wave.open(path, 'w') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(16000)
+        wav_file.writeframes(b'\x00\x00' * 16000)
+
+
+def new_splitter(input_dir, output_dir):
+    return AudioSplitter(
+        input_audio_folder=input_dir,
+        output_splitted_audio_dir=os.path.join(output_dir, "splitted"),
+        output_csv_dir=output_dir,
+        vad_model=MagicMock(),
+        vad_cache_dir=os.path.join(output_dir, "_vad_cache")
+    )
+
+
+def test_failed_source_retried_on_resume():
+    print("Testing that a source that failed to decode is split again when the task resumes...")
+    with tempfile.TemporaryDirectory() as input_dir, tempfile.TemporaryDirectory() as output_dir:
+        for name in ("good", "flaky"):
+            create_silent_wav(os.path.join(input_dir, f"{name}.wav"))
+        checkpoint_path = os.path.join(output_dir, "checkpoint.jsonl")
+
+        # First run: "flaky" cannot be decoded (e.g. a transient ffmpeg failure)
+        splitter = new_splitter(input_dir, output_dir)
+        splitter.split_audio_batch = MagicMock(side_effect=lambda filenames: [
+            None if filename == "flaky" else ([f"{filename}_v2_chunk_0"], [filename]) for filename in filenames])
+        splitter.process_videos(checkpoint=TaskCheckpoint(checkpoint_path))
+
+        # Same task resumed: only "flaky" should be split again
+        splitter = new_splitter(input_dir, output_dir)
+        splitter.split_audio_batch = MagicMock(side_effect=lambda filenames: [
+            ([f"{filename}_v2_chunk_0"], [filename]) for filename in filenames])
+        checkpoint = TaskCheckpoint(checkpoint_path)
+        splitter.process_videos(checkpoint=checkpoint)
+
+        retried = [filename for call in splitter.split_audio_batch.call_args_list for filename in call.args[0]]
+        if retried == ["flaky"] and checkpoint.get("flaky") == {'chunks': ["flaky_v2_chunk_0"], 'originals': ["flaky"]}:
+            print("SUCCESS: The failed source was split by the resumed run, the finished one was not.")
+        else:
+            print(f"FAILURE: Resumed run split {retried}, checkpoint has {checkpoint.get('flaky')!r} for the failed source.")
+
+
+if __name__ == "__main__":
+    test_failed_source_retried_on_resume()